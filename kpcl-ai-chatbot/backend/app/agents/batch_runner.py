@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict
+from app.core.config import settings
+from app.agents.code_agent import run_data_agent
+from app.agents.llm_gate import LLMQueueFullError
+from app.models.response import BatchChatResponse, BatchItem, ChatResponse
+from app.services.code_cache import normalize_question
+from app.services.data_parser import get_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+def _failed(question: str, error: str) -> ChatResponse:
+    return ChatResponse(answer=f"Could not answer: {question}", confidence="Low", reasoning_path="Batch item failed", error=error)
+
+
+async def stream_batch(questions: list, user_id: str, include_timings: bool = False, max_concurrency: int = None):
+    """
+    Answers a list of independent questions, yielding ("item", BatchItem) as
+    each one finishes (duplicates of it in the same step) and a final
+    ("summary", timings). Questions that normalize to the same text run once;
+    the batch shares one dataset snapshot, and at most `max_concurrency`
+    questions are in the pipeline at a time (the LLM gate and the sandbox
+    pool still bound their own stages). Each item retrieves its own context
+    inside that limit, and only if it gets past the greeting, fast path and
+    code cache.
+    """
+    started = time.perf_counter()
+    max_concurrency = max_concurrency or settings.BATCH_MAX_CONCURRENCY
+
+    # 🧮 Identical / normalized-identical questions are answered once
+    groups = OrderedDict()
+    for index, question in enumerate(questions):
+        groups.setdefault(normalize_question(question), []).append(index)
+
+    snapshot = await asyncio.to_thread(get_snapshot)
+    snapshot_s = time.perf_counter() - started
+    unique = {key: questions[indexes[0]] for key, indexes in groups.items()}
+    logger.info(f"📚 Batch of {len(questions)} questions ({len(groups)} unique) on dataset version {snapshot.version}")
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def answer(key: str):
+        question = unique[key]
+        async with semaphore:
+            item_started = time.perf_counter()
+            try:
+                # Timings are always collected here for the batch summary, and dropped unless asked for
+                response = await run_data_agent(question, user_id, True, snapshot=snapshot)
+            except LLMQueueFullError as e:
+                response = _failed(question, str(e))
+                response.timings = {"path": "rejected"}
+            except Exception as e:
+                logger.error(f"❌ Batch item failed: {e}", exc_info=True)
+                response = _failed(question, str(e))
+            return key, response, time.perf_counter() - item_started
+
+    tasks = [asyncio.create_task(answer(key)) for key in groups]
+    paths = Counter()
+    item_seconds = []
+    retrievals, retrieval_ms = 0, 0.0
+    try:
+        for finished in asyncio.as_completed(tasks):
+            key, response, seconds = await finished
+            paths[(response.timings or {}).get("path", "failed")] += 1
+            item_seconds.append(seconds)
+            for span in (response.timings or {}).get("spans", []):
+                if span["stage"] == "retrieval":
+                    retrievals += 1
+                    retrieval_ms += span["ms"]
+            if not include_timings:
+                response.timings = None
+            first = groups[key][0]
+            for index in groups[key]:
+                yield "item", BatchItem(index=index, question=questions[index], duplicate_of=None if index == first else first, response=response)
+    finally:
+        # The consumer went away (client disconnect): stop whatever is still running
+        for task in tasks:
+            task.cancel()
+
+    total_s = time.perf_counter() - started
+    item_seconds.sort()
+    yield "summary", {
+        "questions": len(questions),
+        "unique": len(groups),
+        "duplicates": len(questions) - len(groups),
+        "dataset_version": snapshot.version,
+        "snapshot_ms": round(snapshot_s * 1000, 2),
+        "retrievals": retrievals,
+        "retrieval_ms": round(retrieval_ms, 2),
+        "total_ms": round(total_s * 1000, 2),
+        "item_p50_ms": round(item_seconds[len(item_seconds) // 2] * 1000, 2),
+        "item_max_ms": round(item_seconds[-1] * 1000, 2),
+        "questions_per_s": round(len(questions) / total_s, 2) if total_s else None,
+        "paths": dict(paths),
+        "max_concurrency": max_concurrency,
+    }
+
+
+async def run_batch(questions: list, user_id: str, include_timings: bool = False) -> BatchChatResponse:
+    """stream_batch collected into one response, items in request order (used by POST /chat/batch)."""
+    items, timings = [], {}
+    async for event, payload in stream_batch(questions, user_id, include_timings):
+        if event == "item":
+            items.append(payload)
+        else:
+            timings = payload
+    return BatchChatResponse(results=sorted(items, key=lambda item: item.index), timings=timings)
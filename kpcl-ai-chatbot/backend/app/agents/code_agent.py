@@ -1,35 +1,144 @@
+import asyncio
+import hashlib
 import logging
-import langchain
-import os
+import threading
+import time
+from datetime import datetime
 from app.core.config import settings
-from app.agents.prompts import SYSTEM_PLANNER_PROMPT
+from app.core.audit import audit_log
+from app.agents.llm_gate import llm_gate, LLMQueueFullError
+from app.agents.llm_providers import build_llm
+from app.agents.prompt_builder import build_prompt, prompt_stats
+from app.agents.intent_router import is_follow_up, new_entities, try_fast_path
 # 🚀 Import both the execution sandbox and the new Search-First node
-from app.services.data_parser import execute_agent_code, find_relevant_context
+from app.services.data_parser import execute_agent_code, find_relevant_context, get_snapshot, sandbox_schemas
+from app.services.code_validator import validate_code, repair_missing_column
+from app.services.code_cache import code_cache
+from app.services.chart_gen import chart_cache, compact_chart
+from app.services.session_store import SessionState, session_store
 from app.models.response import ChatResponse
+from app.core.metrics import RequestTrace, CHART_CACHE_LOOKUPS, CODE_CACHE_LOOKUPS, CODE_CHECKS, EXECUTIONS, GRAPH_BYTES, LLM_ATTEMPTS, LLM_CALLS, PROMPT_TOKENS, RESPONSE_CHARS
 
-# 🚀 Initializing Google Gemini Flash 2.5/3
-from langchain_google_genai import ChatGoogleGenerativeAI
+logger = logging.getLogger(__name__)
 
-# 🔦 Debug mode shows exactly what is sent to Gemini in your terminal
-langchain.debug = True
+# 🔌 Gemini (pooled REST client) with optional hedging / failover to a local Ollama model.
+# A blank GEMINI_API_KEY no longer stops the app from starting: model calls fail (or go to Ollama) instead.
+llm = build_llm()
 
-logger = logging.getLogger(__name__)
+async def run_data_agent(user_message: str, user_id: str, include_timings: bool = False, session_id: str = None,
+                         snapshot=None) -> ChatResponse:
+    """Runs the full pipeline and returns only the final answer (used by POST /chat and /chat/batch)."""
+    result = None
+    async for event, payload in stream_data_agent(user_message, user_id, include_timings, session_id, snapshot):
+        if event == "result":
+            result = payload
+    return result
+
+async def stream_data_agent(user_message: str, user_id: str, include_timings: bool = False, session_id: str = None,
+                            snapshot=None):
+    """
+    The agent pipeline as an async generator of (event, payload) pairs:
+    "retrieval", "code", "execution" for each stage, then a final "result"
+    carrying the ChatResponse (a code cache hit sends an empty "retrieval").
+    If the consumer goes away (client disconnect cancels the task, or the
+    generator is closed early) the in-flight model call is cancelled and a
+    pooled sandbox execution is killed; without the pool an execution
+    already running finishes in its thread, but none starts afterwards.
+    Stage timings always go to /metrics; with `include_timings` they are also
+    attached to the ChatResponse. With a `session_id`, follow-up questions
+    build on that session's previous answer. A batch passes in the
+    `snapshot` all its items share.
+    """
+    cancel_event = threading.Event()
+    trace = RequestTrace()
+    finished = False
+    response = None
+    try:
+        async for event, payload in _agent_pipeline(user_message, user_id, cancel_event, trace, session_id, snapshot):
+            finished = event == "result"
+            if finished:
+                response = payload
+                if include_timings:
+                    payload.timings = trace.summary()
+            yield event, payload
+    except LLMQueueFullError:
+        trace.finish("rejected")
+        finished = True
+        raise
+    except Exception as e:
+        # A real error, not a client that went away: it reaches the metrics and audit log as a failure
+        trace.finish("failed")
+        trace.audit["error"] = f"{type(e).__name__}: {e}"
+        finished = True
+        raise
+    finally:
+        if not finished:
+            logger.info("🛑 Client went away. Aborting in-flight work.")
+            trace.finish("cancelled")
+            cancel_event.set()
+        if settings.AUDIT_ENABLED:
+            _audit(trace, user_message, user_id, session_id, response)
+
+def _audit(trace: RequestTrace, user_message: str, user_id: str, session_id: str, response):
+    """Queues the request's audit record (the write happens on the audit thread)."""
+    summary = trace.summary()
+    audit_log.record({
+        "timestamp": datetime.now().isoformat(),
+        "user_id": user_id,
+        "session_id": session_id,
+        "prompt": user_message,
+        "generated_code": trace.audit.get("code"),
+        "prompt_hashes": trace.audit.get("prompt_hashes", []),
+        "outcome": summary.pop("path", "unknown"),
+        "error": response.error if response is not None else trace.audit.get("error"),
+        **summary,
+    })
+
+def _record_execution(trace: RequestTrace, result: dict, attempt: int):
+    """Adds the sandbox breakdown of one execution to the trace and the metrics."""
+    for stage, seconds in result.get("timings", {}).items():
+        trace.add(f"execute.{stage}", seconds, attempt=attempt)
+    EXECUTIONS.inc(status="error" if result.get("error") else "success")
 
-# 🚀 SAFETY CHECK: Ensure the key is loaded
-api_key = settings.GEMINI_API_KEY
-if not api_key:
-    raise ValueError("🚨 CRITICAL ERROR: The API key is blank! Check your .env file.")
-
-# 🚀 Initialize Gemini with a specific timeout to handle complex queries
-llm = ChatGoogleGenerativeAI(
-    model=settings.MODEL_NAME, 
-    google_api_key=api_key, 
-    temperature=0, 
-    max_retries=0,      # 🚀 SET TO 0: Stops Langchain's massive exponential backoffs
-    timeout=30          # 🚀 SET TO 30: Forces it to fail fast so our custom loop handles it
-)
-
-async def run_data_agent(user_message: str, user_id: str) -> ChatResponse:
+async def _execute(trace: RequestTrace, code: str, cancel_event: threading.Event, snapshot, attempt: int, working_rows=None) -> dict:
+    """
+    Runs generated code in the sandbox, or reuses the chart the same code rendered
+    on this dataset version (not for follow-ups: their `df_prev` varies per session).
+    """
+    cached = chart_cache.get(code, snapshot.fingerprint) if working_rows is None else None
+    if working_rows is None:
+        CHART_CACHE_LOOKUPS.inc(result="hit" if cached else "miss")
+    if cached is not None:
+        logger.info("🖼️ Chart cache hit. Skipping execution and plotting.")
+        trace.note("chart_cache", "hit")
+        result = cached
+    else:
+        with trace.span("execute", attempt=attempt):
+            result = await asyncio.to_thread(execute_agent_code, code, cancel_event, snapshot, working_rows)
+        _record_execution(trace, result, attempt)
+        if result.get("graph_json") and not result.get("error"):
+            # 📊 Downsample oversized traces and pack numeric arrays before the figure leaves the server
+            with trace.span("chart", attempt=attempt):
+                result["graph_json"], chart_info = await asyncio.to_thread(compact_chart, result["graph_json"])
+            trace.note("chart_bytes", {"raw": chart_info["bytes_before"], "sent": chart_info["bytes_after"]})
+            if working_rows is None:
+                chart_cache.put(code, snapshot.fingerprint, result)
+    if result.get("graph_json"):
+        GRAPH_BYTES.observe(len(result["graph_json"]))
+    return result
+
+def _remember(user_id: str, session_id: str, previous, question: str, code: str, result: dict, retrieval: dict, fingerprint: str):
+    """Stores this turn as the session's working set; a follow-up that did not filter further keeps the previous rows."""
+    if not session_id:
+        return
+    questions, rows = [question], result.get("working_rows")
+    if previous is not None:
+        questions = previous.questions + questions
+        rows = previous.rows if rows is None else rows
+    session_store.put(user_id, session_id, SessionState(questions, code, result.get("answer"), retrieval, rows, fingerprint))
+
+async def _agent_pipeline(user_message: str, user_id: str, cancel_event: threading.Event, trace: RequestTrace,
+                          session_id: str = None, snapshot=None):
     
     # 🚀 1. FAST GREETING BYPASS
     # Responds instantly to greetings without using API tokens or processing data
@@ -38,50 +147,141 @@ async def run_data_agent(user_message: str, user_id: str) -> ChatResponse:
     
     if clean_msg in greetings:
         logger.info("👋 Greeting triggered. Bypassing LLM for speed.")
-        return ChatResponse(
+        trace.finish("greeting")
+        yield "result", ChatResponse(
             answer="Hello! I am KBot, your KPCL Data and Diagnostic Assistant. I can help you analyze compressor data, calculate metrics, or troubleshoot problems. What can I do for you today?",
             confidence="High",
             reasoning_path="Direct Greeting Bypass"
         )
+        return
+
+    # 📦 One dataset snapshot for the whole request, even if a hot reload swaps in a newer one meanwhile
+    if snapshot is None:
+        with trace.span("data_load"):
+            snapshot = await asyncio.to_thread(get_snapshot)
+    trace.note("dataset_version", snapshot.version)
+    fingerprint = snapshot.fingerprint
+
+    # 💬 Follow-ups ("now only for 2024") start from the session's previous code and working set
+    session = session_store.get(user_id, session_id, fingerprint) if session_id else None
+    previous = session if session is not None and is_follow_up(user_message) else None
+    working_rows = previous.rows if previous is not None else None
+    trace.note("session", "follow_up" if previous is not None else "new")
+
+    # ⚡ 1b. AGGREGATE FAST PATH
+    # Simple rankings / counts / trends are answered from pre-computed cubes in milliseconds.
+    # Not for follow-ups: the cubes cover the whole dataset, not the previous answer's rows.
+    fast_response = None
+    if previous is None:
+        with trace.span("fast_path"):
+            fast_response = await asyncio.to_thread(try_fast_path, user_message, snapshot.aggregates)
+    if fast_response is not None:
+        _remember(user_id, session_id, None, user_message, "", {"answer": fast_response.answer}, {}, fingerprint)
+        trace.finish("fast_path")
+        yield "result", fast_response
+        return
+
+    # 🗃️ 1c. CODE CACHE
+    # Repeat questions (modulo wording noise) re-run previously successful code, no LLM round trip.
+    # Follow-ups are skipped: their wording only means something next to the previous answer.
+    if settings.CODE_CACHE_ENABLED and previous is None:
+        with trace.span("cache_lookup"):
+            cached_code = await asyncio.to_thread(code_cache.get, user_message, fingerprint)
+        trace.note("cache", "hit" if cached_code else "miss")
+        CODE_CACHE_LOOKUPS.inc(result="hit" if cached_code else "miss")
+        if cached_code:
+            logger.info("🗃️ Code cache hit. Re-executing stored code without calling Gemini.")
+            trace.audit["code"] = cached_code
+            # Same event sequence as a fresh answer; nothing was retrieved for it
+            yield "retrieval", {"query_type": None, "knowledge": [], "claims": [], "costs": [], "follow_up": False, "source": "cache"}
+            yield "code", {"attempt": 0, "source": "cache", "code": cached_code}
+            result = await _execute(trace, cached_code, cancel_event, snapshot, 0)
+            yield "execution", {"attempt": 0, "status": "error" if result.get("error") else "success", "error": result.get("error")}
+            if not result.get("error"):
+                _remember(user_id, session_id, None, user_message, cached_code, result, {}, fingerprint)
+                trace.finish("cache")
+                yield "result", ChatResponse(
+                    answer=result["answer"],
+                    confidence="High",
+                    graph_json=result.get("graph_json"),
+                    reasoning_path="Re-executed cached code for a previously answered question"
+                )
+                return
+            logger.warning(f"⚠️ Cached code failed ({result['error']}). Dropping it and asking Gemini.")
+            trace.note("cache", "stale")
+            await asyncio.to_thread(code_cache.discard, user_message, fingerprint)
 
     # 🚀 2. SEARCH-FIRST NODE (The Accuracy & Speed Engine)
     # Instead of sending 3,300 rows, we find only the 5-10 rows relevant to the user's query.
     # This handles "oil-leak", "oilleakage", and "Oil Leak" automatically via Python.
     logger.info(f"🔍 Search-First Node: Filtering data for query: {user_message}")
-    search_results = find_relevant_context(user_message)
-
-    # 🚀 3. CONTEXT INJECTION (Fixes 500 Error and Column Guesses)
-    # Safely retrieving the text-based cost string and exact dataframe columns
-    context_str = f"""
-    EXACT COLUMNS IN WARRANTY DATABASE (Use these for your Pandas code):
-    {search_results.get('df_columns', [])}
+    # CPU-bound pandas work runs in a worker thread so the event loop keeps serving other users
+    # A follow-up reuses the retrieval of the question it builds on, unless it names something new
+    # ("what about KCX6?"). Only questions that got this far pay for retrieval.
+    fresh_terms = new_entities(user_message, previous.questions) if previous is not None else []
+    if fresh_terms:
+        trace.note("follow_up_terms", fresh_terms)
+    if previous is not None and previous.retrieval and not fresh_terms:
+        search_results = previous.retrieval
+    else:
+        with trace.span("retrieval"):
+            search_results = await asyncio.to_thread(find_relevant_context, user_message, snapshot)
 
-    SEARCH RESULTS (Pre-filtered from Database):
-    - Relevant Diagnostic Knowledge: {search_results.get('filtered_kb', [])}
-    - Recent Related Warranty Claims: {search_results.get('filtered_warranty', [])}
-    
-    COMPLETE SPARE PART COST LIST (Text Format):
-    {search_results.get('cost_table_str', 'No cost data available.')}
-    """
-
-    # Combine the System Instructions, the Filtered Data, and the User Question
-    current_prompt = f"{SYSTEM_PLANNER_PROMPT}\n\n{context_str}\n\nUser Question: {user_message}\n\nPython Code:"
+    # 🚀 3. CONTEXT INJECTION (Token-Budgeted)
+    # Only the sections this kind of question needs, compacted to fit PROMPT_TOKEN_BUDGET;
+    # a follow-up sends the earlier questions and code instead of the retrieved rows
+    follow_up = None
+    if previous is not None:
+        follow_up = {"questions": previous.questions, "code": previous.code, "rows": len(working_rows) if working_rows is not None else None,
+                     "fresh_context": bool(fresh_terms)}
+    with trace.span("prompt_build"):
+        current_prompt, prompt_tokens, query_type = build_prompt(user_message, search_results, settings.PROMPT_TOKEN_BUDGET, follow_up=follow_up)
+    trace.note("query_type", query_type)
+    trace.note("prompt_tokens", [])
+    trace.note("response_chars", [])
+    yield "retrieval", {
+        "query_type": query_type,
+        "knowledge": search_results.get("filtered_kb", []),
+        "claims": search_results.get("filtered_warranty", []),
+        "costs": search_results.get("filtered_cost", []),
+        "follow_up": previous is not None,
+    }
     
     max_retries = 3
     last_error = ""
+    schemas = sandbox_schemas(snapshot)
+    if working_rows is not None:
+        schemas["df_prev"] = schemas["df"]
 
     # 🚀 4. AGENT EXECUTION LOOP (with Self-Correction)
     for attempt in range(max_retries):
-        logger.info(f"\n" + "="*50)
-        logger.info(f"🧠 Attempt {attempt + 1}: Asking Gemini to process filtered data...")
-        logger.info(f"="*50 + "\n")
+        logger.info(f"🧠 Attempt {attempt + 1}: asking the model to process the filtered data")
         
         try:
-            # Generate the Python code using Gemini
-            response = llm.invoke(current_prompt)
+            # Generate the Python code using Gemini (non-blocking, bounded by the LLM gate)
+            prompt_stats.record(query_type, prompt_tokens, attempt)
+            logger.info(f"🧾 Prompt: ~{prompt_tokens} tokens ({query_type} query, attempt {attempt + 1})")
+            trace.note("attempts", attempt + 1)
+            trace.info["prompt_tokens"].append(prompt_tokens)
+            PROMPT_TOKENS.observe(prompt_tokens, query_type=query_type)
+            trace.audit.setdefault("prompt_hashes", []).append(hashlib.sha1(current_prompt.encode("utf-8")).hexdigest()[:16])
+            queued_at = time.perf_counter()
+            async with llm_gate:
+                trace.add("llm_queue", time.perf_counter() - queued_at, attempt=attempt + 1)
+                try:
+                    with trace.span("llm", attempt=attempt + 1):
+                        response = await llm.ainvoke(current_prompt)
+                except Exception:
+                    LLM_CALLS.inc(outcome="error")
+                    raise
+            LLM_CALLS.inc(outcome="success")
             generated_code = response.content
+            trace.note("provider", getattr(response, "provider", None))
+            trace.info["response_chars"].append(len(generated_code))
+            RESPONSE_CHARS.observe(len(generated_code))
             
-            logger.info(f"\n📜 RAW CODE FROM AI:\n{generated_code}\n")
+            # Full code goes to the audit log; the console only gets it at DEBUG
+            logger.debug(f"📜 Raw code from the model:\n{generated_code}")
             
             # Clean Markdown formatting (e.g., ```python ... ```)
             if "```python" in generated_code:
@@ -89,35 +289,80 @@ async def run_data_agent(user_message: str, user_id: str) -> ChatResponse:
             elif "```" in generated_code:
                 generated_code = generated_code.split("```")[1].split("```")[0].strip()
 
-            logger.info("⚙️ Executing code in Python Sandbox...")
+            # 🩺 Static checks before exec: near-miss column names are fixed locally,
+            # unsafe or unfixable code goes straight back to Gemini without running
+            with trace.span("validate", attempt=attempt + 1):
+                check = validate_code(generated_code, schemas)
+            if check["repairs"]:
+                logger.info(f"🩹 Repaired generated code locally: {check['repairs']}")
+                generated_code = check["code"]
+                trace.info.setdefault("repairs", []).extend(check["repairs"])
+            CODE_CHECKS.inc(result="rejected" if check["error"] else "repaired" if check["repairs"] else "clean")
+            trace.audit["code"] = generated_code
+            yield "code", {"attempt": attempt + 1, "source": "llm", "code": generated_code, "repairs": check["repairs"]}
 
-            # Run the code against the dataframes in RAM
-            result = execute_agent_code(generated_code)
+            if check["error"]:
+                result = {"error": check["error"]}
+                yield "execution", {"attempt": attempt + 1, "status": "rejected", "error": check["error"]}
+            else:
+                logger.info("⚙️ Executing code in Python Sandbox...")
+
+                # Run the code against the dataframes in RAM
+                result = await _execute(trace, generated_code, cancel_event, snapshot, attempt + 1, working_rows)
+                yield "execution", {"attempt": attempt + 1, "status": "error" if result.get("error") else "success", "error": result.get("error")}
+
+                # 🩹 A KeyError on a near-miss column the static pass could not follow: fix and re-run once, no LLM call
+                repair = repair_missing_column(generated_code, result.get("error"), schemas) if result.get("error") else None
+                if repair is not None:
+                    logger.info(f"🩹 Re-running with a locally repaired column name: {repair['repairs']}")
+                    generated_code = repair["code"]
+                    trace.info.setdefault("repairs", []).extend(repair["repairs"])
+                    CODE_CHECKS.inc(result="repaired_after_exec")
+                    trace.audit["code"] = generated_code
+                    yield "code", {"attempt": attempt + 1, "source": "repair", "code": generated_code, "repairs": repair["repairs"]}
+                    result = await _execute(trace, generated_code, cancel_event, snapshot, attempt + 1, working_rows)
+                    yield "execution", {"attempt": attempt + 1, "status": "error" if result.get("error") else "success", "error": result.get("error")}
 
             # If successful, return the formatted answer!
             if not result.get("error"):
                 logger.info("✅ Success!")
-                return ChatResponse(
+                if settings.CODE_CACHE_ENABLED and previous is None:
+                    await asyncio.to_thread(code_cache.put, user_message, fingerprint, generated_code)
+                _remember(user_id, session_id, previous, user_message, generated_code, result, search_results, fingerprint)
+                LLM_ATTEMPTS.observe(attempt + 1)
+                trace.finish("llm")
+                yield "result", ChatResponse(
                     answer=result["answer"],
                     confidence="High" if attempt == 0 else "Medium (Self-Corrected)",
                     graph_json=result.get("graph_json"),
                     reasoning_path=f"Successful search-led execution on attempt {attempt + 1}"
                 )
+                return
             
             # If code execution failed, provide the error back to Gemini to fix it
             last_error = result["error"]
             logger.warning(f"⚠️ Attempt {attempt + 1} failed: {last_error}. Retrying...")
-            current_prompt += f"\n\nPrevious Code: {generated_code}\nError: {last_error}\nPlease fix the logic and try again. Python Code:"
+            # Only the latest failure goes back to the model, not the whole retry history
+            with trace.span("prompt_build", attempt=attempt + 2):
+                current_prompt, prompt_tokens, query_type = build_prompt(
+                    user_message, search_results, settings.PROMPT_TOKEN_BUDGET, retry=(generated_code, last_error), follow_up=follow_up
+                )
 
+        except LLMQueueFullError:
+            # Backpressure: surface as HTTP 429 instead of a fake "failed" answer
+            raise
         except Exception as e:
             logger.error(f"❌ Critical Agent Failure: {e}")
+            last_error = str(e)
             break
 
     # 🚀 5. FAIL-SAFE
     logger.error("🚨 All attempts failed.")
-    return ChatResponse(
+    LLM_ATTEMPTS.observe(trace.info.get("attempts", 0))
+    trace.finish("failed")
+    yield "result", ChatResponse(
         answer="I successfully identified the records but had trouble calculating the final summary. Please try rephrasing your question.",
         confidence="Low",
         reasoning_path=f"Failed after {max_retries} attempts.",
         error=last_error
-    )
\ No newline at end of file
+    )
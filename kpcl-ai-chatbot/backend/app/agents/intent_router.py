@@ -0,0 +1,275 @@
+import logging
+import re
+from app.models.response import ChatResponse
+from app.services.aggregates import MEASURES
+from app.services.chart_gen import compact_chart
+from app.services.search_index import extract_keywords
+
+logger = logging.getLogger(__name__)
+
+# Phrases that name a cube dimension (longest phrases are matched first)
+DIMENSION_ALIASES = {
+    "Dealer Name": ["dealer name", "dealer names", "dealers", "dealer"],
+    "Nature of complaint": ["nature of complaint", "nature of complaints", "complaint types", "complaint type", "complaint categories", "complaint category"],
+    "Model": ["compressor model", "compressor models", "model types", "model", "models"],
+    "Customer Name": ["customer name", "customer names", "customers", "customer"],
+}
+PERIOD_ALIASES = {
+    "year": ["per year", "by year", "each year", "every year", "yearly", "year wise", "year on year", "annually", "over the years"],
+    "month": ["per month", "by month", "each month", "every month", "monthly", "month wise", "over time"],
+}
+
+CHART_WORDS = {"plot", "chart", "graph", "visualize", "visualise", "draw", "bar", "line", "pie", "horizontal", "vertical", "showing"}
+DESC_WORDS = {"highest", "most", "top", "max", "maximum", "largest", "biggest", "greatest"}
+ASC_WORDS = {"lowest", "least", "fewest", "bottom", "min", "minimum", "smallest"}
+UNIQUE_WORDS = {"unique", "distinct", "different"}
+RUNHRS_WORDS = {"runhrs", "runhr", "runhours", "run", "running", "hours", "hrs"}
+AVG_WORDS = {"average", "avg", "mean"}
+COUNT_WORDS = {"complaints", "complaint", "claims", "claim", "count", "number", "frequent", "frequently", "times", "appears", "appear", "occurrences", "entries", "logged", "records", "rows", "cases"}
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10, "fifteen": 15, "twenty": 20}
+FILLER_WORDS = {
+    "which", "what", "who", "is", "are", "was", "were", "the", "a", "an", "has", "have", "had", "with", "of", "by",
+    "in", "on", "for", "show", "me", "give", "list", "tell", "find", "get", "display", "do", "does", "we", "our",
+    "how", "many", "much", "total", "sum", "overall", "and", "their", "its", "column", "columns", "values", "value",
+    "types", "type", "this", "dataset", "data", "database", "across", "all", "compressor", "compressors", "based",
+    "please", "can", "you", "i", "see", "s", "wise", "ranked", "rank", "ranking", "according", "to", "there",
+}
+
+# 💬 Follow-up cues. A follow-up either points back at the previous answer ("plot that", "how many of those")
+# or is a fragment leaning on it ("and top 5 dealers", "now only for 2024") with no question of its own.
+FOLLOW_UP_OPENERS = [
+    "now", "and", "but", "only", "just", "also", "then", "instead", "same", "plus", "excluding", "except",
+    "without", "filter", "by", "per", "for", "in",
+]
+QUESTION_WORDS = {"which", "what", "who", "whom", "whose", "how", "when", "where", "why"}
+_REFERENCE_RE = re.compile(
+    r"\b(previous|above|earlier|again|instead)\b"
+    r"|^(what|how) about\b"
+    r"|\bthe same\b"
+    r"|^(that|those|these|them|it)\b"
+    r"|\b(of|from|among|within|in) (that|those|these|them)\b"
+    r"|\b(plot|chart|graph|show|split|break|sort|rank|filter|group|narrow|limit|compare|draw|redo|repeat|display|turn|make) (that|those|these|them|it)\b"
+)
+MAX_FOLLOW_UP_WORDS = 12
+# Words a follow-up uses to refine the previous answer; anything else it names is new and needs fresh retrieval
+FOLLOW_UP_WORDS = {"now", "only", "just", "also", "then", "instead", "same", "plus", "excluding", "except", "without",
+                   "filter", "per", "about", "ones", "one", "them", "those", "these", "that", "it", "again", "split",
+                   "break", "down", "sort", "narrow", "limit", "compare", "redo", "repeat", "previous", "above",
+                   "earlier", "last", "first", "year", "years", "month", "months", "from", "between", "after", "before"}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _tokens(text: str) -> list:
+    return _TOKEN_RE.findall(text.lower().replace("'", "").replace('"', ""))
+
+
+def _consume(tokens: list, aliases: dict):
+    """Finds the first alias phrase in `tokens`; returns (key, remaining tokens)."""
+    phrases = sorted(((key, alias.split()) for key, names in aliases.items() for alias in names), key=lambda p: -len(p[1]))
+    for key, words in phrases:
+        for i in range(len(tokens) - len(words) + 1):
+            if tokens[i:i + len(words)] == words:
+                return key, tokens[:i] + tokens[i + len(words):]
+    return None, tokens
+
+
+def parse_intent(question: str):
+    """
+    Maps a question onto a cube query, or returns None when not confident.
+
+    Confidence is strict on purpose: every word must be understood (a known
+    dimension, measure, ranking, chart or filler word). Anything else, such
+    as a filter value like "for Trade Links" or "in 2024", falls through to
+    the LLM agent.
+    """
+    tokens = _tokens(question)
+    if not tokens:
+        return None
+
+    period, tokens = _consume(tokens, PERIOD_ALIASES)
+    dimension, tokens = _consume(tokens, DIMENSION_ALIASES)
+
+    n = None
+    leftover = []
+    for i, token in enumerate(tokens):
+        previous = tokens[i - 1] if i else ""
+        if token.isdigit() or token in NUMBER_WORDS:
+            value = int(token) if token.isdigit() else NUMBER_WORDS[token]
+            if previous in DESC_WORDS | ASC_WORDS and 0 < value <= 50 and n is None:
+                n = value
+                continue
+            return None
+        known = CHART_WORDS | DESC_WORDS | ASC_WORDS | UNIQUE_WORDS | RUNHRS_WORDS | AVG_WORDS | COUNT_WORDS | FILLER_WORDS
+        if token not in known:
+            leftover.append(token)
+    if leftover:
+        return None
+
+    words = set(tokens)
+    if words & DESC_WORDS and words & ASC_WORDS:
+        # "most and least": two rankings in one question, not one cube lookup
+        return None
+    if words & {"runhrs", "runhr", "runhours", "hrs"} or {"run", "hours"} <= words or {"running", "hours"} <= words:
+        measure = "runhrs_avg" if words & AVG_WORDS else "runhrs_total"
+    elif words & RUNHRS_WORDS:
+        # "hours logged", "the maximum run": about run hours, but not clearly which measure
+        return None
+    elif words & AVG_WORDS:
+        return None
+    else:
+        measure = "claims"
+
+    chart = bool(words & {"plot", "chart", "graph", "visualize", "visualise", "draw"})
+    chart_kind = "line" if "line" in words else "pie" if "pie" in words else "bar"
+
+    if period and not dimension:
+        return {"kind": "period", "period": period, "measure": measure, "chart": chart, "chart_kind": chart_kind}
+
+    if dimension and not period:
+        if words & UNIQUE_WORDS and ("many" in words or "number" in words or "count" in words):
+            return {"kind": "unique", "dimension": dimension}
+        ascending = bool(words & ASC_WORDS)
+        if words & (DESC_WORDS | ASC_WORDS) or n or chart:
+            return {
+                "kind": "top",
+                "dimension": dimension,
+                "measure": measure,
+                "n": n or (10 if chart else 1),
+                "ascending": ascending,
+                "chart": chart,
+                "chart_kind": chart_kind,
+                "horizontal": "horizontal" in words,
+            }
+    return None
+
+
+def _fmt(value, measure: str) -> str:
+    if measure == "claims":
+        return f"{int(value):,}"
+    return f"{value:,.1f}"
+
+
+def _chart_json(labels, values, measure: str, title: str, kind: str, horizontal: bool = False) -> str:
+    import plotly.express as px
+
+    label_name, value_name = "Category", MEASURES[measure]
+    data = {label_name: [str(l).strip() for l in labels], value_name: list(values)}
+    if kind == "line":
+        fig = px.line(data, x=label_name, y=value_name, markers=True, title=title, template='plotly_white')
+    elif kind == "pie":
+        fig = px.pie(data, names=label_name, values=value_name, title=title, template='plotly_white')
+    elif horizontal:
+        fig = px.bar(data, x=value_name, y=label_name, orientation='h', title=title, template='plotly_white')
+        fig.update_layout(yaxis={"autorange": "reversed"})
+    else:
+        fig = px.bar(data, x=label_name, y=value_name, title=title, template='plotly_white')
+    return compact_chart(fig.to_json())[0]
+
+
+def answer_intent(intent: dict, engine) -> ChatResponse:
+    """Answers a parsed intent straight from the pre-computed cubes."""
+    if intent["kind"] == "unique":
+        dim = intent["dimension"]
+        if not engine.has_dimension(dim):
+            return None
+        return ChatResponse(
+            answer=f"There are **{engine.unique_counts[dim]:,}** unique values of **{dim}** in the warranty data.",
+            confidence="High",
+            reasoning_path=f"Fast path: unique count of '{dim}' from pre-computed aggregates",
+        )
+
+    if intent["kind"] == "period":
+        if intent["period"] not in engine.periods:
+            return None
+        series = engine.by_period(intent["period"], intent["measure"])
+        label = MEASURES[intent["measure"]]
+        final_answer = f"**{label.capitalize()} per {intent['period']}:**\n\n"
+        for period, value in series.items():
+            final_answer += f"* **{period}**: {_fmt(value, intent['measure'])}\n"
+        graph_json = None
+        if intent["chart"]:
+            kind = "bar" if intent["chart_kind"] == "bar" else "line"
+            graph_json = _chart_json(series.index, series.values, intent["measure"], f"{label.capitalize()} per {intent['period']}", kind)
+            final_answer = f"Here is the chart showing the {label} per {intent['period']}."
+        return ChatResponse(
+            answer=final_answer,
+            confidence="High",
+            graph_json=graph_json,
+            reasoning_path=f"Fast path: {intent['measure']} per {intent['period']} from pre-computed aggregates",
+        )
+
+    dim, measure, n = intent["dimension"], intent["measure"], intent["n"]
+    if not engine.has_dimension(dim):
+        return None
+    series = engine.top(dim, measure, n, ascending=intent["ascending"])
+    if series.empty:
+        return None
+    label = MEASURES[measure]
+    rank_word = "lowest" if intent["ascending"] else "highest"
+
+    if intent["chart"]:
+        title = f"{'Bottom' if intent['ascending'] else 'Top'} {len(series)} {dim} by {label}"
+        graph_json = _chart_json(series.index, series.values, measure, title, intent["chart_kind"], intent["horizontal"])
+        return ChatResponse(
+            answer=f"Here is the chart showing the {title[0].lower() + title[1:]}.",
+            confidence="High",
+            graph_json=graph_json,
+            reasoning_path=f"Fast path: ranked '{dim}' by {measure} from pre-computed aggregates",
+        )
+
+    if n == 1:
+        final_answer = f"The **{dim}** with the {rank_word} {label} is **{str(series.index[0]).strip()}** ({_fmt(series.iloc[0], measure)})."
+    else:
+        final_answer = f"The {len(series)} **{dim}** values with the {rank_word} {label} are:\n\n"
+        for key, value in series.items():
+            final_answer += f"* **{str(key).strip()}**: {_fmt(value, measure)}\n"
+    return ChatResponse(
+        answer=final_answer,
+        confidence="High",
+        reasoning_path=f"Fast path: ranked '{dim}' by {measure} from pre-computed aggregates",
+    )
+
+
+def is_follow_up(question: str) -> bool:
+    """
+    True for short questions that build on the previous answer: ones that
+    point back at it ("plot that by dealer", "how many of those are open?",
+    "what about KCX6?") and fragments that start with a conjunction and ask
+    nothing of their own ("and top 5 dealers", "now only for 2024").
+    "In 2024 which dealer had the most claims?" is a new question.
+    """
+    tokens = _tokens(question)
+    if not tokens or len(tokens) > MAX_FOLLOW_UP_WORDS:
+        return False
+    text = " ".join(tokens)
+    if _REFERENCE_RE.search(text):
+        return True
+    return tokens[0] in FOLLOW_UP_OPENERS and not QUESTION_WORDS & set(tokens)
+
+
+def new_entities(question: str, earlier_questions: list) -> list:
+    """
+    Terms a follow-up names that none of the earlier questions did ("what
+    about KCX6?"): the retrieval of the question it builds on doesn't cover them.
+    """
+    known = set(FOLLOW_UP_WORDS) | CHART_WORDS | DESC_WORDS | ASC_WORDS | UNIQUE_WORDS | RUNHRS_WORDS | AVG_WORDS | COUNT_WORDS | FILLER_WORDS
+    known |= {word for aliases in (DIMENSION_ALIASES, PERIOD_ALIASES) for names in aliases.values() for name in names for word in name.split()}
+    for earlier in earlier_questions:
+        known.update(extract_keywords(earlier))
+    return [k for k in extract_keywords(question) if k not in known and not k.isdigit() and k not in NUMBER_WORDS]
+
+
+def try_fast_path(question: str, engine):
+    """Returns a ChatResponse for questions the cubes can answer, else None."""
+    intent = parse_intent(question)
+    if intent is None:
+        return None
+    try:
+        response = answer_intent(intent, engine)
+    except Exception as e:
+        logger.warning(f"⚠️ Fast path failed for {intent}: {e}. Falling back to the agent.")
+        return None
+    if response is not None:
+        logger.info(f"⚡ Fast path answered {intent['kind']} intent without the LLM.")
+    return response
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LLMQueueFullError(Exception):
+    """Raised when the upstream model queue is saturated; the API maps it to HTTP 429."""
+
+    def __init__(self, message: str, retry_after: int = 5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMGate:
+    """
+    Bounded concurrency for upstream model calls.
+
+    At most `max_concurrency` calls run at once, at most `max_queue` callers
+    wait behind them, and nobody waits longer than `queue_timeout` seconds.
+    Anything beyond that is rejected straight away instead of piling up.
+
+        async with llm_gate:
+            response = await llm.ainvoke(prompt)
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = None
+        self._loop = None
+        self._waiting = 0
+        self._active = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop, not the import-time one
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "active": self._active,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+        }
+
+    async def __aenter__(self):
+        semaphore = self._get_semaphore()
+
+        if not semaphore.locked():
+            # Free slot: acquire() returns without suspending
+            await semaphore.acquire()
+        else:
+            if self._waiting >= self.max_queue:
+                logger.warning(f"🚦 LLM queue full ({self._waiting} waiting). Rejecting request.")
+                raise LLMQueueFullError("The AI model is busy right now. Please retry in a few seconds.")
+
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"🚦 Waited {self.queue_timeout}s for an LLM slot. Rejecting request.")
+                raise LLMQueueFullError("The AI model is busy right now. Please retry in a few seconds.")
+            finally:
+                self._waiting -= 1
+
+        self._active += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._active -= 1
+        self._get_semaphore().release()
+        return False
+
+
+llm_gate = LLMGate(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    max_queue=settings.LLM_MAX_QUEUE,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT,
+)
@@ -0,0 +1,286 @@
+import abc
+import asyncio
+import logging
+import time
+from types import SimpleNamespace
+import httpx
+from app.core.config import settings
+from app.core.metrics import LLM_HEDGES, LLM_PROVIDER_CALLS
+
+logger = logging.getLogger(__name__)
+
+
+class LLMProviderError(Exception):
+    """No provider produced a usable response (upstream errors, timeouts, or every circuit open)."""
+
+
+class LLMRequestRejected(LLMProviderError):
+    """The provider answered but refused this prompt (a 4xx, a safety block, no text): not a sign it is down."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a provider after `failure_threshold` consecutive failures.
+    After `reset_seconds` one trial call is let through (half-open): success
+    closes the circuit again, failure re-opens it for another period.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._trial:
+                logger.warning(f"🔌 Circuit opened after {self.failures} consecutive failures.")
+            self.opened_at = time.monotonic()
+        self._trial = False
+
+    def release(self):
+        """A call that was cancelled (lost a hedge race) says nothing about the provider's health."""
+        self._trial = False
+
+
+class HTTPProvider(abc.ABC):
+    """
+    One upstream model behind a pooled, keep-alive httpx client with its own
+    timeout and circuit breaker. Subclasses build the request and parse the
+    response; `generate(prompt)` returns the text. Only outages count
+    toward the breaker: timeouts, transport errors, 5xx and 429.
+    """
+
+    name = "http"
+
+    def __init__(self, base_url: str, model: str, timeout: float, breaker: CircuitBreaker, max_connections: int = 20):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.breaker = breaker
+        self.max_connections = max_connections
+        self._client = None
+        self._loop = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.base_url and self.model)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Bound to the running event loop (connections can't cross loops), reused for every call on it
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=min(5.0, self.timeout)),
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            )
+            self._loop = loop
+        return self._client
+
+    @abc.abstractmethod
+    def _request(self, prompt: str):
+        """(url, json body, headers) for one completion."""
+
+    @abc.abstractmethod
+    def _parse(self, data: dict) -> str:
+        """The completion text of a successful response."""
+
+    async def generate(self, prompt: str) -> str:
+        url, body, headers = self._request(prompt)
+        start = time.perf_counter()
+        try:
+            response = await self._get_client().post(url, json=body, headers=headers)
+            if 400 <= response.status_code < 500 and response.status_code != 429:
+                raise LLMRequestRejected(f"{self.name} rejected the request: HTTP {response.status_code} {response.text[:200]}")
+            response.raise_for_status()
+            text = self._parse(response.json())
+            if not text or not text.strip():
+                raise LLMRequestRejected(f"{self.name} returned an empty response")
+        except asyncio.CancelledError:
+            self.breaker.release()
+            LLM_PROVIDER_CALLS.inc(provider=self.name, outcome="cancelled")
+            raise
+        except LLMRequestRejected as e:
+            # The provider is up and answering: this prompt just won't work, here or on a retry
+            self.breaker.record_success()
+            LLM_PROVIDER_CALLS.inc(provider=self.name, outcome="rejected")
+            logger.warning(f"⚠️ {e}")
+            raise
+        except Exception as e:
+            self.breaker.record_failure()
+            outcome = "timeout" if isinstance(e, httpx.TimeoutException) else "error"
+            LLM_PROVIDER_CALLS.inc(provider=self.name, outcome=outcome)
+            logger.warning(f"⚠️ {self.name} call failed after {time.perf_counter() - start:.2f}s ({outcome}): {e}")
+            raise LLMProviderError(f"{self.name}: {e}") from e
+        self.breaker.record_success()
+        LLM_PROVIDER_CALLS.inc(provider=self.name, outcome="success")
+        return text
+
+    async def aclose(self):
+        if self._client is not None:
+            try:
+                await self._client.aclose()
+            except RuntimeError:
+                pass  # its event loop is already gone
+            self._client = None
+
+
+class GeminiProvider(HTTPProvider):
+    """Google Gemini over the generateContent REST endpoint."""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str, **kwargs):
+        super().__init__(**kwargs)
+        self.api_key = api_key
+
+    @property
+    def configured(self) -> bool:
+        return super().configured and bool(self.api_key)
+
+    def _request(self, prompt: str):
+        return (
+            f"{self.base_url}/v1beta/models/{self.model}:generateContent",
+            {"contents": [{"role": "user", "parts": [{"text": prompt}]}], "generationConfig": {"temperature": 0}},
+            {"x-goog-api-key": self.api_key},
+        )
+
+    def _parse(self, data: dict) -> str:
+        candidates = data.get("candidates") or []
+        if not candidates:
+            raise LLMRequestRejected(f"gemini returned no candidates ({data.get('promptFeedback', {}).get('blockReason', 'no reason given')})")
+        parts = (candidates[0].get("content") or {}).get("parts") or []
+        return "".join(part.get("text", "") for part in parts)
+
+
+class OllamaProvider(HTTPProvider):
+    """A local Ollama model (POST /api/generate, non-streaming)."""
+
+    name = "ollama"
+
+    def _request(self, prompt: str):
+        return (
+            f"{self.base_url}/api/generate",
+            {"model": self.model, "prompt": prompt, "stream": False, "options": {"temperature": 0}},
+            {},
+        )
+
+    def _parse(self, data: dict) -> str:
+        return data.get("response", "")
+
+
+class HedgedLLM:
+    """
+    Drop-in for the chat model (`await llm.ainvoke(prompt)` -> `.content`).
+
+    The primary provider is asked first. If it has not answered after
+    `hedge_after` seconds, the same prompt also goes to the fallback and the
+    first usable answer wins (the other call is cancelled). A primary
+    failure, or an open primary circuit, goes to the fallback straight away.
+    `hedge_after=0` means fallback on failure only, never a hedge.
+    """
+
+    def __init__(self, primary: HTTPProvider, fallback: HTTPProvider = None, hedge_after: float = 0.0):
+        self.primary = primary
+        self.fallback = fallback
+        self.hedge_after = hedge_after
+
+    @property
+    def providers(self) -> list:
+        return [p for p in (self.primary, self.fallback) if p is not None and p.configured]
+
+    def stats(self) -> dict:
+        return {p.name: p.breaker.state for p in self.providers}
+
+    async def ainvoke(self, prompt: str):
+        if settings.LLM_DEBUG:
+            logger.info(f"🔦 Prompt:\n{prompt}")
+        text, provider = await self._generate(prompt)
+        if settings.LLM_DEBUG:
+            logger.info(f"🔦 Response from {provider}:\n{text}")
+        return SimpleNamespace(content=text, provider=provider)
+
+    async def _generate(self, prompt: str):
+        providers = self.providers
+        if not providers:
+            raise LLMProviderError("No model provider is configured: set GEMINI_API_KEY or enable the Ollama fallback.")
+        primary = self.primary if self.primary in providers else None
+        fallback = self.fallback if self.fallback in providers else None
+        running, errors = {}, []
+
+        def launch(provider) -> bool:
+            if not provider.breaker.allow():
+                errors.append(f"{provider.name}: circuit open")
+                return False
+            running[asyncio.create_task(provider.generate(prompt))] = provider
+            return True
+
+        try:
+            if primary is not None:
+                launch(primary)
+            fallback_started = fallback is None
+            started = time.perf_counter()
+            while True:
+                elapsed = time.perf_counter() - started
+                if not fallback_started and (not running or 0 < self.hedge_after <= elapsed):
+                    fallback_started = True
+                    hedging = bool(running)
+                    if launch(fallback) and hedging:
+                        LLM_HEDGES.inc()
+                        logger.info(f"🏁 {primary.name} slower than {self.hedge_after:g}s; hedging with {fallback.name}.")
+                if not running:
+                    break
+                timeout = self.hedge_after - elapsed if not fallback_started and self.hedge_after > 0 else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    provider = running.pop(task)
+                    try:
+                        return task.result(), provider.name
+                    except LLMProviderError as e:
+                        errors.append(str(e))
+        finally:
+            # Loser of a hedge race, or the caller went away
+            for task in running:
+                task.cancel()
+        raise LLMProviderError("; ".join(errors))
+
+
+def build_llm() -> HedgedLLM:
+    """The configured providers: Gemini first, the local Ollama model as hedge / failover when enabled."""
+    primary = GeminiProvider(
+        api_key=settings.GEMINI_API_KEY, base_url=settings.GEMINI_BASE_URL, model=settings.MODEL_NAME,
+        timeout=settings.LLM_TIMEOUT_SECONDS, max_connections=settings.LLM_MAX_CONNECTIONS,
+        breaker=CircuitBreaker(settings.LLM_BREAKER_FAILURES, settings.LLM_BREAKER_RESET_SECONDS),
+    )
+    fallback = None
+    if settings.OLLAMA_ENABLED:
+        fallback = OllamaProvider(
+            base_url=settings.OLLAMA_BASE_URL, model=settings.OLLAMA_MODEL,
+            timeout=settings.OLLAMA_TIMEOUT_SECONDS, max_connections=settings.LLM_MAX_CONNECTIONS,
+            breaker=CircuitBreaker(settings.LLM_BREAKER_FAILURES, settings.LLM_BREAKER_RESET_SECONDS),
+        )
+    if not primary.configured:
+        logger.warning("⚠️ GEMINI_API_KEY is blank." + (" Using the local Ollama model only." if fallback else " Model calls will fail until it is set."))
+    return HedgedLLM(primary, fallback, settings.LLM_HEDGE_AFTER_SECONDS)
@@ -0,0 +1,166 @@
+import logging
+import re
+import threading
+from collections import Counter
+from app.agents.prompts import SYSTEM_PLANNER_PROMPT
+
+logger = logging.getLogger(__name__)
+
+# Rough size of a Gemini token for mixed English / numbers; good enough for budgeting
+CHARS_PER_TOKEN = 4
+MAX_FIELD_CHARS = 300
+MAX_RETRY_CODE_CHARS = 1500
+MAX_RETRY_ERROR_CHARS = 400
+MAX_FOLLOW_UP_CODE_CHARS = 1200
+
+_GRAPH_RE = re.compile(r"\b(plot|chart|graph|visuali[sz]e|histogram|pie|bar|trend|draw)\b")
+_COST_RE = re.compile(r"\b(cost|costs|price|prices|priced|value|expense|expenses|spend|spent|amount|rupees?|inr)\b|₹")
+_DIAGNOSTIC_RE = re.compile(r"\b(cause|causes|why|reason|reasons|diagnos\w*|troubleshoot\w*|fix|symptoms?|issues?|problems?|failures?)\b")
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def classify_query(question: str) -> str:
+    """
+    Coarse query type used to decide which context the model needs:
+    'cost' > 'graph' > 'diagnostic' > 'analytics'.
+    """
+    text = question.lower()
+    if _COST_RE.search(text):
+        return "cost"
+    if _GRAPH_RE.search(text):
+        return "graph"
+    if _DIAGNOSTIC_RE.search(text):
+        return "diagnostic"
+    return "analytics"
+
+
+# Follow-ups reuse the previous code instead of re-sending retrieved rows; only cost item names still help
+FOLLOW_UP_SECTIONS = {"resolved", "costs"}
+
+# Which context sections each query type gets, most important first.
+# When over budget, rows are trimmed from the last section upwards.
+SECTIONS_BY_TYPE = {
+    "cost": ["resolved", "costs", "claims", "kb"],
+    "diagnostic": ["kb", "claims"],
+    "graph": ["claims"],
+    "analytics": ["claims"],
+}
+
+SECTION_TITLES = {
+    "kb": "Relevant Diagnostic Knowledge (Problem category | Probable Causes)",
+    "claims": "Related Warranty Claims (Nature of complaint | Spares / Part Replaced)",
+    "costs": "RELEVANT SPARE PART COSTS from `df_cost` (ITEM DESCRIPTION | UNIT PRICE | GROSS VALUE)",
+    "resolved": "PARTS IN THESE CLAIMS, ALREADY MATCHED TO COST ITEMS in `df_part_cost` (PART | ITEM DESCRIPTION | GROSS VALUE)",
+}
+
+
+def _clip(value, limit: int = MAX_FIELD_CHARS) -> str:
+    text = " ".join(str(value).split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+def _rows_to_lines(records: list) -> list:
+    """One compact line per distinct record; repeated records collapse into a count."""
+    counts = Counter(" | ".join(_clip(v) for v in record.values()) for record in records)
+    return [f"- {line}" + (f" (x{n})" if n > 1 else "") for line, n in counts.items()]
+
+
+def _render_follow_up(follow_up: dict) -> str:
+    earlier = "\n".join(f"- {_clip(q)}" for q in follow_up["questions"])
+    text = f"THIS IS A FOLLOW-UP. Earlier questions in this conversation:\n{earlier}"
+    code = (follow_up.get("code") or "").strip()
+    if code:
+        # Line breaks kept: the model is expected to edit this code, not just read it
+        code = code if len(code) <= MAX_FOLLOW_UP_CODE_CHARS else code[:MAX_FOLLOW_UP_CODE_CHARS - 3] + "..."
+        text += f"\nCode that answered the last one:\n{code}"
+    if follow_up.get("rows") is not None:
+        text += (
+            f"\n`df_prev` holds the {follow_up['rows']} rows of `df` that code worked on (same columns as `df`). "
+            "Start from `df_prev` when the question narrows or re-plots the previous result; use `df` if it asks about something new."
+        )
+    return text
+
+
+def _render(columns: list, sections: dict, order: list, question: str, retry, follow_up=None) -> str:
+    parts = [SYSTEM_PLANNER_PROMPT, f"EXACT COLUMNS IN WARRANTY DATABASE `df` (Use these for your Pandas code):\n{', '.join(columns)}"]
+    for name in order:
+        lines = sections.get(name) or []
+        if lines:
+            parts.append(f"{SECTION_TITLES[name]}:\n" + "\n".join(lines))
+    if follow_up:
+        parts.append(_render_follow_up(follow_up))
+    parts.append(f"User Question: {question}")
+    if retry:
+        code, error = retry
+        parts.append(
+            f"Your previous code failed.\nPrevious Code:\n{_clip(code, MAX_RETRY_CODE_CHARS)}\n"
+            f"Error: {_clip(error, MAX_RETRY_ERROR_CHARS)}\nPlease fix the logic and try again."
+        )
+    parts.append("Python Code:")
+    return "\n\n".join(parts)
+
+
+def build_prompt(question: str, search_results: dict, budget: int, retry=None, follow_up: dict = None):
+    """
+    Assembles the model prompt within `budget` tokens.
+
+    Only the context sections relevant to the query type are included, rows
+    are rendered compactly and de-duplicated, and `retry` (last failed code,
+    error) replaces the ever-growing retry history. A `follow_up` (earlier
+    questions, previous code, size of `df_prev`) is sent as a short delta in
+    place of the retrieved rows, unless it names something new and brings
+    freshly retrieved rows (`fresh_context`). Returns (prompt, estimated_tokens, query_type).
+    """
+    query_type = classify_query(question)
+    order = SECTIONS_BY_TYPE[query_type]
+    if follow_up and not follow_up.get("fresh_context"):
+        order = [name for name in order if name in FOLLOW_UP_SECTIONS]
+    sections = {
+        "kb": _rows_to_lines(search_results.get("filtered_kb", [])),
+        "claims": _rows_to_lines(search_results.get("filtered_warranty", [])),
+        "costs": _rows_to_lines(search_results.get("filtered_cost", [])),
+        "resolved": _rows_to_lines(search_results.get("resolved_costs", [])),
+    }
+    columns = [str(c) for c in search_results.get("df_columns", [])]
+
+    prompt = _render(columns, sections, order, question, retry, follow_up)
+    tokens = estimate_tokens(prompt)
+
+    for name in reversed(order):
+        while tokens > budget and sections[name]:
+            sections[name].pop()
+            prompt = _render(columns, sections, order, question, retry, follow_up)
+            tokens = estimate_tokens(prompt)
+
+    if tokens > budget:
+        logger.warning(f"🧾 Prompt still {tokens} tokens after trimming context (budget {budget}).")
+    return prompt, tokens, query_type
+
+
+class PromptStats:
+    """Per query type totals of prompt tokens sent, for cost / latency tracking."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, query_type: str, tokens: int, attempt: int):
+        with self._lock:
+            entry = self._stats.setdefault(query_type, {"prompts": 0, "retries": 0, "tokens": 0, "max_tokens": 0})
+            entry["prompts"] += 1
+            entry["retries"] += 1 if attempt > 0 else 0
+            entry["tokens"] += tokens
+            entry["max_tokens"] = max(entry["max_tokens"], tokens)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                query_type: {**entry, "avg_tokens": round(entry["tokens"] / entry["prompts"], 1)}
+                for query_type, entry in self._stats.items()
+            }
+
+
+prompt_stats = PromptStats()
@@ -1,14 +1,111 @@
+import asyncio
+import json
+import logging
 from fastapi import APIRouter, HTTPException
-from app.models.request import ChatRequest
-from app.models.response import ChatResponse
-from app.agents.code_agent import run_data_agent 
+from fastapi.responses import StreamingResponse
+from app.models.request import BatchChatRequest, ChatRequest
+from app.models.response import BatchChatResponse, ChatResponse
+from app.agents.batch_runner import run_batch, stream_batch
+from app.agents.code_agent import run_data_agent, stream_data_agent
+from app.agents.llm_gate import LLMQueueFullError
+from app.services.data_parser import dataset_manager, lookup_part_cost
+from app.services.session_store import session_store
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
     try:
-        response_data = await run_data_agent(request.message, request.user_id)
+        response_data = await run_data_agent(request.message, request.user_id, request.include_timings, request.session_id)
         return response_data
+    except LLMQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Same pipeline as /chat, streamed as Server-Sent Events:
+    retrieval -> code / execution (per attempt) -> answer -> graph -> done.
+    Closing the connection cancels the model call and the sandbox run.
+    """
+    async def event_source():
+        try:
+            async for event, payload in stream_data_agent(request.message, request.user_id, request.include_timings, request.session_id):
+                if event == "result":
+                    yield _sse("answer", payload.model_dump(exclude={"graph_json", "graph_base64"}))
+                    if payload.graph_json:
+                        yield _sse("graph", {"graph_json": payload.graph_json})
+                else:
+                    yield _sse(event, payload)
+        except LLMQueueFullError as e:
+            yield _sse("error", {"status": 429, "detail": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            logger.error(f"❌ Stream failed: {e}", exc_info=True)
+            yield _sse("error", {"status": 500, "detail": str(e)})
+        yield _sse("done", {})
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/chat/batch", response_model=BatchChatResponse)
+async def chat_batch_endpoint(request: BatchChatRequest):
+    """
+    Answers many independent questions in one request (duplicates once, one
+    shared snapshot, bounded parallelism). With `stream`
+    each item is sent as an `item` event when done, then `summary` and `done`.
+    """
+    if not request.stream:
+        try:
+            return await run_batch(request.questions, request.user_id, request.include_timings)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    async def event_source():
+        try:
+            async for event, payload in stream_batch(request.questions, request.user_id, request.include_timings):
+                yield _sse(event, payload.model_dump() if event == "item" else payload)
+        except Exception as e:
+            logger.error(f"❌ Batch stream failed: {e}", exc_info=True)
+            yield _sse("error", {"status": 500, "detail": str(e)})
+        yield _sse("done", {})
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.delete("/chat/session")
+async def reset_session(session_id: str, user_id: str = "local_user"):
+    """Forgets a session's working set, so the next question starts a new conversation."""
+    return {"cleared": session_store.clear(user_id, session_id)}
+
+@router.get("/parts/cost")
+async def part_cost(part: str, model: str = None):
+    """Resolves free-text part names ("Replaced shaft seal assly & DV") to cost list items and prices."""
+    return {"part": part, "model": model, "matches": await asyncio.to_thread(lookup_part_cost, part, model)}
+
+@router.get("/admin/dataset")
+async def dataset_status():
+    """Live dataset version, row counts and load / derive timings."""
+    return await asyncio.to_thread(dataset_manager.status)
+
+@router.post("/admin/dataset/reload")
+async def dataset_reload(force: bool = False):
+    """Picks up changed data files now instead of waiting for the watcher (`force` rebuilds everything)."""
+    try:
+        snapshot = await asyncio.to_thread(dataset_manager.reload, force)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        logger.error(f"❌ Dataset reload failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Dataset reload failed: {e}")
+    return {"reloaded": snapshot is not None, **(await asyncio.to_thread(dataset_manager.status))}
@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime
+from app.core.config import settings
+from app.core.metrics import AUDIT_RECORDS
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = "audit.jsonl"
+
+
+class AuditLog:
+    """
+    Structured per-request audit trail, written off the request path.
+
+    `record()` only puts the entry on a bounded queue and never blocks; a
+    background thread drains it in batches, appends them to `audit.jsonl`
+    and rotates the file by size and by age (at most `max_files` rotated
+    files are kept). Under pressure the log degrades instead of slowing
+    requests down: once the queue is `sample_above` full only a
+    `sample_rate` share of successful requests is kept (failures always
+    are), and when it is completely full records are dropped and counted.
+    """
+
+    def __init__(self, directory: str, max_queue: int, batch_size: int, flush_seconds: float, rotate_bytes: int,
+                 rotate_seconds: float, max_files: int, sample_above: float, sample_rate: float):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.max_files = max_files
+        self.sample_above = sample_above
+        self.sample_rate = sample_rate
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._file = None
+        self._opened_at = None
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, CURRENT_FILE)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Writes out whatever is queued, then stops the writer."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def record(self, entry: dict) -> bool:
+        """Queues one record; False when it was sampled out or dropped."""
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        if entry.get("outcome") not in ("failed", "rejected", "cancelled") and self._queue.qsize() >= self.sample_above * self._queue.maxsize:
+            if random.random() >= self.sample_rate:
+                self.sampled_out += 1
+                AUDIT_RECORDS.inc(result="sampled_out")
+                return False
+            entry["sampled"] = self.sample_rate
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+            AUDIT_RECORDS.inc(result="dropped")
+            return False
+        return True
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                first = self._queue.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                try:
+                    self._maybe_rotate()
+                except OSError as e:
+                    logger.warning(f"⚠️ Audit log rotation failed ({e}); retrying on the next write.")
+                continue
+            batch = []
+            for entry in [first] + self._drain():
+                if entry is None:
+                    stopping = True
+                else:
+                    batch.append(entry)
+            if batch:
+                self._write(batch)
+        self._close()
+
+    def _drain(self) -> list:
+        entries = []
+        while len(entries) < self.batch_size - 1:
+            try:
+                entries.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return entries
+
+    def _write(self, batch: list):
+        lines = "".join(json.dumps(entry, default=str, ensure_ascii=False) + "\n" for entry in batch)
+        try:
+            self._maybe_rotate()
+            if self._file is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+                self._opened_at = time.time()
+            self._file.write(lines)
+            self._file.flush()
+        except OSError as e:
+            self.dropped += len(batch)
+            AUDIT_RECORDS.inc(len(batch), result="dropped")
+            logger.warning(f"⚠️ Audit log write failed ({e}); dropped {len(batch)} records.")
+            return
+        self.written += len(batch)
+        AUDIT_RECORDS.inc(len(batch), result="written")
+
+    def _maybe_rotate(self):
+        if self._file is None:
+            return
+        too_big = self._file.tell() >= self.rotate_bytes
+        too_old = time.time() - self._opened_at >= self.rotate_seconds
+        if not (too_big or too_old) or self._file.tell() == 0:
+            return
+        self._close()
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        os.replace(self.path, os.path.join(self.directory, f"audit-{stamp}.jsonl"))
+        rotated = sorted(name for name in os.listdir(self.directory) if name.startswith("audit-") and name.endswith(".jsonl"))
+        for name in rotated[:max(len(rotated) - self.max_files, 0)]:
+            os.remove(os.path.join(self.directory, name))
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self) -> dict:
+        return {"queued": self._queue.qsize(), "written": self.written, "dropped": self.dropped, "sampled_out": self.sampled_out}
+
+
+audit_log = AuditLog(
+    directory=settings.AUDIT_DIR,
+    max_queue=settings.AUDIT_MAX_QUEUE,
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_seconds=settings.AUDIT_FLUSH_SECONDS,
+    rotate_bytes=int(settings.AUDIT_ROTATE_MB * 2**20),
+    rotate_seconds=settings.AUDIT_ROTATE_SECONDS,
+    max_files=settings.AUDIT_MAX_FILES,
+    sample_above=settings.AUDIT_SAMPLE_ABOVE,
+    sample_rate=settings.AUDIT_SAMPLE_RATE,
+)
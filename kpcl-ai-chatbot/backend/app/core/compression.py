@@ -0,0 +1,87 @@
+import gzip
+import io
+from starlette.datastructures import Headers, MutableHeaders
+
+# Responses that must reach the client as they are produced: compressing them would hold events back
+PASSTHROUGH_TYPES = ("text/event-stream",)
+
+
+class NonStreamingGZipMiddleware:
+    """
+    gzip for responses of at least `minimum_size` bytes when the client
+    accepts it. The decision is made from the response's own headers: event
+    streams (/chat/stream, streamed /chat/batch) and responses that already
+    carry a Content-Encoding are forwarded untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = 500, compresslevel: int = 6):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or "gzip" not in Headers(scope=scope).get("Accept-Encoding", ""):
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _GZipSender(send, self.minimum_size, self.compresslevel))
+
+
+class _GZipSender:
+    """The `send` callable handed to the app for one response; compresses its body on the way out."""
+
+    def __init__(self, send, minimum_size: int, compresslevel: int):
+        self.send = send
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+        self.start = None
+        self.passthrough = False
+        self.gzip_file = None
+        self.buffer = None
+
+    def _compress(self, body: bytes, finish: bool) -> bytes:
+        self.gzip_file.write(body)
+        if finish:
+            self.gzip_file.close()
+        else:
+            self.gzip_file.flush()
+        data = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            self.passthrough = "content-encoding" in headers or headers.get("content-type", "").startswith(PASSTHROUGH_TYPES)
+            if self.passthrough:
+                await self.send(message)
+            else:
+                # Held back until the first body chunk shows whether compressing is worthwhile
+                self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body, more_body = message.get("body", b""), message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+            self.buffer = io.BytesIO()
+            self.gzip_file = gzip.GzipFile(mode="wb", fileobj=self.buffer, compresslevel=self.compresslevel)
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = "gzip"
+            headers.add_vary_header("Accept-Encoding")
+            data = self._compress(body, finish=not more_body)
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(data))
+            await self.send(start)
+            await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+            return
+        await self.send({"type": "http.response.body", "body": self._compress(body, finish=not more_body), "more_body": more_body})
@@ -11,11 +11,35 @@ class Settings(BaseSettings):
     API_V1_STR: str = "/api/v1"
     
     # 🔴 Now this will correctly grab the key!
-    GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY")
+    GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
     MODEL_NAME: str = os.getenv("MODEL_NAME", "gemini-2.5-flash") 
     
+    # 🔦 Logs every full prompt / response; keep off outside local debugging (LANGCHAIN_DEBUG still honoured)
+    LLM_DEBUG: bool = os.getenv("LLM_DEBUG", os.getenv("LANGCHAIN_DEBUG", "false")).lower() == "true"
+    
+    # 🚦 Upstream model concurrency: calls beyond MAX_CONCURRENCY queue, beyond MAX_QUEUE get HTTP 429
+    LLM_MAX_CONCURRENCY: int = 4
+    LLM_MAX_QUEUE: int = 32
+    LLM_QUEUE_TIMEOUT: float = 30.0
+    
+    # 🧾 Upper bound for the assembled prompt (system rules + context + question), in estimated tokens
+    PROMPT_TOKEN_BUDGET: int = 2500
+    
+    # 🔌 Model providers: pooled HTTP clients, per-provider timeouts, a circuit breaker after repeated failures
+    GEMINI_BASE_URL: str = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com")
+    LLM_TIMEOUT_SECONDS: float = 30.0
+    LLM_MAX_CONNECTIONS: int = 20
+    LLM_BREAKER_FAILURES: int = 5
+    LLM_BREAKER_RESET_SECONDS: float = 30.0
+    
     # Ollama Local Configuration
+    # 🏁 When enabled, a Gemini call slower than LLM_HEDGE_AFTER_SECONDS is also sent to Ollama (first answer wins),
+    # and a failing / circuit-broken Gemini falls back to it (0 = fallback only, no hedging)
+    OLLAMA_ENABLED: bool = os.getenv("OLLAMA_ENABLED", "false").lower() == "true"
     OLLAMA_BASE_URL: str = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+    OLLAMA_MODEL: str = os.getenv("OLLAMA_MODEL", "qwen2.5-coder:7b")
+    OLLAMA_TIMEOUT_SECONDS: float = 60.0
+    LLM_HEDGE_AFTER_SECONDS: float = 8.0
     
     # Data Paths
     BASE_DIR: str = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -25,6 +49,64 @@ class Settings(BaseSettings):
     # 💰 NEW: Cost Analysis Path
     COST_DATA_PATH: str = os.path.join(BASE_DIR, "data", "raw", "cost_Analysis_for_spare_part_cc.xlsx")
     
+    # ⚡ Columnar snapshots of the cleaned Excel data (prebuild with `python -m app.services.snapshot_cache`)
+    SNAPSHOT_ENABLED: bool = True
+    SNAPSHOT_DIR: str = os.getenv("SNAPSHOT_DIR", os.path.join(BASE_DIR, "data", "snapshots"))
+    
+    # 🗜️ Store repetitive text columns as categoricals and downcast numeric columns where lossless
+    # (generated code still gets those text columns as plain object columns)
+    DATASET_COMPACTION: bool = True
+    
+    # 👀 Poll the data files this often and hot-reload them when they change (0 = never)
+    DATASET_WATCH_INTERVAL: float = 30.0
+    
+    # 🗃️ Cache of successfully executed generated code (skips the LLM for repeat questions)
+    CODE_CACHE_ENABLED: bool = True
+    CODE_CACHE_PATH: str = os.getenv("CODE_CACHE_PATH", os.path.join(BASE_DIR, "data", "cache", "code_cache.sqlite3"))
+    CODE_CACHE_MAX_ENTRIES: int = 500
+    CODE_CACHE_TTL_SECONDS: float = 7 * 24 * 3600
+    
+    # 🧪 Pre-forked sandbox processes for generated code (0 workers = run in-process)
+    SANDBOX_WORKERS: int = min(4, os.cpu_count() or 1)
+    SANDBOX_TIMEOUT_SECONDS: float = 20.0
+    # Memory a worker allocates itself; the data it shares copy-on-write with the API process doesn't count
+    SANDBOX_MAX_RSS_MB: float = 1024.0
+    SANDBOX_MAX_TASKS_PER_WORKER: int = 200
+    
+    # 📚 /chat/batch: questions per request, and how many of them run through the pipeline at once
+    BATCH_MAX_QUESTIONS: int = 100
+    BATCH_MAX_CONCURRENCY: int = 4
+    
+    # 📊 Chart payloads: oversized traces are aggregated / decimated, long numeric arrays sent as base64 typed arrays
+    CHART_MAX_POINTS: int = 5000
+    CHART_TYPED_ARRAYS: bool = True
+    # 🖼️ Rendered charts of executed code, per dataset version (0 MB = off)
+    CHART_CACHE_MAX_MB: float = 64.0
+    # How long a cached chart *and its answer text* are replayed without re-running the code
+    CHART_CACHE_TTL_SECONDS: float = 3600.0
+    
+    # 💬 Per-session working sets for follow-up questions ("now only for 2024"), keyed on user_id + session_id
+    SESSION_MAX_ENTRIES: int = 1000
+    SESSION_MAX_MB: float = 64.0
+    SESSION_IDLE_SECONDS: float = 30 * 60
+    
+    # 🗜️ gzip responses above this size (the SSE stream is left alone so events are not held back)
+    GZIP_MIN_BYTES: int = 1000
+    GZIP_LEVEL: int = 6
+    
+    # 🧾 Per-request audit records (question, prompt hash, code, attempts, timings, outcome) as rotated JSONL,
+    # written by a background thread; past AUDIT_SAMPLE_ABOVE queue fill only a sample of successes is kept
+    AUDIT_ENABLED: bool = True
+    AUDIT_DIR: str = os.getenv("AUDIT_DIR", os.path.join(BASE_DIR, "logs", "audit"))
+    AUDIT_MAX_QUEUE: int = 10000
+    AUDIT_BATCH_SIZE: int = 200
+    AUDIT_FLUSH_SECONDS: float = 1.0
+    AUDIT_ROTATE_MB: float = 50.0
+    AUDIT_ROTATE_SECONDS: float = 24 * 3600
+    AUDIT_MAX_FILES: int = 30
+    AUDIT_SAMPLE_ABOVE: float = 0.5
+    AUDIT_SAMPLE_RATE: float = 0.1
+    
     # CORS
     BACKEND_CORS_ORIGINS: list = ["http://localhost:5173", "http://localhost:3000"]
 
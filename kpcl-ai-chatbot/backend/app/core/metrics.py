@@ -0,0 +1,206 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds: sub-millisecond fast paths up to multi-retry LLM answers
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 50000, 100000, 500000, 1000000)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._values.items())
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            for bound, n in zip(self.buckets, counts):
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {n}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Value read at scrape time from `collect()`, which returns {label tuple: value}."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, collect, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def render(self) -> list:
+        try:
+            values = self.collect()
+        except Exception:
+            return []
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in sorted(values.items())]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    "kbot_requests_total", "Chat requests by how they were answered.", ["path"]))
+REQUEST_SECONDS = registry.register(Histogram(
+    "kbot_request_seconds", "End-to-end chat request latency.", ["path"]))
+STAGE_SECONDS = registry.register(Histogram(
+    "kbot_stage_seconds", "Latency of each pipeline stage.", ["stage"]))
+LLM_CALLS = registry.register(Counter(
+    "kbot_llm_calls_total", "Upstream model calls by outcome.", ["outcome"]))
+LLM_PROVIDER_CALLS = registry.register(Counter(
+    "kbot_llm_provider_calls_total", "Calls to each model provider by outcome.", ["provider", "outcome"]))
+LLM_HEDGES = registry.register(Counter(
+    "kbot_llm_hedges_total", "Slow primary calls that were also sent to the fallback model."))
+LLM_ATTEMPTS = registry.register(Histogram(
+    "kbot_llm_attempts", "Model attempts needed per request that reached the model.", buckets=(1, 2, 3)))
+PROMPT_TOKENS = registry.register(Histogram(
+    "kbot_prompt_tokens", "Estimated prompt tokens per model call.", ["query_type"], buckets=SIZE_BUCKETS))
+RESPONSE_CHARS = registry.register(Histogram(
+    "kbot_llm_response_chars", "Size of the model response per call.", buckets=SIZE_BUCKETS))
+CODE_CACHE_LOOKUPS = registry.register(Counter(
+    "kbot_code_cache_lookups_total", "Code cache lookups by result.", ["result"]))
+CODE_CHECKS = registry.register(Counter(
+    "kbot_code_checks_total", "Pre-execution checks of generated code by result.", ["result"]))
+EXECUTIONS = registry.register(Counter(
+    "kbot_sandbox_executions_total", "Generated code executions by status.", ["status"]))
+SANDBOX_RECYCLED = registry.register(Counter(
+    "kbot_sandbox_recycled_total", "Sandbox workers killed and replaced (timeouts, memory, crashes, task limit, reloads)."))
+CHART_CACHE_LOOKUPS = registry.register(Counter(
+    "kbot_chart_cache_lookups_total", "Rendered chart cache lookups by result.", ["result"]))
+AUDIT_RECORDS = registry.register(Counter(
+    "kbot_audit_records_total", "Audit records by result (written / sampled_out / dropped).", ["result"]))
+GRAPH_BYTES = registry.register(Histogram(
+    "kbot_graph_json_bytes", "Size of the serialized plotly figure sent to the client.", buckets=SIZE_BUCKETS))
+
+
+class RequestTrace:
+    """
+    Timing spans and counters for one chat request.
+
+    Every span is also observed into `kbot_stage_seconds`, so the same
+    numbers feed /metrics and the optional per-request breakdown.
+
+        trace = RequestTrace()
+        with trace.span("retrieval"):
+            ...
+        trace.note("cache", "miss")
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self.info = {}
+        # Audit-only fields (prompt hash, final code): kept out of the timing breakdown
+        self.audit = {}
+
+    @contextmanager
+    def span(self, stage: str, **attrs):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, **attrs)
+
+    def add(self, stage: str, seconds: float, **attrs):
+        self.spans.append({"stage": stage, "ms": round(seconds * 1000, 2), **attrs})
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+    def note(self, key: str, value):
+        self.info[key] = value
+
+    def finish(self, path: str) -> float:
+        elapsed = time.perf_counter() - self.started
+        self.info["path"] = path
+        REQUESTS.inc(path=path)
+        REQUEST_SECONDS.observe(elapsed, path=path)
+        return elapsed
+
+    def summary(self) -> dict:
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "spans": self.spans,
+            **self.info,
+        }
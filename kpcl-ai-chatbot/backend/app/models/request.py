@@ -1,6 +1,15 @@
+from typing import List, Optional
 from pydantic import BaseModel, Field
+from app.core.config import settings
 
 class ChatRequest(BaseModel):
     user_id: str = Field(default="local_user", description="Unique ID for tenant isolation")
     message: str = Field(..., description="The natural language query from the user")
-    session_id: str = Field(default="default_session", description="Context tracking")
\ No newline at end of file
+    session_id: Optional[str] = Field(default=None, description="One conversation (e.g. a browser tab); follow-up questions build on its previous answer. Without one every question stands alone")
+    include_timings: bool = Field(default=False, description="Return a per-stage timing breakdown with the answer")
+
+class BatchChatRequest(BaseModel):
+    user_id: str = Field(default="local_user", description="Unique ID for tenant isolation")
+    questions: List[str] = Field(..., min_length=1, max_length=settings.BATCH_MAX_QUESTIONS, description="Independent questions, answered in any order")
+    include_timings: bool = Field(default=False, description="Return a per-stage timing breakdown with every answer")
+    stream: bool = Field(default=False, description="Stream each item as Server-Sent Events as soon as it is answered")
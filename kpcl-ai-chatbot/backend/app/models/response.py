@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class ChatRequest(BaseModel):
     message: str
@@ -15,4 +15,19 @@ class ChatResponse(BaseModel):
     graph_json: Optional[str] = None
     
     # We can leave this here just in case any old code still references it
-    graph_base64: Optional[str] = None
\ No newline at end of file
+    graph_base64: Optional[str] = None
+    
+    # ⏱️ Per-stage timing breakdown, only filled in when the request asks for it
+    timings: Optional[dict] = None
+
+class BatchItem(BaseModel):
+    index: int
+    question: str
+    # Index of the earlier, equivalent question whose answer this one reuses
+    duplicate_of: Optional[int] = None
+    response: ChatResponse
+
+class BatchChatResponse(BaseModel):
+    results: List[BatchItem]
+    # ⏱️ Batch-level breakdown: shared snapshot time, retrievals run, answer paths, throughput
+    timings: dict
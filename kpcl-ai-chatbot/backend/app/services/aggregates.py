@@ -0,0 +1,101 @@
+import logging
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Dimensions we pre-aggregate over (only the ones present in the sheet are built)
+CUBE_DIMENSIONS = ['Dealer Name', 'Nature of complaint', 'Model', 'Customer Name']
+DATE_COLUMN = 'Complaint Date'
+RUNHRS_COLUMN = 'RunHrs.'
+
+MEASURES = {
+    "claims": "number of complaints",
+    "runhrs_total": "total RunHrs",
+    "runhrs_avg": "average RunHrs",
+}
+
+
+class AggregateEngine:
+    """
+    Group-by cubes over the warranty claims, materialised once per load.
+
+    Every cube holds, per dimension value: the claim count, the RunHrs. sum
+    and the number of non-null RunHrs. (so averages stay exact). Period
+    cubes do the same per complaint year and month.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.total_claims = len(df)
+        self.cubes = {}
+        self.unique_counts = {}
+        self.periods = {}
+
+        runhrs = df[RUNHRS_COLUMN] if RUNHRS_COLUMN in df.columns else pd.Series(float("nan"), index=df.index)
+        base = pd.DataFrame({"runhrs": pd.to_numeric(runhrs, errors="coerce").astype("float64")}, index=df.index)
+
+        for dim in CUBE_DIMENSIONS:
+            if dim not in df.columns:
+                continue
+            self.cubes[dim] = self._aggregate(base, df[dim])
+            self.unique_counts[dim] = len(self.cubes[dim])
+
+        if DATE_COLUMN in df.columns:
+            dates = pd.to_datetime(df[DATE_COLUMN], errors="coerce")
+            self.periods["year"] = self._aggregate(base, dates.dt.year.astype("Int64"))
+            self.periods["month"] = self._aggregate(base, dates.dt.to_period("M"))
+
+        logger.info(f"🧮 Built aggregate cubes for {len(self.cubes)} dimensions and {len(self.periods)} periods")
+
+    def extend(self, rows: pd.DataFrame) -> "AggregateEngine":
+        """
+        Returns a new engine covering the current rows plus `rows` (appended
+        claims). Only the new rows are aggregated; this engine is left as is.
+        """
+        delta = AggregateEngine(rows)
+        merged = AggregateEngine.__new__(AggregateEngine)
+        merged.total_claims = self.total_claims + delta.total_claims
+        merged.cubes = {dim: self._merge(cube, delta.cubes.get(dim)) for dim, cube in self.cubes.items()}
+        merged.unique_counts = {dim: len(cube) for dim, cube in merged.cubes.items()}
+        merged.periods = {period: self._merge(cube, delta.periods.get(period)) for period, cube in self.periods.items()}
+        return merged
+
+    @staticmethod
+    def _merge(cube: pd.DataFrame, delta) -> pd.DataFrame:
+        if delta is None or delta.empty:
+            return cube
+        merged = cube.add(delta, fill_value=0)
+        merged["claims"] = merged["claims"].astype("int64")
+        merged["runhrs_n"] = merged["runhrs_n"].astype("int64")
+        return merged.sort_index()
+
+    @staticmethod
+    def _aggregate(base: pd.DataFrame, keys: pd.Series) -> pd.DataFrame:
+        grouped = base.groupby(keys.rename("key"), dropna=True, observed=True)["runhrs"]
+        cube = pd.DataFrame({
+            "claims": grouped.size(),
+            "runhrs_sum": grouped.sum(),
+            "runhrs_n": grouped.count(),
+        })
+        if isinstance(cube.index, pd.CategoricalIndex):
+            # Plain labels, so cubes built from differently encoded frames merge cleanly
+            cube.index = cube.index.astype(object)
+        return cube.sort_index()
+
+    @staticmethod
+    def _measure(cube: pd.DataFrame, measure: str) -> pd.Series:
+        if measure == "runhrs_total":
+            return cube["runhrs_sum"].where(cube["runhrs_n"] > 0)
+        if measure == "runhrs_avg":
+            return cube["runhrs_sum"] / cube["runhrs_n"].where(cube["runhrs_n"] > 0)
+        return cube["claims"]
+
+    def has_dimension(self, dim: str) -> bool:
+        return dim in self.cubes
+
+    def top(self, dim: str, measure: str, n: int, ascending: bool = False) -> pd.Series:
+        """Top (or bottom) `n` values of `dim` ranked by `measure`; ties keep alphabetical order."""
+        values = self._measure(self.cubes[dim], measure).dropna()
+        return values.sort_values(ascending=ascending, kind="stable").head(n)
+
+    def by_period(self, period: str, measure: str) -> pd.Series:
+        return self._measure(self.periods[period], measure).dropna()
@@ -0,0 +1,279 @@
+import base64
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Shorter arrays stay plain JSON lists (the typed-array wrapper would not pay off)
+MIN_TYPED_LENGTH = 16
+# Trace attributes that plotly.js accepts as typed arrays ({"dtype", "bdata"}); "z" may be 2-D
+TYPED_ARRAY_KEYS = {
+    "x", "y", "z", "values", "lat", "lon", "r", "theta", "open", "high", "low", "close",
+    "base", "width", "color", "size", "opacity", "customdata", "a", "b", "c", "u", "v", "w",
+}
+# Smallest integer dtype first; plotly.js dtype codes
+INT_DTYPES = [("i1", np.int8), ("u1", np.uint8), ("i2", np.int16), ("u2", np.uint16), ("i4", np.int32), ("u4", np.uint32)]
+
+
+def _numeric(values):
+    """`values` as a numeric numpy array, or None when it holds anything else (text, None, bools, nesting)."""
+    try:
+        array = np.asarray(values)
+    except (ValueError, TypeError):
+        return None
+    if array.dtype.kind not in "iuf" or array.size == 0:
+        return None
+    return array
+
+
+def encode_typed_array(array: np.ndarray) -> dict:
+    """
+    Plotly.js typed array: base64 of the raw little-endian values. Integers
+    (and integral floats) use the smallest integer type that holds them;
+    other floats use float32 only when no value changes.
+    """
+    if array.dtype.kind == "f" and np.isfinite(array).all() and (array == np.round(array)).all() and len(array):
+        array = array.astype(np.int64)
+    if array.dtype.kind in "iu":
+        low, high = array.min(), array.max()
+        for code, dtype in INT_DTYPES:
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                return {"dtype": code, "bdata": base64.b64encode(array.astype(dtype).astype(f"<{code}").tobytes()).decode("ascii")}
+        array = array.astype(np.float64)
+    as_f4 = array.astype(np.float32)
+    if np.array_equal(as_f4.astype(np.float64), array, equal_nan=True):
+        return {"dtype": "f4", "bdata": base64.b64encode(as_f4.astype("<f4").tobytes()).decode("ascii")}
+    return {"dtype": "f8", "bdata": base64.b64encode(array.astype("<f8").tobytes()).decode("ascii")}
+
+
+def _encode_arrays(node: dict) -> int:
+    """Replaces long numeric lists in a trace (and its marker / line dicts) with typed arrays; returns how many."""
+    count = 0
+    for key, value in list(node.items()):
+        if isinstance(value, dict):
+            count += _encode_arrays(value)
+        elif isinstance(value, list) and len(value) >= MIN_TYPED_LENGTH and key in TYPED_ARRAY_KEYS:
+            array = _numeric(value)
+            if array is None or (array.ndim == 2 and key != "z") or array.ndim > 2:
+                continue
+            encoded = encode_typed_array(array.ravel())
+            if array.ndim == 2:
+                encoded["shape"] = f"{array.shape[0]},{array.shape[1]}"
+            node[key] = encoded
+            count += 1
+    return count
+
+
+def _per_point(trace: dict, n: int):
+    """(container, key) of every attribute with one entry per point, including marker.* / line.*."""
+    for container in [trace] + [trace[k] for k in ("marker", "line") if isinstance(trace.get(k), dict)]:
+        for key, value in container.items():
+            if isinstance(value, list) and len(value) == n:
+                yield container, key
+
+
+def _take(trace: dict, n: int, index: np.ndarray):
+    for container, key in list(_per_point(trace, n)):
+        values = container[key]
+        container[key] = [values[i] for i in index]
+
+
+def _minmax_index(values, buckets: int) -> np.ndarray:
+    """Per bucket of consecutive points, the positions of the min and max value (keeps spikes visible)."""
+    y = np.asarray(values, dtype=np.float64)
+    n = len(y)
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    keep = [0, n - 1]
+    filled = np.where(np.isnan(y), np.nanmean(y) if np.isfinite(y).any() else 0.0, y)
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            segment = filled[start:end]
+            keep.extend((start + int(segment.argmin()), start + int(segment.argmax())))
+    return np.unique(np.asarray(keep, dtype=np.int64))
+
+
+def _aggregate(trace: dict, label_key: str, value_key: str) -> bool:
+    """Sums the values of repeated labels (a bar / pie trace built from raw rows) into one point per label."""
+    labels, values = trace.get(label_key), trace.get(value_key)
+    if not isinstance(labels, list) or not isinstance(values, list) or len(labels) != len(values):
+        return False
+    numeric = _numeric(values)
+    if numeric is None or numeric.ndim != 1:
+        return False
+    totals = OrderedDict()
+    for label, value in zip(labels, numeric.tolist()):
+        key = json.dumps(label)
+        totals[key] = totals.get(key, 0) + value
+    if len(totals) == len(labels):
+        return False
+    n = len(labels)
+    # Per-row hover text / colors no longer line up with the summed points
+    for container, key in list(_per_point(trace, n)):
+        if key not in (label_key, value_key):
+            del container[key]
+    trace[label_key] = [json.loads(k) for k in totals]
+    trace[value_key] = list(totals.values())
+    return True
+
+
+def _downsample(trace: dict, max_points: int):
+    """Shrinks one oversized trace in place; returns (points before, points after) or None when left as is."""
+    kind = trace.get("type", "scatter")
+    if kind == "pie":
+        n = len(trace.get("values") or [])
+        if n > max_points and _aggregate(trace, "labels", "values"):
+            return n, len(trace["values"])
+        return None
+
+    xs, ys = trace.get("x"), trace.get("y")
+    n = max(len(xs) if isinstance(xs, list) else 0, len(ys) if isinstance(ys, list) else 0)
+    if n <= max_points:
+        return None
+
+    if kind == "bar":
+        horizontal = trace.get("orientation") == "h"
+        if _aggregate(trace, "y" if horizontal else "x", "x" if horizontal else "y"):
+            return n, len(trace["x"])
+        return None
+
+    if kind in ("scatter", "scattergl"):
+        values = ys if isinstance(ys, list) and len(ys) == n else None
+        if "lines" in str(trace.get("mode", "lines")) and values is not None and _numeric(values) is not None:
+            index = _minmax_index(values, max_points // 2)
+        else:
+            index = np.unique(np.linspace(0, n - 1, max_points).astype(np.int64))
+        _take(trace, n, index)
+        return n, len(index)
+    # Histograms / box plots summarise the raw values themselves; they are only encoded
+    return None
+
+
+def compact_chart(graph_json: str, max_points: int = None, typed_arrays: bool = None):
+    """
+    Post-processes a `fig.to_json()` string for the client: oversized traces
+    are aggregated (repeated bar / pie labels) or decimated (line charts keep
+    each bucket's min and max, scatter plots an even sample), and long
+    numeric arrays become base64 typed arrays. Returns (json, info); the
+    input comes back unchanged if it cannot be processed.
+    """
+    max_points = settings.CHART_MAX_POINTS if max_points is None else max_points
+    typed_arrays = settings.CHART_TYPED_ARRAYS if typed_arrays is None else typed_arrays
+    info = {"bytes_before": len(graph_json or ""), "downsampled": [], "typed_arrays": 0}
+    try:
+        figure = json.loads(graph_json)
+        traces = figure.get("data") or []
+        for i, trace in enumerate(traces):
+            if not isinstance(trace, dict):
+                continue
+            shrunk = _downsample(trace, max_points)
+            if shrunk:
+                info["downsampled"].append({"trace": i, "points": shrunk[0], "kept": shrunk[1]})
+            if typed_arrays:
+                info["typed_arrays"] += _encode_arrays(trace)
+        compacted = json.dumps(figure, separators=(",", ":"))
+    except Exception as e:
+        logger.warning(f"⚠️ Chart post-processing skipped: {e}")
+        info["bytes_after"] = info["bytes_before"]
+        return graph_json, info
+    info["bytes_after"] = len(compacted)
+    if info["downsampled"]:
+        logger.info(f"📉 Downsampled chart traces: {info['downsampled']}")
+    return compacted, info
+
+
+# Code that reads the clock ("last 30 days", "this year") gives a different answer tomorrow on the same data
+CLOCK_READS_RE = re.compile(r"\.(?:now|today|utcnow)\s*\(|\btime\.time\s*\(|['\"](?:now|today)['\"]")
+
+
+class ChartCache:
+    """
+    Execution results that produced a chart (answer + compacted graph JSON),
+    keyed on the executed code and the dataset fingerprint, so re-running
+    the same code on the same data skips the sandbox, plotting and
+    post-processing. In-memory LRU bounded by payload bytes.
+
+    The answer text is cached with the chart and replayed as is: both come
+    from the same code on the same data, so they are only as fresh as each
+    other. Code that reads the clock is therefore never cached, and
+    `ttl_seconds` bounds how long any other answer and its chart are reused.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(code: str, fingerprint: str) -> str:
+        return f"{fingerprint}:{hashlib.sha1(code.encode('utf-8')).hexdigest()}"
+
+    @staticmethod
+    def _size(result: dict) -> int:
+        rows = result.get("working_rows")
+        return len(result.get("graph_json") or "") + len(result.get("answer") or "") + (rows.nbytes if rows is not None else 0)
+
+    def get(self, code: str, fingerprint: str):
+        key = self._key(code, fingerprint)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] >= self.ttl_seconds:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, code: str, fingerprint: str, result: dict):
+        if self.max_bytes <= 0 or result.get("error") or not result.get("graph_json") or CLOCK_READS_RE.search(code):
+            return
+        entry = {"answer": result.get("answer"), "graph_json": result["graph_json"], "error": None,
+                 "working_rows": result.get("working_rows")}
+        size = self._size(entry)
+        if size > self.max_bytes:
+            return
+        key = self._key(code, fingerprint)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (time.time(), entry)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= self._size(entry[1])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
+
+
+chart_cache = ChartCache(int(settings.CHART_CACHE_MAX_MB * 2**20), settings.CHART_CACHE_TTL_SECONDS)
+
+
+def preload_plotting():
+    """
+    Imports plotly.express and renders a throwaway figure, so the first chart
+    request does not pay for the import, template and validator loading.
+    Called at startup before the sandbox workers fork; they inherit it.
+    """
+    start = time.perf_counter()
+    import plotly.express as px
+    px.bar(x=["a"], y=[1], template="plotly_white").to_json()
+    logger.info(f"📊 Plotting stack preloaded in {time.perf_counter() - start:.2f}s")
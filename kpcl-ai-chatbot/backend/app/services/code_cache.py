@@ -0,0 +1,152 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Words, numbers with their sign / decimals / percent, and comparison operators; everything else is noise
+_KEY_TOKEN_RE = re.compile(r"(?<![\w.])[-+]?\d+(?:\.\d+)?(?!\w)%?|\w+|[<>]=?|[!=]=|=|[≤≥≠]|%")
+
+
+def normalize_question(question: str) -> str:
+    """
+    Collapses wording noise that never changes the generated code:
+    case, quotes, punctuation and whitespace.
+    "Which 'Dealer Name' has the highest total 'RunHrs.'" and
+    "Which Dealer Name has the highest total RunHrs?" give the same key.
+    Anything that changes the answer stays in it: comparison operators,
+    signs, decimal points and percentages ("RunHrs > 1.5" != "RunHrs < 15").
+    """
+    return " ".join(_KEY_TOKEN_RE.findall(question.lower()))
+
+
+class CodeCache:
+    """
+    Cache of generated code that executed successfully, keyed on the
+    normalized question and the fingerprint of the loaded datasets.
+
+    Entries live in an in-memory LRU and are written through to SQLite, so
+    they survive restarts. When the dataset fingerprint changes, every entry
+    built against older data is dropped.
+    """
+
+    def __init__(self, path: str, max_entries: int, ttl_seconds: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._fingerprint = None
+        self._lock = threading.Lock()
+        self._conn = None
+        self._open()
+
+    def _open(self):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS code_cache ("
+                " question TEXT NOT NULL, fingerprint TEXT NOT NULL, code TEXT NOT NULL,"
+                " created_at REAL NOT NULL, last_used REAL NOT NULL,"
+                " PRIMARY KEY (question, fingerprint))"
+            )
+            rows = self._conn.execute(
+                "SELECT question, fingerprint, code, created_at FROM code_cache ORDER BY last_used"
+            ).fetchall()
+            for question, fingerprint, code, created_at in rows:
+                self._entries[(question, fingerprint)] = (code, created_at)
+            self._conn.commit()
+            logger.info(f"🗃️ Code cache loaded {len(rows)} entries from {self.path}")
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Code cache persistence disabled: {e}")
+            self._conn = None
+
+    def _persist(self, sql: str, params=()):
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute(sql, params)
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Code cache write failed: {e}")
+
+    def _invalidate_other_fingerprints(self, fingerprint: str):
+        # Called with the lock held. The datasets changed: older code may be wrong now.
+        if self._fingerprint == fingerprint:
+            return
+        stale = [key for key in self._entries if key[1] != fingerprint]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            logger.info(f"🧹 Dataset changed, dropped {len(stale)} cached code entries")
+        self._persist("DELETE FROM code_cache WHERE fingerprint != ?", (fingerprint,))
+        self._fingerprint = fingerprint
+
+    def get(self, question: str, fingerprint: str):
+        key = (normalize_question(question), fingerprint)
+        with self._lock:
+            self._invalidate_other_fingerprints(fingerprint)
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] > self.ttl_seconds:
+                del self._entries[key]
+                self._persist("DELETE FROM code_cache WHERE question = ? AND fingerprint = ?", key)
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self._persist("UPDATE code_cache SET last_used = ? WHERE question = ? AND fingerprint = ?", (time.time(), *key))
+            return entry[0]
+
+    def put(self, question: str, fingerprint: str, code: str):
+        key = (normalize_question(question), fingerprint)
+        now = time.time()
+        with self._lock:
+            self._invalidate_other_fingerprints(fingerprint)
+            self._entries[key] = (code, now)
+            self._entries.move_to_end(key)
+            self._persist("INSERT OR REPLACE INTO code_cache VALUES (?, ?, ?, ?, ?)", (*key, code, now, now))
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                self._persist("DELETE FROM code_cache WHERE question = ? AND fingerprint = ?", old_key)
+                self.evictions += 1
+
+    def discard(self, question: str, fingerprint: str):
+        key = (normalize_question(question), fingerprint)
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._persist("DELETE FROM code_cache WHERE question = ? AND fingerprint = ?", key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._persist("DELETE FROM code_cache")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+code_cache = CodeCache(
+    path=settings.CODE_CACHE_PATH if settings.CODE_CACHE_ENABLED else "",
+    max_entries=settings.CODE_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.CODE_CACHE_TTL_SECONDS,
+)
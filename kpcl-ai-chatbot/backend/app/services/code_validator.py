@@ -0,0 +1,467 @@
+import ast
+import difflib
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Top-level modules generated code may import; anything else is rejected before exec
+ALLOWED_MODULES = {
+    "pandas", "numpy", "plotly", "math", "re", "datetime", "calendar", "collections",
+    "statistics", "itertools", "functools", "operator", "string", "json", "decimal", "textwrap",
+}
+# Builtins that reach outside the sandbox or around these checks
+FORBIDDEN_NAMES = {
+    "eval", "exec", "compile", "open", "__import__", "globals", "locals", "vars",
+    "getattr", "setattr", "delattr", "input", "breakpoint", "exit", "quit", "help",
+}
+# pandas / plotly calls that only ever touch files, the network or a browser
+FORBIDDEN_ATTRIBUTES = {
+    "to_excel", "to_pickle", "to_parquet", "to_feather", "to_hdf", "to_sql", "to_stata", "to_orc", "to_clipboard",
+    "write_html", "write_image", "write_json",
+}
+# Writers that return a string when called without a path, and write a file with one
+PATH_WRITERS = {"to_csv", "to_json", "to_html", "to_markdown", "to_string", "to_latex", "to_xml"}
+
+# DataFrame methods whose result keeps the receiver's columns
+FRAME_METHODS = {
+    "copy", "dropna", "fillna", "head", "tail", "sort_values", "sort_index", "query", "drop_duplicates",
+    "sample", "nlargest", "nsmallest", "astype", "replace", "where", "mask", "isna", "notna", "infer_objects",
+}
+# Method -> (positional index, keyword names) of arguments that name columns of the receiver
+COLUMN_ARGUMENTS = {
+    "groupby": (0, ("by",)),
+    "sort_values": (0, ("by",)),
+    "set_index": (0, ("keys",)),
+    "drop_duplicates": (0, ("subset",)),
+    "dropna": (None, ("subset",)),
+    "nlargest": (1, ("columns",)),
+    "nsmallest": (1, ("columns",)),
+    "pivot_table": (None, ("index", "columns", "values")),
+    "drop": (None, ("columns",)),
+    "explode": (0, ("column",)),
+}
+# Subscript keys that select rows (boolean masks, slices) rather than a single column
+ROW_SELECTORS = (ast.Compare, ast.BoolOp, ast.BinOp, ast.UnaryOp, ast.Call, ast.Slice)
+
+# Fuzzy repair: minimum similarity of the normalized names, and lead over the runner-up
+MATCH_CUTOFF = 0.85
+MATCH_MARGIN = 0.05
+
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]")
+_MISSING_COLUMN_RES = (
+    re.compile(r"^'(.+)'$"),
+    re.compile(r"^\"None of \[Index\(\['(.+?)'\]"),
+    re.compile(r"^\"\['(.+?)'\] not in index\"$"),
+)
+
+
+def _normalize(name: str) -> str:
+    return _NON_ALNUM_RE.sub("", name.lower())
+
+
+def match_column(name: str, columns) -> str:
+    """
+    The real column a near-miss name was meant to be, or None when there is
+    no unambiguous candidate. Case, spaces and punctuation are ignored first
+    ("runhrs" -> "RunHrs."), then close spellings are accepted
+    ("Exp/Domastic" -> "Exp/Domestic").
+    """
+    key = _normalize(name)
+    if not key:
+        return None
+    columns = list(dict.fromkeys(str(c) for c in columns))
+    exact = [c for c in columns if _normalize(c) == key]
+    if exact:
+        return exact[0] if len(exact) == 1 else None
+    scored = sorted(((difflib.SequenceMatcher(None, key, _normalize(c)).ratio(), c) for c in columns), reverse=True)
+    if scored and scored[0][0] >= MATCH_CUTOFF and (len(scored) == 1 or scored[0][0] - scored[1][0] >= MATCH_MARGIN):
+        return scored[0][1]
+    return None
+
+
+def _string_keys(node) -> list:
+    """String constants of a column selector: 'A' or ['A', 'B']."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node]
+    if isinstance(node, (ast.List, ast.Tuple)) and node.elts and all(
+            isinstance(e, ast.Constant) and isinstance(e.value, str) for e in node.elts):
+        return list(node.elts)
+    return []
+
+
+def _bound_names(target) -> list:
+    return [node.id for node in ast.walk(target) if isinstance(node, ast.Name)]
+
+
+class _Analyzer(ast.NodeVisitor):
+    """
+    Walks the generated code in statement order, tracking which variables
+    still hold one of the sandbox frames (or a row subset of it), and
+    collects column references and disallowed constructs along the way.
+    """
+
+    def __init__(self, frames: dict, created: set):
+        self.frames = frames
+        self.created = created
+        self.aliases = {name: name for name in frames}
+        self.references = []
+        self.problems = []
+        self.removable = []
+
+    # --- frame tracking -------------------------------------------------
+
+    def _root(self, node):
+        """Name of the sandbox frame whose columns `node` still has, else None."""
+        if isinstance(node, ast.Name):
+            return self.aliases.get(node.id)
+        if isinstance(node, ast.Subscript):
+            value, key = node.value, node.slice
+            if isinstance(value, ast.Attribute) and value.attr in ("loc", "iloc"):
+                root = self._root(value.value)
+                if value.attr == "loc" and isinstance(key, ast.Tuple) and len(key.elts) == 2:
+                    column = key.elts[1]
+                    if isinstance(column, ast.Constant) or not (_string_keys(column) or isinstance(column, ast.Slice)):
+                        return None
+                return root
+            root = self._root(value)
+            if root is None:
+                return None
+            if isinstance(key, (ast.List, ast.Tuple)) and _string_keys(key):
+                return root
+            return root if isinstance(key, ROW_SELECTORS) else None
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in FRAME_METHODS:
+            return self._root(node.func.value)
+        return None
+
+    def _grouped(self, node):
+        """Frame behind a `frame.groupby(...)` expression, else None."""
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "groupby":
+            return self._root(node.func.value)
+        return None
+
+    def _bind(self, target, value=None):
+        root = self._root(value) if value is not None and isinstance(target, ast.Name) else None
+        for name in _bound_names(target):
+            self.aliases.pop(name, None)
+        if root is not None:
+            self.aliases[target.id] = root
+
+    def _reference(self, keys: list, root: str):
+        for node in keys:
+            self.references.append((node, root))
+
+    # --- statements -----------------------------------------------------
+
+    def visit_Assign(self, node):
+        self.visit(node.value)
+        for target in node.targets:
+            self._visit_target(target)
+            self._bind(target, node.value)
+
+    def visit_AugAssign(self, node):
+        self.visit(node.value)
+        self._visit_target(node.target)
+        self._bind(node.target)
+
+    def visit_AnnAssign(self, node):
+        if node.value is not None:
+            self.visit(node.value)
+        self._visit_target(node.target)
+        self._bind(node.target, node.value)
+
+    def visit_NamedExpr(self, node):
+        self.visit(node.value)
+        self._bind(node.target)
+
+    def _visit_target(self, target):
+        # Column assignments (df['New'] = ...) were collected up front; only look inside their keys / indices
+        if isinstance(target, ast.Subscript):
+            self.visit(target.value)
+            self.visit(target.slice)
+        elif isinstance(target, (ast.Tuple, ast.List)):
+            for element in target.elts:
+                self._visit_target(element)
+        elif isinstance(target, ast.Attribute):
+            self.visit(target.value)
+
+    def visit_For(self, node):
+        self.visit(node.iter)
+        self._bind(node.target)
+        # for _, row in frame.iterrows(): row['Column'] reads that frame's columns
+        iterator = node.iter
+        if (isinstance(iterator, ast.Call) and isinstance(iterator.func, ast.Attribute) and iterator.func.attr == "iterrows"
+                and isinstance(node.target, ast.Tuple) and len(node.target.elts) == 2 and isinstance(node.target.elts[1], ast.Name)):
+            root = self._root(iterator.func.value)
+            if root is not None:
+                self.aliases[node.target.elts[1].id] = root
+        for statement in node.body + node.orelse:
+            self.visit(statement)
+
+    def visit_With(self, node):
+        for item in node.items:
+            self.visit(item.context_expr)
+            if item.optional_vars is not None:
+                self._bind(item.optional_vars)
+        for statement in node.body:
+            self.visit(statement)
+
+    def _visit_scope(self, node):
+        # Names bound inside functions / lambdas / comprehensions are not tracked
+        saved = dict(self.aliases)
+        if isinstance(getattr(node, "args", None), ast.arguments):
+            for arg in ast.walk(node.args):
+                if isinstance(arg, ast.arg):
+                    self.aliases.pop(arg.arg, None)
+        for generator in getattr(node, "generators", ()):
+            for name in _bound_names(generator.target):
+                self.aliases.pop(name, None)
+        self.generic_visit(node)
+        self.aliases = saved
+
+    visit_FunctionDef = visit_Lambda = visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = _visit_scope
+
+    def visit_Expr(self, node):
+        # fig.show() would try to open a browser inside the sandbox; it is dropped rather than sent back
+        call = node.value
+        if isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute) and call.func.attr == "show" and not call.args:
+            self.removable.append(node)
+            return
+        self.generic_visit(node)
+
+    # --- disallowed constructs -----------------------------------------
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self._check_module(alias.name)
+
+    def visit_ImportFrom(self, node):
+        if node.level:
+            self.problems.append("relative imports are not allowed")
+        else:
+            self._check_module(node.module or "")
+
+    def _check_module(self, module: str):
+        top = module.split(".")[0]
+        if top not in ALLOWED_MODULES:
+            hint = " (use plotly.express as px for charts)" if top == "matplotlib" or top == "seaborn" else ""
+            self.problems.append(f"import of '{module}' is not allowed{hint}")
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load) and node.id in FORBIDDEN_NAMES:
+            self.problems.append(f"'{node.id}' is not allowed")
+
+    def visit_Attribute(self, node):
+        attr = node.attr
+        if attr.startswith("__") and attr.endswith("__"):
+            self.problems.append(f"access to '{attr}' is not allowed")
+        elif attr in FORBIDDEN_ATTRIBUTES or attr.startswith("read_"):
+            self.problems.append(f"'.{attr}()' is not allowed (no file or network access)")
+        self.generic_visit(node)
+
+    # --- column references ---------------------------------------------
+
+    def visit_Subscript(self, node):
+        value, key = node.value, node.slice
+        if isinstance(value, ast.Attribute) and value.attr == "loc":
+            root = self._root(value.value)
+            if root is not None and isinstance(key, ast.Tuple) and len(key.elts) == 2:
+                self._reference(_string_keys(key.elts[1]), root)
+        else:
+            root = self._root(value) or self._grouped(value)
+            if root is not None:
+                self._reference(_string_keys(key), root)
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        func = node.func
+        if isinstance(func, ast.Attribute):
+            if func.attr in PATH_WRITERS and (node.args or any(k.arg in ("buf", "path_or_buf") for k in node.keywords)):
+                self.problems.append(f"'.{func.attr}()' with a path is not allowed (no file access)")
+            root = self._root(func.value)
+            if root is not None and func.attr in COLUMN_ARGUMENTS:
+                position, keywords = COLUMN_ARGUMENTS[func.attr]
+                if position is not None and len(node.args) > position:
+                    self._reference(_string_keys(node.args[position]), root)
+                for keyword in node.keywords:
+                    if keyword.arg in keywords:
+                        self._reference(_string_keys(keyword.value), root)
+            grouped = self._grouped(func.value)
+            if grouped is not None and func.attr in ("agg", "aggregate"):
+                # Named aggregation: .agg(total=('RunHrs.', 'sum'))
+                for keyword in node.keywords:
+                    if isinstance(keyword.value, ast.Tuple) and keyword.value.elts:
+                        self._reference(_string_keys(keyword.value.elts[0])[:1], grouped)
+        self.generic_visit(node)
+
+
+def _created_columns(tree) -> set:
+    """Every column the code may add: df['New'] = ..., df.loc[:, 'New'] = ..., .assign(New=...), .insert(i, 'New', ...)."""
+    created = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Subscript) and isinstance(node.ctx, ast.Store):
+            key = node.slice
+            if isinstance(key, ast.Tuple) and len(key.elts) == 2:
+                key = key.elts[1]
+            created.update(k.value for k in _string_keys(key))
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            if node.func.attr == "assign":
+                created.update(k.arg for k in node.keywords if k.arg)
+            elif node.func.attr == "insert" and len(node.args) > 1:
+                created.update(k.value for k in _string_keys(node.args[1]))
+            elif node.func.attr == "rename":
+                for keyword in node.keywords:
+                    if keyword.arg == "columns" and isinstance(keyword.value, ast.Dict):
+                        created.update(v.value for v in keyword.value.values if isinstance(v, ast.Constant) and isinstance(v.value, str))
+    return created
+
+
+def _apply_edits(code: str, tree, edits: list) -> str:
+    """
+    Replaces each (node, text) span in the source, keeping the rest of the
+    code (comments, formatting) as written. Falls back to unparsing the
+    already-updated tree when a span cannot be rewritten in place.
+    """
+    raw = code.encode("utf-8")
+    starts = [0]
+    for line in raw.splitlines(keepends=True):
+        starts.append(starts[-1] + len(line))
+
+    def offset(lineno, col):
+        return starts[lineno - 1] + col
+
+    spans = sorted(((offset(n.lineno, n.col_offset), offset(n.end_lineno, n.end_col_offset), text) for n, text in edits), reverse=True)
+    try:
+        for (start, end, text), (next_start, next_end, _) in zip(spans, spans[1:]):
+            if next_end > start:
+                raise ValueError("overlapping edits")
+        for start, end, text in spans:
+            raw = raw[:start] + text.encode("utf-8") + raw[end:]
+        repaired = raw.decode("utf-8")
+        ast.parse(repaired)
+        return repaired
+    except (ValueError, SyntaxError, UnicodeDecodeError):
+        return ast.unparse(tree)
+
+
+def _literal(node, value: str, code_lines: list):
+    """Source text for `value`, quoted like the literal it replaces (None when that is not safe)."""
+    if node.lineno != node.end_lineno:
+        return None
+    original = code_lines[node.lineno - 1].encode("utf-8")[node.col_offset:node.end_col_offset].decode("utf-8", "replace")
+    quote = original[:1]
+    if quote not in ("'", '"') or original[-1:] != quote or len(original) < 2 or original[:3] in ("'''", '"""'):
+        return None
+    if quote in value or "\\" in value:
+        return None
+    try:
+        if ast.literal_eval(original) != node.value:
+            return None
+    except (ValueError, SyntaxError):
+        return None
+    return f"{quote}{value}{quote}"
+
+
+def _rewrite(code: str, tree, replacements: list, removals: list) -> str:
+    """Applies (Constant node, new value) replacements and statement removals to the source."""
+    code_lines = code.splitlines()
+    edits = []
+    in_place = True
+    for node, value in replacements:
+        text = _literal(node, value, code_lines)
+        if text is None:
+            in_place = False
+        edits.append((node, text))
+        node.value = value
+    for statement in removals:
+        edits.append((statement, "pass"))
+        statement.value = ast.Constant(value=None)
+    if not in_place:
+        return ast.unparse(tree)
+    return _apply_edits(code, tree, edits)
+
+
+def _unknown_column_message(name: str, root: str, columns) -> str:
+    close = difflib.get_close_matches(name, [str(c) for c in columns], n=5, cutoff=0.4)
+    listed = close or [str(c) for c in columns]
+    label = "Similar columns" if close else "Available columns"
+    return f"column '{name}' does not exist in `{root}`. {label}: {', '.join(repr(c) for c in listed)}"
+
+
+def validate_code(code: str, schemas: dict) -> dict:
+    """
+    Static checks of generated code before it is executed.
+
+    `schemas` maps the sandbox frame names (df, df_kb, df_cost) to their
+    columns. Column names used on those frames (and on variables that are
+    row subsets of them) are checked; near-misses are repaired in place.
+    Returns {"code", "repairs", "error"}: `error` is set when the code must
+    go back to the model (syntax errors, disallowed imports / attributes,
+    columns that match nothing), and is None when `code` can be executed.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return {"code": code, "repairs": [], "error": f"Rejected before execution: SyntaxError: {e.msg} (line {e.lineno})"}
+
+    created = _created_columns(tree)
+    analyzer = _Analyzer(schemas, created)
+    analyzer.visit(tree)
+
+    problems = list(dict.fromkeys(analyzer.problems))
+    replacements = []
+    repairs = []
+    seen = set()
+    for node, root in analyzer.references:
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        columns = [str(c) for c in schemas[root]]
+        name = node.value
+        if name in columns or name in created:
+            continue
+        match = match_column(name, columns)
+        if match is None:
+            problems.append(_unknown_column_message(name, root, columns))
+            continue
+        replacements.append((node, match))
+        repairs.append({"frame": root, "from": name, "to": match})
+
+    if problems:
+        return {"code": code, "repairs": [], "error": "Rejected before execution: " + "; ".join(dict.fromkeys(problems))}
+    if replacements or analyzer.removable:
+        code = _rewrite(code, tree, replacements, analyzer.removable)
+        if analyzer.removable:
+            repairs.append({"removed": "fig.show()"})
+    return {"code": code, "repairs": repairs, "error": None}
+
+
+def repair_missing_column(code: str, error: str, schemas: dict):
+    """
+    Local fix for a KeyError raised during execution (e.g. a column read
+    through a variable the static pass cannot follow): every string literal
+    equal to the missing name is replaced by its unambiguous match among
+    all sandbox columns. Returns {"code", "repairs"} or None.
+    """
+    missing = None
+    for pattern in _MISSING_COLUMN_RES:
+        found = pattern.match(error or "")
+        if found:
+            missing = found.group(1)
+            break
+    if not missing:
+        return None
+    columns = [str(c) for frame_columns in schemas.values() for c in frame_columns]
+    if missing in columns:
+        return None
+    match = match_column(missing, columns)
+    if match is None:
+        return None
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    nodes = [n for n in ast.walk(tree) if isinstance(n, ast.Constant) and n.value == missing]
+    if not nodes:
+        return None
+    return {"code": _rewrite(code, tree, [(n, match) for n in nodes], []), "repairs": [{"from": missing, "to": match}]}
@@ -0,0 +1,73 @@
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Text columns with at most this share of distinct values become categoricals
+MAX_CATEGORY_RATIO = 0.5
+
+
+def _is_text(series: pd.Series) -> bool:
+    values = series.dropna()
+    return len(values) > 0 and values.map(type).eq(str).all()
+
+
+def _downcast(series: pd.Series) -> pd.Series:
+    """Smallest numeric dtype that holds every value exactly; the column is returned as is otherwise."""
+    values = series.dropna()
+    if not series.isna().any() and len(values) and (values == np.floor(values)).all():
+        return pd.to_numeric(series, downcast="integer")
+    as_float32 = series.astype("float32")
+    if ((as_float32.astype("float64") == series) | series.isna()).all():
+        return as_float32
+    return series
+
+
+def compact_frame(df: pd.DataFrame, numeric_columns=(), max_category_ratio: float = MAX_CATEGORY_RATIO):
+    """
+    Returns (compacted frame, memory report with per-column KB before / after).
+
+    Repetitive text columns become categoricals: each distinct string is
+    stored once in the category dictionary and rows hold small integer
+    codes (the indexes and cubes are built from these; generated code gets
+    them back as object columns, see expand_categoricals). `numeric_columns` are downcast only when no value
+    changes (float32 would round e.g. a RunHrs. of 1234.7).
+    """
+    before = df.memory_usage(deep=True, index=False)
+    dtypes_before = df.dtypes
+    compacted = {}
+    for col in df.columns:
+        series = df[col]
+        if series.dtype == object and len(series) and series.nunique() <= max_category_ratio * len(series) and _is_text(series):
+            compacted[col] = series.astype("category")
+        elif col in numeric_columns and pd.api.types.is_float_dtype(series):
+            compacted[col] = _downcast(series)
+    if compacted:
+        df = df.assign(**compacted)
+    after = df.memory_usage(deep=True, index=False)
+
+    columns = {
+        str(col): {
+            "dtype_before": str(dtypes_before[col]),
+            "dtype_after": str(df[col].dtype),
+            "kb_before": round(before[col] / 1024, 1),
+            "kb_after": round(after[col] / 1024, 1),
+        }
+        for col in df.columns
+    }
+    report = {"mb_before": round(before.sum() / 2**20, 2), "mb_after": round(after.sum() / 2**20, 2), "columns": columns}
+    return df, report
+
+
+def expand_categoricals(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    `df` with its categorical columns back as object columns, the dtype
+    generated code is written against (fillna, assignment and string
+    concatenation all reject values outside a categorical's categories).
+    The rows point at the category strings, so no string is copied.
+    """
+    categorical = [col for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)]
+    if not categorical:
+        return df
+    return df.assign(**{col: df[col].astype(object) for col in categorical})
@@ -1,124 +1,225 @@
+import ast
+import contextlib
+import numpy as np
 import pandas as pd
 import logging
 import os
+import threading
+import time
+import weakref
 from app.core.config import settings
+from app.services.aggregates import AggregateEngine
+from app.services.compaction import compact_frame, expand_categoricals
+from app.services.dataset_manager import DatasetManager, DatasetSnapshot
+from app.services.sandbox_pool import SandboxPool, fork_supported
+from app.services.search_index import extract_keywords, rank_rows
 
 logger = logging.getLogger(__name__)
 
-# 🚀 GLOBAL CACHE
-global_df = None
-global_kb_df = None
-global_cost_df = None
+# 🚀 GLOBAL CACHE (the datasets themselves live in `dataset_manager` below)
+global_sandbox_pool = None
+
+# 🗂️ Text columns that get an inverted index at load time (add more here to make them searchable)
+INDEXED_COLUMNS = {
+    "warranty": ['Nature of complaint', 'Spares / Part Replaced'],
+    "kb": ['Problem category'],
+    "cost": ['ITEM DESCRIPTION'],
+}
+# Words in 'Spares / Part Replaced' that say nothing about which part it was
+PART_NOISE_WORDS = {"replaced", "replace", "change", "changed", "assly", "assy", "assembly", "nos", "new", "set", "kcx", "one", "two"}
+WARRANTY_SEARCH_WEIGHTS = {
+    ("warranty", "Nature of complaint"): 1.0,
+    ("warranty", "Spares / Part Replaced"): 0.25,
+}
+
+# 🔖 Bump this whenever the cleaning steps below change, so stale snapshots are rebuilt
+CLEANING_VERSION = 1
+
+# 🗜️ Numeric columns downcast at load time (only when every value survives the smaller dtype)
+COMPACT_NUMERIC_COLUMNS = ['RunHrs.', 'RPM', 'Period DD to DC in months']
+
+def load_warranty_df(path: str) -> pd.DataFrame:
+    df = pd.read_excel(path)
+    
+    # Strip invisible spaces from column names (Fixes KeyErrors)
+    df.columns = df.columns.astype(str).str.strip()
+    
+    numeric_cols = ['RunHrs.', 'RPM', 'Period DD to DC in months', 'FSR No']
+    for col in numeric_cols:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+def load_kb_df(path: str) -> pd.DataFrame:
+    df_kb = pd.read_excel(path)
+    df_kb = df_kb.iloc[:, :4] 
+    
+    # Safely assign names based on actual column count
+    kb_names = ['Sr. No.', 'Problem category', 'Due to Supplier/In-house', 'Probable Causes']
+    df_kb.columns = kb_names[:len(df_kb.columns)]
+    
+    for col in df_kb.columns:
+        if df_kb[col].dtype == 'object':
+            df_kb[col] = df_kb[col].astype(str).str.strip()
+    return df_kb
+
+def load_cost_df(path: str) -> pd.DataFrame:
+    df_cost = pd.read_excel(path)
+    df_cost = df_cost.iloc[:, :6]
+    
+    # Safely assign names based on actual column count to prevent ValueError
+    cost_names = ['ITEM DESCRIPTION', 'QTY', 'UNIT PRICE', 'BASIC VALUE', 'TAX VALUE', 'GROSS VALUE']
+    df_cost.columns = cost_names[:len(df_cost.columns)]
+    
+    if 'GROSS VALUE' in df_cost.columns:
+        df_cost['GROSS VALUE'] = pd.to_numeric(df_cost['GROSS VALUE'], errors='coerce')
+    if 'ITEM DESCRIPTION' in df_cost.columns:
+        df_cost['ITEM DESCRIPTION'] = df_cost['ITEM DESCRIPTION'].astype(str).str.strip()
+    return df_cost
+
+# Snapshot name -> (settings attribute holding the source path, Excel loader)
+DATASETS = {
+    "warranty": ("ACTIVE_DATA_PATH", load_warranty_df),
+    "kb": ("KB_DATA_PATH", load_kb_df),
+    "cost": ("COST_DATA_PATH", load_cost_df),
+}
+
+def compact_dataset(name: str, df: pd.DataFrame):
+    """Categoricals for repetitive text, smaller numeric dtypes; returns (df, memory report)."""
+    if not settings.DATASET_COMPACTION:
+        return df, None
+    return compact_frame(df, numeric_columns=COMPACT_NUMERIC_COLUMNS)
+
+# 📦 Versioned, hot-reloadable snapshots of the three datasets (+ their indexes and cubes)
+dataset_manager = DatasetManager(
+    datasets=DATASETS,
+    cleaning_version=CLEANING_VERSION,
+    indexed_columns=INDEXED_COLUMNS,
+    watch_interval=settings.DATASET_WATCH_INTERVAL,
+    compactor=compact_dataset,
+)
+
+def get_snapshot() -> DatasetSnapshot:
+    """
+    The live dataset snapshot, loaded on first use. A request should fetch it
+    once and pass it along, so a hot reload never mixes data versions.
+    """
+    return dataset_manager.current
 
 def get_dataframes():
     """
     Loads Excel datasets safely. Uses flexible naming to prevent 500 errors
     if the number of columns in the Excel files changes.
+    Cleaned frames are served from columnar snapshots when they are fresh.
     """
-    global global_df, global_kb_df, global_cost_df
-    
-    # 1. Load Main Warranty Claims Data
-    if global_df is None:
-        logger.info(f"📂 Loading Main Warranty data from: {settings.ACTIVE_DATA_PATH}")
-        df = pd.read_excel(settings.ACTIVE_DATA_PATH)
-        
-        # Strip invisible spaces from column names (Fixes KeyErrors)
-        df.columns = df.columns.astype(str).str.strip()
-        
-        numeric_cols = ['RunHrs.', 'RPM', 'Period DD to DC in months', 'FSR No']
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-        global_df = df
-        
-    # 2. 🧠 Load Knowledge Base Data
-    if global_kb_df is None:
-        logger.info(f"🧠 Loading Knowledge Base from: {settings.KB_DATA_PATH}")
-        df_kb = pd.read_excel(settings.KB_DATA_PATH)
-        df_kb = df_kb.iloc[:, :4] 
-        
-        # Safely assign names based on actual column count
-        kb_names = ['Sr. No.', 'Problem category', 'Due to Supplier/In-house', 'Probable Causes']
-        df_kb.columns = kb_names[:len(df_kb.columns)]
-        
-        for col in df_kb.columns:
-            if df_kb[col].dtype == 'object':
-                df_kb[col] = df_kb[col].astype(str).str.strip()
-        global_kb_df = df_kb
-
-    # 3. 💰 Load Cost Analysis Data
-    if global_cost_df is None:
-        logger.info(f"💰 Loading Spare Part Costs from: {settings.COST_DATA_PATH}")
-        df_cost = pd.read_excel(settings.COST_DATA_PATH)
-        df_cost = df_cost.iloc[:, :6]
-        
-        # Safely assign names based on actual column count to prevent ValueError
-        cost_names = ['ITEM DESCRIPTION', 'QTY', 'UNIT PRICE', 'BASIC VALUE', 'TAX VALUE', 'GROSS VALUE']
-        df_cost.columns = cost_names[:len(df_cost.columns)]
-        
-        if 'GROSS VALUE' in df_cost.columns:
-            df_cost['GROSS VALUE'] = pd.to_numeric(df_cost['GROSS VALUE'], errors='coerce')
-        if 'ITEM DESCRIPTION' in df_cost.columns:
-            df_cost['ITEM DESCRIPTION'] = df_cost['ITEM DESCRIPTION'].astype(str).str.strip()
-            
-        global_cost_df = df_cost
-        
-    return global_df, global_kb_df, global_cost_df
+    snapshot = get_snapshot()
+    return snapshot.df, snapshot.df_kb, snapshot.df_cost
+
+def get_dataset_fingerprint() -> str:
+    """Fingerprint of the data currently loaded in memory (used to key caches)."""
+    return get_snapshot().fingerprint
+
+def get_search_indexes() -> dict:
+    """
+    Inverted indexes over the searchable text columns, built once per load
+    so retrieval never scans the rows.
+    """
+    return get_snapshot().indexes
+
+def get_aggregate_engine() -> AggregateEngine:
+    """Pre-computed group-by cubes over the warranty data, used by the LLM-free fast path."""
+    return get_snapshot().aggregates
+
+def lookup_part_cost(text: str, model: str = None, snapshot: DatasetSnapshot = None) -> list:
+    """Cost items for the parts named in free text (see PartCostResolver.lookup)."""
+    return (snapshot or get_snapshot()).part_costs.lookup(text, model)
+
+# Per snapshot: its frames as generated code sees them (built once, dropped with the snapshot)
+_sandbox_frames = weakref.WeakKeyDictionary()
+_sandbox_frames_lock = threading.Lock()
+
+def sandbox_inputs(snapshot: DatasetSnapshot = None) -> tuple:
+    """
+    What every sandbox run gets: the three frames, with categorical columns
+    back as object columns (see expand_categoricals), and the part cost resolver.
+    """
+    snapshot = snapshot or get_snapshot()
+    with _sandbox_frames_lock:
+        frames = _sandbox_frames.get(snapshot)
+        if frames is None:
+            frames = tuple(expand_categoricals(frame) for frame in (snapshot.df, snapshot.df_kb, snapshot.df_cost))
+            _sandbox_frames[snapshot] = frames
+    return (*frames, snapshot.part_costs)
+
+def sandbox_schemas(snapshot: DatasetSnapshot = None) -> dict:
+    """Columns of each frame generated code can use, keyed on its sandbox variable name."""
+    snapshot = snapshot or get_snapshot()
+    return {
+        "df": list(snapshot.df.columns),
+        "df_kb": list(snapshot.df_kb.columns),
+        "df_cost": list(snapshot.df_cost.columns),
+        "df_part_cost": list(snapshot.part_costs.table.columns),
+    }
 
 # 🚀 THE SEARCH-FIRST NODE (Crash-Proofed & Optimized for Speed)
-def find_relevant_context(user_query: str):
+def find_relevant_context(user_query: str, snapshot: DatasetSnapshot = None):
     """
     Retrieves relevant rows. Now wrapped in a try-except block so that 
     Pandas errors don't cause a 500 Internal Server Error in the API.
     Uses 'Strict Diet' column filtering to prevent Google API Token bloating.
     """
     try:
-        df, df_kb, df_cost = get_dataframes()
-        
-        raw_query = user_query.lower().replace('-', ' ').replace('_', ' ').strip()
+        snapshot = snapshot or get_snapshot()
+        df, df_kb, df_cost = snapshot.df, snapshot.df_kb, snapshot.df_cost
         
-        # 🚀 FIX 1: Ignore common filler words so they don't bloat the search
-        stop_words = {"how", "many", "what", "are", "the", "for", "and", "with", "from", "based", "column", "tell", "about", "were", "logged", "this", "that", "year", "date", "which", "who", "why"}
-        keywords = [k for k in raw_query.split() if len(k) > 2 and k not in stop_words] 
+        keywords = extract_keywords(user_query)
 
         if not keywords:
-            return {"filtered_kb": [], "filtered_warranty": [], "cost_table_str": "", "df_columns": list(df.columns) if not df.empty else []}
+            return {"filtered_kb": [], "filtered_warranty": [], "filtered_cost": [], "resolved_costs": [], "df_columns": list(df.columns) if not df.empty else []}
 
-        # Safe matching that ignores NaNs and floats
-        def keyword_match(cell_value):
-            if pd.isna(cell_value):
-                return False
-            val = str(cell_value).lower()
-            return any(k in val for k in keywords)
+        indexes = snapshot.indexes
 
         # 1. Match KB Safely (STRICT DIET: Only pull needed columns)
         matched_kb = []
-        if 'Problem category' in df_kb.columns:
-            kb_mask = df_kb['Problem category'].apply(keyword_match)
+        if ("kb", "Problem category") in indexes:
+            kb_rows = rank_rows([(indexes[("kb", "Problem category")], 1.0)], keywords, limit=5)
             kb_cols = [c for c in ['Problem category', 'Probable Causes'] if c in df_kb.columns]
-            # 🚀 FIX 2: Added .head(5) to cap the Knowledge Base results
-            matched_kb = df_kb.loc[kb_mask, kb_cols].head(5).to_dict('records')
+            matched_kb = df_kb.iloc[kb_rows][kb_cols].to_dict('records')
 
         # 2. Match Warranty Safely (STRICT DIET: Only pull needed columns)
+        # Complaint text drives the ranking; replaced parts only break ties / fill gaps
         matched_warranty = []
-        if 'Nature of complaint' in df.columns:
-            warranty_mask = df['Nature of complaint'].apply(keyword_match)
+        if ("warranty", "Nature of complaint") in indexes:
+            warranty_sources = [(indexes[key], weight) for key, weight in WARRANTY_SEARCH_WEIGHTS.items() if key in indexes]
+            warranty_rows = rank_rows(warranty_sources, keywords, limit=5, prefer_recent=True)
             warr_cols = [c for c in ['Nature of complaint', 'Spares / Part Replaced'] if c in df.columns]
-            matched_warranty = df.loc[warranty_mask, warr_cols].tail(5).to_dict('records')
+            matched_warranty = df.iloc[warranty_rows][warr_cols].to_dict('records')
         else:
             logger.warning("⚠️ 'Nature of complaint' column is missing from Warranty Excel!")
 
-        # 3. Compact Text Cost Table Safely
-        cost_table_str = "No cost data available."
-        if not df_cost.empty:
-            # Only select columns that actually exist in the dataframe
-            cols_to_show = [c for c in ['ITEM DESCRIPTION', 'UNIT PRICE', 'GROSS VALUE'] if c in df_cost.columns]
-            cost_table_str = df_cost[cols_to_show].to_string(index=False)
+        # 3. Relevant Cost Rows Only (matched on the query and the parts replaced in the claims above)
+        matched_cost = []
+        if ("cost", "ITEM DESCRIPTION") in indexes:
+            part_text = " ".join(str(r.get('Spares / Part Replaced', '')) for r in matched_warranty)
+            cost_keywords = keywords + [k for k in extract_keywords(part_text) if k not in PART_NOISE_WORDS and k not in keywords]
+            cost_rows = rank_rows([(indexes[("cost", "ITEM DESCRIPTION")], 1.0)], cost_keywords, limit=8)
+            cost_cols = [c for c in ['ITEM DESCRIPTION', 'UNIT PRICE', 'GROSS VALUE'] if c in df_cost.columns]
+            matched_cost = df_cost.iloc[cost_rows][cost_cols].to_dict('records')
+
+        # 4. The parts in those claims, already resolved to cost items (the `df_part_cost` rows)
+        resolved_costs = []
+        part_table = snapshot.part_costs.table
+        if matched_warranty and len(part_table):
+            part_texts = {str(r.get('Spares / Part Replaced')) for r in matched_warranty}
+            resolved = part_table[part_table['Spares / Part Replaced'].isin(part_texts)]
+            resolved = resolved.drop_duplicates(['PART', 'ITEM DESCRIPTION']).head(10)
+            resolved_costs = resolved[['PART', 'ITEM DESCRIPTION', 'GROSS VALUE']].fillna({'ITEM DESCRIPTION': 'NOT IN COST LIST'}).to_dict('records')
 
         return {
             "filtered_kb": matched_kb,
             "filtered_warranty": matched_warranty,
-            "cost_table_str": cost_table_str,
+            "filtered_cost": matched_cost,
+            "resolved_costs": resolved_costs,
             "df_columns": list(df.columns) if not df.empty else [] # Gives AI the exact column names
         }
         
@@ -128,33 +229,106 @@ def find_relevant_context(user_query: str):
         return {
             "filtered_kb": [],
             "filtered_warranty": [],
-            "cost_table_str": f"System error reading Excel files: {str(e)}",
+            "filtered_cost": [],
+            "resolved_costs": [],
+            "error": f"System error reading Excel files: {str(e)}",
             "df_columns": [] # Safe fallback
         }
 
-def execute_agent_code(python_code: str) -> dict:
-    try:
-        df, df_kb, df_cost = get_dataframes() 
-    except Exception as e:
-        return {"error": f"Failed to load files: {str(e)}"}
+class _TimedSerialization(ast.NodeTransformer):
+    """Routes every `x.to_json(...)` call in generated code through `timed_to_json`."""
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if isinstance(node.func, ast.Attribute) and node.func.attr == "to_json":
+            return ast.copy_location(ast.Call(func=ast.Name("timed_to_json", ast.Load()), args=[node.func] + node.args, keywords=node.keywords), node)
+        return node
+
+def _compile_generated(python_code: str):
+    """Generated code as run by the sandbox, with serialization timed at its call sites."""
+    tree = _TimedSerialization().visit(ast.parse(python_code))
+    return compile(ast.fix_missing_locations(tree), "<generated>", "exec")
 
+def _rows_of(value: pd.DataFrame, df):
+    """
+    Positions in `df` of the rows `value` was filtered from, or None when its
+    index no longer points at them: a fresh RangeIndex (merge, reset_index,
+    concat with ignore_index) or labels whose rows hold different values.
+    """
+    if isinstance(value.index, pd.RangeIndex) or not value.index.is_unique:
+        return None
+    positions = df.index.get_indexer(value.index)
+    if (positions < 0).any():
+        return None
+    # Spot-check the shared columns: the labels must still name the same rows
+    # (a majority, so a column the code cleaned up in place doesn't disqualify it)
+    sample = np.linspace(0, len(value) - 1, num=min(len(value), 20), dtype=int)
+    shared = [c for c in value.columns if c in df.columns]
+    original, derived = df.iloc[positions[sample]], value.iloc[sample]
+    same = sum(original[c].astype(object).reset_index(drop=True).equals(derived[c].astype(object).reset_index(drop=True)) for c in shared)
+    return positions if same * 2 > len(shared) else None
+
+def _working_rows(local_env: dict, df, inputs: list):
+    """
+    Row positions in `df` of the largest filtered copy of it the code built
+    (e.g. `kes = df[df['Model'] == 'KES']`): the working set a follow-up
+    question refines. Aggregates, the input frames themselves and frames whose
+    rows can't be traced back to `df` (see _rows_of) don't count.
+    """
+    best = None
+    for value in local_env.values():
+        if not isinstance(value, pd.DataFrame) or any(value is frame for frame in inputs) or not 0 < len(value) < len(df):
+            continue
+        if value.columns.isin(df.columns).sum() * 2 < len(df.columns):
+            continue
+        if best is not None and len(value) <= len(best):
+            continue
+        positions = _rows_of(value, df)
+        if positions is not None:
+            best = positions
+    return None if best is None else np.unique(best).astype(np.int32)
+
+def run_sandboxed(python_code: str, df, df_kb, df_cost, df_part_cost=None, part_cost=None, df_prev=None) -> dict:
+    """
+    Executes generated code against the given frames and collects
+    `final_answer` / `graph_json`, plus `working_rows` (see _working_rows).
+    Runs inside a sandbox worker process, or in-process when the pool is
+    disabled. `timings` holds the exec and figure serialization seconds.
+    """
     local_env = {
         "df": df, 
         "df_kb": df_kb, 
         "df_cost": df_cost, 
+        "df_part_cost": df_part_cost,
+        "part_cost": part_cost,
+        "df_prev": df_prev,
         "pd": pd, 
         "final_answer": "No answer generated.", 
         "graph_json": None
     }
     
+    # Seconds this run spent in fig.to_json() (and any other .to_json call)
+    serialized = [0.0]
+
+    def timed_to_json(to_json, *args, **kwargs):
+        call_start = time.perf_counter()
+        try:
+            return to_json(*args, **kwargs)
+        finally:
+            serialized[0] += time.perf_counter() - call_start
+
+    # The clock starts before the lazy plotly import so a cold import counts as exec, not IPC
+    start = time.perf_counter()
     if "px" in python_code or "plotly" in python_code:
         import plotly.express as px
         local_env["px"] = px
 
     try:
-        exec(python_code, {}, local_env)
+        exec(_compile_generated(python_code), {"timed_to_json": timed_to_json}, local_env)
     except Exception as e:
-        return {"error": str(e), "failed_code": python_code}
+        return {"error": str(e), "failed_code": python_code, "timings": {"exec": time.perf_counter() - start}}
+    exec_seconds = time.perf_counter() - start
+    timings = {"exec": exec_seconds - serialized[0], "to_json": serialized[0]}
 
     ans = str(local_env.get("final_answer"))
     g_json = local_env.get("graph_json")
@@ -163,4 +337,112 @@ def execute_agent_code(python_code: str) -> dict:
         g_json = ans
         ans = "Here is the requested graph."
 
-    return {"answer": ans, "graph_json": g_json, "error": None}
\ No newline at end of file
+    rows = _working_rows(local_env, df, [df, df_kb, df_cost, df_part_cost, df_prev])
+    return {"answer": ans, "graph_json": g_json, "error": None, "timings": timings, "working_rows": rows}
+
+# pandas options are process-wide: overlapping in-process runs share one copy-on-write activation
+_cow_lock = threading.Lock()
+_cow_runs = 0
+_cow_saved = None
+
+@contextlib.contextmanager
+def _copy_on_write():
+    """
+    pandas copy-on-write while a sandbox run is in progress, restored to its
+    previous value when the last overlapping run ends (pd.option_context
+    would switch it off under a run still going on another thread).
+    """
+    global _cow_runs, _cow_saved
+    with _cow_lock:
+        if _cow_runs == 0:
+            _cow_saved = pd.get_option("mode.copy_on_write")
+            pd.set_option("mode.copy_on_write", True)
+        _cow_runs += 1
+    try:
+        yield
+    finally:
+        with _cow_lock:
+            _cow_runs -= 1
+            if _cow_runs == 0:
+                pd.set_option("mode.copy_on_write", _cow_saved)
+
+def _sandbox_run(python_code: str, df, df_kb, df_cost, part_costs, working_rows=None) -> dict:
+    """
+    Zero-copy views: generated code can read the snapshot's arrays but never
+    write to them (copy-on-write keeps any mutation out of the frames shared
+    by later runs). `working_rows` (a session's previous working set) becomes `df_prev`.
+    """
+    with _copy_on_write():
+        df_prev = df.iloc[working_rows] if working_rows is not None else None
+        return run_sandboxed(python_code, df.copy(deep=False), df_kb.copy(deep=False), df_cost.copy(deep=False),
+                             part_costs.table.copy(deep=False), part_costs.lookup, df_prev)
+
+def start_sandbox_pool():
+    """Loads the data, then pre-forks the sandbox workers (no-op if disabled or unsupported)."""
+    global global_sandbox_pool
+    if global_sandbox_pool is not None or settings.SANDBOX_WORKERS <= 0:
+        return global_sandbox_pool
+    if not fork_supported():
+        logger.warning("⚠️ Process sandbox needs 'fork'; executing generated code in-process.")
+        return None
+    get_dataframes()
+    global_sandbox_pool = SandboxPool(
+        runner=_sandbox_run,
+        frames_provider=sandbox_inputs,
+        version_provider=get_dataset_fingerprint,
+        size=settings.SANDBOX_WORKERS,
+        timeout=settings.SANDBOX_TIMEOUT_SECONDS,
+        max_rss_mb=settings.SANDBOX_MAX_RSS_MB,
+        max_tasks=settings.SANDBOX_MAX_TASKS_PER_WORKER,
+    )
+    global_sandbox_pool.start()
+    return global_sandbox_pool
+
+def stop_sandbox_pool():
+    global global_sandbox_pool
+    if global_sandbox_pool is not None:
+        global_sandbox_pool.shutdown()
+        global_sandbox_pool = None
+
+def get_sandbox_stats() -> dict:
+    pool = global_sandbox_pool
+    return pool.stats() if pool is not None and pool.running else {}
+
+def execute_agent_code(python_code: str, cancel_event=None, snapshot: DatasetSnapshot = None, working_rows=None) -> dict:
+    """
+    Runs generated code and returns its result; `result["timings"]` breaks the
+    call down into sandbox wait, exec, fig.to_json() and IPC seconds.
+    `working_rows` (row positions in `df`) are exposed to the code as `df_prev`.
+    The code always runs against `snapshot` (the version the request pinned):
+    pool workers hold the live version, so when a reload replaced it since,
+    the code runs in-process on the pinned frames instead.
+    `cancel_event` kills a pooled execution; in-process it is only checked
+    before the run starts.
+    """
+    start = time.perf_counter()
+    try:
+        snapshot = snapshot or get_snapshot()
+        inputs = sandbox_inputs(snapshot)
+    except Exception as e:
+        return {"error": f"Failed to load files: {str(e)}"}
+
+    # 🧪 Isolated worker process with time / memory limits when the pool is running
+    pool = global_sandbox_pool
+    result = None
+    if pool is not None and pool.running:
+        result = pool.execute(python_code, cancel_event=cancel_event, options={"working_rows": working_rows}, version=snapshot.fingerprint)
+        if result is None:
+            logger.info("📦 Dataset reloaded mid-request. Executing on the pinned version in-process.")
+    pooled = result is not None
+    if result is None and cancel_event is not None and cancel_event.is_set():
+        # In-process code can't be interrupted once started, so don't start it for a request that is gone
+        result = {"error": "Execution cancelled.", "failed_code": python_code}
+    elif result is None:
+        # No pool (or a superseded version): same views and pandas settings as a worker, scoped to this run
+        result = _sandbox_run(python_code, *inputs, working_rows=working_rows)
+
+    timings = result.setdefault("timings", {})
+    accounted = sum(timings.values())
+    if pooled:
+        timings["ipc"] = max(time.perf_counter() - start - accounted, 0.0)
+    return result
@@ -0,0 +1,332 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+import pandas as pd
+from app.core.config import settings
+from app.services.aggregates import AggregateEngine
+from app.services.part_costs import PartCostResolver
+from app.services.search_index import build_indexes
+from app.services.snapshot_cache import load_dataset
+
+logger = logging.getLogger(__name__)
+
+
+class DatasetSnapshot:
+    """
+    One consistent, immutable generation of the datasets and everything
+    derived from them. Requests hold on to the snapshot they started with,
+    so a reload swapping in a newer one never changes data under them.
+    """
+
+    def __init__(self, version: int, frames: dict, indexes: dict, aggregates: AggregateEngine, part_costs: PartCostResolver,
+                 sources: dict, fingerprint: str, kind: str, timings: dict, memory: dict = None):
+        self.version = version
+        self.frames = frames
+        self.indexes = indexes
+        self.aggregates = aggregates
+        self.part_costs = part_costs
+        self.sources = sources
+        self.fingerprint = fingerprint
+        self.kind = kind
+        self.timings = timings
+        self.memory = memory or {}
+        self.loaded_at = time.time()
+
+    @property
+    def df(self) -> pd.DataFrame:
+        return self.frames["warranty"]
+
+    @property
+    def df_kb(self) -> pd.DataFrame:
+        return self.frames["kb"]
+
+    @property
+    def df_cost(self) -> pd.DataFrame:
+        return self.frames["cost"]
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "fingerprint": self.fingerprint,
+            "kind": self.kind,
+            "loaded_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.loaded_at)),
+            "rows": {name: len(frame) for name, frame in self.frames.items()},
+            "timings": self.timings,
+            "memory": self.memory,
+            "part_costs": {"mentions": len(self.part_costs.table), "priced": round(self.part_costs.match_rate(), 3)},
+        }
+
+
+def _source_stat(path: str):
+    """(mtime_ns, size) of a source file, or None when it is missing."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _same_rows(old: pd.DataFrame, new: pd.DataFrame) -> bool:
+    """True when `new` starts with exactly the rows of `old` (same columns, same values)."""
+    if list(old.columns) != list(new.columns) or len(new) < len(old):
+        return False
+    try:
+        old_hash = pd.util.hash_pandas_object(old.astype(str), index=False).to_numpy()
+        new_hash = pd.util.hash_pandas_object(new.iloc[:len(old)].astype(str), index=False).to_numpy()
+    except Exception:
+        return False
+    return bool((old_hash == new_hash).all())
+
+
+class DatasetManager:
+    """
+    Owns the loaded datasets and hot-reloads them.
+
+    A watcher thread polls the configured source paths. When a file changes
+    (and has stopped changing), a new snapshot is built off the request path
+    and swapped in with a single reference assignment. Unchanged datasets and
+    their indexes are reused; when the warranty file only gained rows, the new
+    rows are appended to the existing indexes and cubes instead of rebuilding
+    them from scratch.
+    """
+
+    def __init__(self, datasets: dict, cleaning_version: int, indexed_columns: dict, watch_interval: float, compactor=None):
+        self.datasets = datasets
+        self.cleaning_version = cleaning_version
+        self.indexed_columns = indexed_columns
+        self.watch_interval = watch_interval
+        # compactor(name, df) -> (df, memory report or None), applied to every freshly loaded frame
+        self.compactor = compactor
+        self.reloads = 0
+        self.last_error = None
+        self._snapshot = None
+        self._version = 0
+        self._lock = threading.RLock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self._pending = None
+        self._failed = None
+        self._memory = {}
+
+    @property
+    def current(self) -> DatasetSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._publish(self._build(previous=None, changed=set(self.datasets)))
+                snapshot = self._snapshot
+        return snapshot
+
+    def _publish(self, snapshot: DatasetSnapshot):
+        self._snapshot = snapshot
+        logger.info(f"📦 Dataset version {snapshot.version} ({snapshot.kind}, {snapshot.fingerprint}) is live")
+
+    def publish_frames(self, frames: dict, fingerprint: str) -> DatasetSnapshot:
+        """Swaps in caller-supplied frames (benchmarks / tools); missing frames are kept."""
+        with self._lock:
+            previous = self.current
+            merged = {**previous.frames, **frames}
+            changed = {name for name in frames if frames[name] is not previous.frames.get(name)}
+            start = time.perf_counter()
+            indexes, aggregates, part_costs, derive_timings = self._derive(merged, previous, changed)
+            self._version += 1
+            snapshot = DatasetSnapshot(self._version, merged, indexes, aggregates, part_costs, previous.sources, fingerprint,
+                                       "replaced", {**derive_timings, "total_s": round(time.perf_counter() - start, 3)}, previous.memory)
+            self._publish(snapshot)
+            return snapshot
+
+    def restore(self, snapshot: DatasetSnapshot):
+        """Puts back an earlier snapshot (e.g. after `publish_frames`)."""
+        with self._lock:
+            self._publish(snapshot)
+
+    def _paths(self) -> dict:
+        return {name: getattr(settings, path_attr) for name, (path_attr, _) in self.datasets.items()}
+
+    def _fingerprint(self, sources: dict) -> str:
+        raw = "|".join(f"{name}:{os.path.abspath(path)}:{stat}" for name, (path, stat) in sorted(sources.items()))
+        return hashlib.sha1(f"{raw}|{self.cleaning_version}".encode("utf-8")).hexdigest()[:16]
+
+    def _derive(self, frames: dict, previous, changed: set):
+        """Indexes, cubes and the part cost table for `frames`, reusing whatever belongs to unchanged datasets."""
+        timings = {}
+        start = time.perf_counter()
+        indexes = {key: index for key, index in previous.indexes.items() if key[0] not in changed} if previous else {}
+        rebuild = {name: cols for name, cols in self.indexed_columns.items() if previous is None or name in changed}
+        if rebuild:
+            indexes.update(build_indexes({name: frames[name] for name in rebuild}, rebuild))
+        timings["indexes_s"] = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
+        if previous is not None and "warranty" not in changed:
+            aggregates = previous.aggregates
+        else:
+            aggregates = AggregateEngine(frames["warranty"])
+        timings["aggregates_s"] = round(time.perf_counter() - start, 3)
+
+        start = time.perf_counter()
+        if previous is not None and not changed & {"warranty", "cost"}:
+            part_costs = previous.part_costs
+        else:
+            part_costs = PartCostResolver(frames["cost"], frames["warranty"])
+        timings["part_costs_s"] = round(time.perf_counter() - start, 3)
+        return indexes, aggregates, part_costs, timings
+
+    def _load(self, name: str):
+        """Returns (frame, source entry, seconds) for one dataset, via its columnar snapshot when fresh."""
+        path_attr, loader = self.datasets[name]
+        path = getattr(settings, path_attr)
+        # Stat before reading: if the file changes mid-read, the next poll sees a newer stat
+        stat = _source_stat(path)
+        start = time.perf_counter()
+        df = load_dataset(name, path, loader, self.cleaning_version)
+        if self.compactor is not None:
+            df, report = self.compactor(name, df)
+            if report:
+                self._memory[name] = report
+                logger.info(f"🗜️ Compacted '{name}': {report['mb_before']} MB -> {report['mb_after']} MB")
+        return df, (path, stat), time.perf_counter() - start
+
+    def _build(self, previous, changed: set, loaded: dict = None) -> DatasetSnapshot:
+        """Loads the `changed` datasets (unless already in `loaded`) and derives a new snapshot."""
+        started = time.perf_counter()
+        frames = dict(previous.frames) if previous else {}
+        sources = dict(previous.sources) if previous else {}
+        timings = {}
+        loaded = loaded or {}
+
+        for name in self.datasets:
+            if name not in changed:
+                continue
+            frames[name], sources[name], seconds = loaded.get(name) or self._load(name)
+            timings[f"{name}_load_s"] = round(seconds, 3)
+
+        indexes, aggregates, part_costs, derive_timings = self._derive(frames, previous, changed)
+        timings.update(derive_timings)
+        timings["total_s"] = round(time.perf_counter() - started, 3)
+
+        self._version += 1
+        kind = "full" if previous is None or changed == set(self.datasets) else "partial"
+        return DatasetSnapshot(self._version, frames, indexes, aggregates, part_costs, sources, self._fingerprint(sources), kind, timings, dict(self._memory))
+
+    def _append(self, previous: DatasetSnapshot, new_df: pd.DataFrame, source: tuple, load_s: float):
+        """
+        Incremental path for a warranty file that only gained rows: the new
+        rows are indexed and aggregated on their own and merged into copies of
+        the previous structures (part texts already resolved are not
+        resolved again). Returns None when the file changed in any
+        other way (the caller rebuilds instead).
+        """
+        started = time.perf_counter()
+        old_df = previous.df
+        if len(new_df) <= len(old_df) or not _same_rows(old_df, new_df):
+            logger.info("📦 Warranty file changed beyond appended rows; rebuilding it.")
+            return None
+
+        start = time.perf_counter()
+        added = new_df.iloc[len(old_df):]
+        indexes = dict(previous.indexes)
+        for col in self.indexed_columns.get("warranty", []):
+            key = ("warranty", col)
+            if key in indexes:
+                indexes[key] = indexes[key].copy().extend(added[col], start=len(old_df))
+        aggregates = previous.aggregates.extend(added)
+        part_costs = previous.part_costs.extend(added)
+        derive_s = time.perf_counter() - start
+
+        frames = {**previous.frames, "warranty": new_df}
+        sources = {**previous.sources, "warranty": source}
+        timings = {
+            "warranty_load_s": round(load_s, 3),
+            "appended_rows": len(added),
+            "derive_s": round(derive_s, 3),
+            "total_s": round(time.perf_counter() - started, 3),
+        }
+        self._version += 1
+        return DatasetSnapshot(self._version, frames, indexes, aggregates, part_costs, sources, self._fingerprint(sources), "incremental", timings, dict(self._memory))
+
+    def changed_datasets(self) -> set:
+        """Names of datasets whose source file differs from the live snapshot."""
+        snapshot = self.current
+        paths = self._paths()
+        return {
+            name for name in self.datasets
+            if snapshot.sources.get(name) != (paths[name], _source_stat(paths[name]))
+        }
+
+    def reload(self, force: bool = False):
+        """
+        Rebuilds whatever changed (everything with `force`) and swaps it in.
+        Returns the new snapshot, or None when nothing changed.
+        """
+        with self._lock:
+            previous = self.current
+            changed = set(self.datasets) if force else self.changed_datasets()
+            if not changed:
+                return None
+            snapshot = None
+            loaded = {}
+            if not force and changed == {"warranty"}:
+                loaded["warranty"] = self._load("warranty")
+                snapshot = self._append(previous, *loaded["warranty"])
+            if snapshot is None:
+                snapshot = self._build(previous, changed, loaded)
+            self.reloads += 1
+            self._publish(snapshot)
+            return snapshot
+
+    def _poll(self):
+        changed = self.changed_datasets()
+        if not changed:
+            self._pending = None
+            return
+        paths = self._paths()
+        stats = tuple(_source_stat(paths[name]) for name in sorted(changed))
+        if stats == self._failed:
+            return
+        # Only reload once the file has stopped changing between two polls (editor / copy still writing)
+        if stats != self._pending:
+            self._pending = stats
+            return
+        try:
+            self.reload()
+            self.last_error = None
+            self._failed = None
+        except Exception as e:
+            logger.error(f"❌ Dataset reload failed, keeping version {self.current.version}: {e}", exc_info=True)
+            self.last_error = str(e)
+            self._failed = stats
+        self._pending = None
+
+    def _watch(self):
+        while not self._stop.wait(self.watch_interval):
+            try:
+                self._poll()
+            except Exception as e:
+                logger.error(f"❌ Dataset watcher error: {e}", exc_info=True)
+
+    def start_watching(self):
+        if self.watch_interval <= 0 or self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="kbot-dataset-watcher", daemon=True)
+        self._watcher.start()
+        logger.info(f"👀 Watching dataset files every {self.watch_interval:g}s")
+
+    def stop_watching(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def status(self) -> dict:
+        return {
+            **self.current.info(),
+            "watching": self._watcher is not None,
+            "watch_interval_s": self.watch_interval,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,256 @@
+import logging
+import math
+import re
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+PART_COLUMN = 'Spares / Part Replaced'
+MODEL_COLUMN = 'Model'
+ITEM_COLUMN = 'ITEM DESCRIPTION'
+PRICE_COLUMNS = ['UNIT PRICE', 'GROSS VALUE']
+
+# Columns of `df_part_cost`: one row per part mentioned in a claim, joinable to `df` on (part text, model)
+TABLE_COLUMNS = [PART_COLUMN, MODEL_COLUMN, 'PART', 'QTY', ITEM_COLUMN, 'UNIT PRICE', 'GROSS VALUE', 'TOTAL VALUE', 'MATCH SCORE', 'CANDIDATES']
+
+# A mention maps to a cost item only when this much of both sides' (IDF-weighted) words agree
+MIN_MATCH_SCORE = 0.65
+# Added when the claim's model (or a model named in the text) is one the cost item is for
+MODEL_BONUS = 0.1
+
+# Shorthand used in the claim sheets -> the words the cost list uses
+ABBREVIATIONS = {
+    "assly": ["assembly"], "assy": ["assembly"], "asly": ["assembly"], "assembely": ["assembly"],
+    "del": ["delivery"], "dv": ["delivery", "valve"], "vlave": ["valve"], "vlv": ["valve"],
+    "sol": ["solenoid"], "rigs": ["ring"], "orings": ["oring"], "conrod": ["con", "rod"],
+}
+# Words that say nothing about which part it was
+STOP_TOKENS = {
+    "replaced", "replace", "replacing", "changed", "change", "new", "old", "nos", "no", "pcs", "qty",
+    "for", "with", "of", "the", "at", "to", "in", "on", "all", "etc", "type", "fitted", "done", "site",
+}
+
+_SPLIT_RE = re.compile(r"[,;&+\n]|\band\b", re.I)
+_REASON_RE = re.compile(r"\bdue to\b.*$", re.I)
+_QTY_RE = re.compile(r"(?<![\d.])(\d{1,2})\s*(?:nos?|pcs?)\b", re.I)
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Compressor model designators: KC, KCX, KC12, KCX4, PC2 ... (also glued on, as in "ASSEMBLYKC4")
+_MODEL_RE = re.compile(r"^(kcx?|pcx?)(\d*)$")
+_GLUED_MODEL_RE = re.compile(r"^([a-z]{4,}?)((?:kcx?|pcx?)\d*)$")
+# Quantities glued on: "piston1nos", "set2"
+_GLUED_COUNT_RE = re.compile(r"^([a-z]{2,}?)\d+(?:nos?|pcs?)?$")
+
+
+def _singular(token: str) -> str:
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def _tokens(text: str, vocabulary=()) -> tuple:
+    """(part words, model designators) of one part mention."""
+    words, models = [], set()
+    for token in _TOKEN_RE.findall(str(text).lower()):
+        glued = _GLUED_MODEL_RE.match(token)
+        count = _GLUED_COUNT_RE.match(token) if not glued and not _MODEL_RE.match(token) else None
+        pieces = [glued.group(1), glued.group(2)] if glued else [count.group(1)] if count else [token]
+        for piece in pieces:
+            if _MODEL_RE.match(piece):
+                models.add(piece)
+                continue
+            for word in ABBREVIATIONS.get(piece, [piece]):
+                word = _singular(word)
+                if word not in STOP_TOKENS and not word.isdigit() and len(word) > 1:
+                    words.append(word)
+    # "crank shaft" / "fly wheel" are one word in the cost list
+    merged = []
+    for word in words:
+        if merged and merged[-1] + word in vocabulary:
+            merged[-1] += word
+        else:
+            merged.append(word)
+    return tuple(dict.fromkeys(merged)), models
+
+
+def _model_tags(model) -> set:
+    """KCX4 -> {"kcx4", "kcx"}: a claim's model matches both model-specific and family-wide items."""
+    if model is None or (isinstance(model, float) and math.isnan(model)):
+        return set()
+    found = _MODEL_RE.match(str(model).strip().lower())
+    return {found.group(0), found.group(1)} if found else set()
+
+
+def split_parts(values: pd.Series) -> pd.DataFrame:
+    """
+    One row per part mentioned in each claim text: "Replaced piston, liner
+    & 2 Nos ORV due to wear" -> "piston", "liner", "2 Nos ORV" (QTY 2).
+    Returns columns source (the original text), PART and QTY.
+    """
+    texts = pd.Series(pd.unique(values.dropna().astype(str)), dtype=object)
+    mentions = texts.str.replace(_REASON_RE, "", regex=True).str.split(_SPLIT_RE, regex=True)
+    parts = pd.DataFrame({"source": texts, "PART": mentions}).explode("PART")
+    parts["PART"] = parts["PART"].str.strip(" .-:/")
+    parts = parts[parts["PART"].str.len() > 0]
+    qty = parts["PART"].str.extract(_QTY_RE, expand=False)
+    parts["QTY"] = pd.to_numeric(qty, errors="coerce").fillna(1).clip(1, 20).astype("int64")
+    return parts.reset_index(drop=True)
+
+
+class PartCostResolver:
+    """
+    Maps the free-text 'Spares / Part Replaced' entries of the claims to
+    rows of the cost list, once per dataset version.
+
+    Both sides are normalized (case, shorthand such as "assly" / "del" /
+    "DV", plurals, model designators) and every distinct (claim text, model)
+    is split into part mentions. Mentions are scored against all cost items
+    at once: an IDF-weighted Dice overlap of the part words, as one matrix
+    product, plus a bonus when the item is for the claim's model. The best
+    item above MIN_MATCH_SCORE wins (many mentions -> one item).
+
+    `table` is the resolved mapping, exposed to generated code as
+    `df_part_cost`; `lookup` resolves arbitrary text the same way.
+    """
+
+    def __init__(self, df_cost: pd.DataFrame, df_claims: pd.DataFrame = None):
+        items = df_cost[df_cost[ITEM_COLUMN].notna()] if ITEM_COLUMN in df_cost.columns else df_cost.iloc[0:0]
+        self.items = items[[ITEM_COLUMN] + [c for c in PRICE_COLUMNS if c in items.columns]].reset_index(drop=True)
+        item_tokens = [_tokens(text) for text in self.items[ITEM_COLUMN]]
+
+        self.vocabulary = {word: i for i, word in enumerate(sorted({w for words, _ in item_tokens for w in words}))}
+        document_frequency = np.zeros(len(self.vocabulary))
+        self._item_words = np.zeros((len(self.items), len(self.vocabulary)))
+        for row, (words, _) in enumerate(item_tokens):
+            for word in words:
+                self._item_words[row, self.vocabulary[word]] = 1.0
+        document_frequency += self._item_words.sum(axis=0)
+        # Rare words (ELEMENT, SEAL) decide a match; words on many items (ASSEMBLY) barely count
+        self._idf = np.log1p(len(self.items) / np.maximum(document_frequency, 1.0))
+        self._unknown_idf = math.log1p(len(self.items)) if len(self.items) else 1.0
+        self._item_weight = self._item_words @ self._idf
+        self._item_models = [models for _, models in item_tokens]
+        self._item_value = self.items["GROSS VALUE"].to_numpy(dtype="float64") if "GROSS VALUE" in self.items.columns else np.zeros(len(self.items))
+
+        self.table = self._empty_table()
+        if df_claims is not None:
+            self.table = self.resolve_claims(df_claims)
+        logger.info(f"💰 Resolved {self.table['PART'].nunique() if len(self.table) else 0} part mentions against "
+                    f"{len(self.items)} cost items ({self.match_rate():.0%} priced)")
+
+    @staticmethod
+    def _empty_table() -> pd.DataFrame:
+        return pd.DataFrame({col: pd.Series(dtype="float64" if col in ('UNIT PRICE', 'GROSS VALUE', 'TOTAL VALUE', 'MATCH SCORE') else object)
+                             for col in TABLE_COLUMNS})
+
+    def _score(self, mentions: list, models: list):
+        """
+        Per mention: best item index, its score and the mask of items tied
+        for best. A tie between differently priced items (e.g. "crankshaft"
+        on a model the cost list has no crankshaft for) is left unresolved
+        (-1) rather than guessed.
+        """
+        n = len(mentions)
+        if n == 0 or len(self.items) == 0:
+            return np.full(n, -1), np.zeros(n), np.zeros((n, len(self.items)), dtype=bool)
+        words = np.zeros((n, len(self.vocabulary)))
+        unknown = np.zeros(n)
+        model_match = np.zeros((n, len(self.items)))
+        for row, (mention, claim_model) in enumerate(zip(mentions, models)):
+            mention_words, mention_models = _tokens(mention, self.vocabulary)
+            for word in mention_words:
+                column = self.vocabulary.get(word)
+                if column is None:
+                    unknown[row] += self._unknown_idf
+                else:
+                    words[row, column] = 1.0
+            tags = mention_models | _model_tags(claim_model)
+            if tags:
+                model_match[row] = [bool(tags & item_models) for item_models in self._item_models]
+
+        overlap = (words * self._idf) @ self._item_words.T
+        mention_weight = words @ self._idf + unknown
+        dice = 2 * overlap / np.maximum(mention_weight[:, None] + self._item_weight[None, :], 1e-9)
+        score = np.where(dice >= MIN_MATCH_SCORE, dice + MODEL_BONUS * model_match, 0.0)
+
+        best = score.argmax(axis=1)
+        best_score = score[np.arange(n), best]
+        tied = np.isclose(score, best_score[:, None]) & (score > 0)
+        tied_values = np.where(tied, self._item_value[None, :], np.nan)
+        ambiguous = np.nanmax(np.nan_to_num(tied_values, nan=-np.inf), axis=1) != np.nanmin(np.nan_to_num(tied_values, nan=np.inf), axis=1)
+        best = np.where((best_score > 0) & ~(ambiguous & (tied.sum(axis=1) > 1)), best, -1)
+        return best, np.round(np.minimum(dice[np.arange(n), best], 1.0) * (best >= 0), 3), tied
+
+    def _resolve(self, parts: pd.DataFrame):
+        """Adds the matched cost item, prices and score to (…, PART, QTY, Model) rows; also returns the tie mask."""
+        best, score, tied = self._score(parts["PART"].tolist(), parts[MODEL_COLUMN].tolist())
+        matched = best >= 0
+        resolved = parts.copy()
+        for col in [ITEM_COLUMN] + PRICE_COLUMNS:
+            values = self.items[col].to_numpy(dtype=object if col == ITEM_COLUMN else "float64") if col in self.items.columns else None
+            if values is None:
+                resolved[col] = np.nan
+            elif col == ITEM_COLUMN:
+                resolved[col] = np.where(matched, values[np.maximum(best, 0)], None)
+            else:
+                resolved[col] = np.where(matched, values[np.maximum(best, 0)], np.nan)
+        resolved["TOTAL VALUE"] = resolved["GROSS VALUE"] * resolved["QTY"]
+        resolved["MATCH SCORE"] = np.where(matched, score, np.nan)
+        resolved["CANDIDATES"] = tied.sum(axis=1)
+        return resolved, tied
+
+    def resolve_claims(self, df_claims: pd.DataFrame) -> pd.DataFrame:
+        """The mapping table for every distinct (part text, model) in `df_claims`."""
+        if PART_COLUMN not in df_claims.columns:
+            return self._empty_table()
+        models = df_claims[MODEL_COLUMN].astype(object) if MODEL_COLUMN in df_claims.columns else pd.Series(None, index=df_claims.index, dtype=object)
+        pairs = pd.DataFrame({PART_COLUMN: df_claims[PART_COLUMN].astype(object), MODEL_COLUMN: models}).dropna(subset=[PART_COLUMN])
+        pairs = pairs.drop_duplicates(ignore_index=True)
+        pairs[PART_COLUMN] = pairs[PART_COLUMN].astype(str)
+        parts = split_parts(pairs[PART_COLUMN])
+        rows = pairs.merge(parts, left_on=PART_COLUMN, right_on="source").drop(columns="source")
+        return self._resolve(rows)[0][TABLE_COLUMNS].reset_index(drop=True)
+
+    def extend(self, rows: pd.DataFrame) -> "PartCostResolver":
+        """
+        Returns a resolver whose table also covers `rows` (appended claims).
+        Only (part text, model) pairs not seen before are resolved; this one
+        is left as is.
+        """
+        added = self.resolve_claims(rows)
+        if len(self.table):
+            known = pd.MultiIndex.from_frame(self.table[[PART_COLUMN, MODEL_COLUMN]].astype(str))
+            added = added[~pd.MultiIndex.from_frame(added[[PART_COLUMN, MODEL_COLUMN]].astype(str)).isin(known)]
+        extended = PartCostResolver.__new__(PartCostResolver)
+        extended.__dict__.update(self.__dict__)
+        extended.table = pd.concat([self.table, added], ignore_index=True) if len(added) else self.table
+        return extended
+
+    def lookup(self, text: str, model: str = None) -> list:
+        """
+        Resolves free text ("Replaced shaft seal assly & DV") to cost items,
+        one dict per part mentioned: part, qty, item, unit_price,
+        gross_value, score (item / prices are None when nothing matched) and
+        candidates (the tied items when the match was ambiguous).
+        """
+        parts = split_parts(pd.Series([text]))
+        parts[MODEL_COLUMN] = model
+        resolved, tied = self._resolve(parts)
+        names = self.items[ITEM_COLUMN].tolist()
+        results = []
+        for i, row in enumerate(resolved.to_dict("records")):
+            matched = row[ITEM_COLUMN] is not None
+            results.append({
+                "part": row["PART"],
+                "qty": int(row["QTY"]),
+                "item": row[ITEM_COLUMN],
+                "unit_price": float(row["UNIT PRICE"]) if matched and pd.notna(row["UNIT PRICE"]) else None,
+                "gross_value": float(row["GROSS VALUE"]) if matched and pd.notna(row["GROSS VALUE"]) else None,
+                "score": float(row["MATCH SCORE"]) if matched else None,
+                "candidates": [names[j] for j in np.flatnonzero(tied[i])] if tied[i].sum() > 1 else [],
+            })
+        return results
+
+    def match_rate(self) -> float:
+        """Share of part mentions in the table that resolved to a cost item."""
+        return float(self.table[ITEM_COLUMN].notna().mean()) if len(self.table) else 0.0
@@ -0,0 +1,260 @@
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from app.core.metrics import SANDBOX_RECYCLED
+
+logger = logging.getLogger(__name__)
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def fork_supported() -> bool:
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def _read_rss_mb(pid: int):
+    """Resident set size of `pid` in MB (Linux /proc only; None elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / (1024 * 1024)
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _read_private_mb(pid: int):
+    """
+    Unique set size of `pid` in MB: its private pages only, so the frames it
+    still shares copy-on-write with the parent don't count (Linux 4.14+
+    smaps_rollup; None elsewhere).
+    """
+    try:
+        private_kb = 0
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                    private_kb += int(line.split()[1])
+        return private_kb / 1024
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _worker_main(conn, runner, frames_provider, initializer):
+    """
+    Worker loop. The dataframes were loaded by the parent before the fork, so
+    they are shared copy-on-write with every other worker instead of re-read.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent owns shutdown
+    if initializer is not None:
+        initializer()
+    frames = frames_provider()
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+        code, options = message
+        try:
+            result = runner(code, *frames, **options)
+        except BaseException as e:
+            result = {"error": f"{type(e).__name__}: {e}", "failed_code": code}
+        try:
+            conn.send(result)
+        except Exception as e:
+            conn.send({"error": f"Sandbox result could not be returned: {e}", "failed_code": code})
+
+
+class _Worker:
+    def __init__(self, ctx, runner, frames_provider, initializer, version):
+        parent_conn, child_conn = ctx.Pipe()
+        self.conn = parent_conn
+        self.version = version
+        self.tasks = 0
+        self.baseline_rss_mb = None
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, runner, frames_provider, initializer),
+            daemon=True,
+            name="kbot-sandbox",
+        )
+        self.process.start()
+        child_conn.close()
+
+    def memory_mb(self):
+        """
+        Memory this worker holds on its own: its private pages, or without
+        smaps_rollup, RSS above what it had right after the fork (pages
+        inherited from the parent are resident but not the worker's doing).
+        """
+        private = _read_private_mb(self.process.pid)
+        if private is not None:
+            return private
+        rss = _read_rss_mb(self.process.pid)
+        if rss is None:
+            return None
+        if self.baseline_rss_mb is None:
+            self.baseline_rss_mb = rss
+        return rss - self.baseline_rss_mb
+
+    def stop(self, timeout: float = 1.0):
+        try:
+            if self.process.is_alive():
+                self.conn.send(None)
+                self.process.join(timeout)
+        except (OSError, BrokenPipeError):
+            pass
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(1.0)
+        self.conn.close()
+
+
+class SandboxPool:
+    """
+    Pre-forked worker processes that run generated pandas code.
+
+    Each execution gets a wall-clock limit and a memory limit on what the
+    worker allocated itself (see _Worker.memory_mb); a worker that breaches
+    either (or crashes) is killed and replaced. Workers are also
+    recycled after `max_tasks` executions, or when `version_provider()`
+    reports that the loaded datasets changed since the worker was forked.
+    """
+
+    def __init__(self, runner, frames_provider, version_provider, size: int,
+                 timeout: float, max_rss_mb: float, max_tasks: int, initializer=None):
+        self.runner = runner
+        self.frames_provider = frames_provider
+        self.initializer = initializer
+        self.version_provider = version_provider
+        self.size = size
+        self.timeout = timeout
+        self.max_rss_mb = max_rss_mb
+        self.max_tasks = max_tasks
+        self.recycled = 0
+        self._ctx = multiprocessing.get_context("fork")
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self):
+        # Make sure the data is in memory before forking so workers inherit it
+        self.frames_provider()
+        with self._lock:
+            for _ in range(self.size):
+                worker = self._spawn()
+                self._idle.put(worker)
+            self._running = True
+        logger.info(f"🧪 Sandbox pool started with {self.size} workers")
+
+    def shutdown(self):
+        with self._lock:
+            self._running = False
+            for worker in self._workers:
+                worker.stop()
+            self._workers.clear()
+        while not self._idle.empty():
+            self._idle.get_nowait()
+
+    def _spawn(self):
+        worker = _Worker(self._ctx, self.runner, self.frames_provider, self.initializer, self.version_provider())
+        self._workers.append(worker)
+        return worker
+
+    def _replace(self, worker, reason: str):
+        logger.info(f"♻️ Recycling sandbox worker {worker.process.pid}: {reason}")
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            worker.kill()
+            if not self._running:
+                return worker
+            self.recycled += 1
+            SANDBOX_RECYCLED.inc()
+            return self._spawn()
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._workers),
+            "idle": self._idle.qsize(),
+            "recycled": self.recycled,
+        }
+
+    def execute(self, python_code: str, cancel_event: threading.Event = None, options: dict = None, version=None):
+        """
+        Runs `python_code` on a free worker (`options` are passed on to the
+        runner as keyword arguments). Blocks the calling thread (never
+        the event loop: callers use asyncio.to_thread). Setting `cancel_event`
+        kills the execution early. `timings["sandbox_wait"]` is the time spent
+        waiting for a free worker.
+        `version` is the dataset version the caller pinned. Workers only hold
+        the live one, so when they differ None is returned and the caller
+        runs the code against its own data.
+        """
+        if version is not None and version != self.version_provider():
+            return None
+        start = time.monotonic()
+        try:
+            worker = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            return {"error": "Sandbox is busy: no worker became free in time.", "failed_code": python_code,
+                    "timings": {"sandbox_wait": time.monotonic() - start}}
+        waited = time.monotonic() - start
+
+        try:
+            if not worker.process.is_alive():
+                worker = self._replace(worker, "worker died")
+            elif worker.tasks >= self.max_tasks:
+                worker = self._replace(worker, f"served {worker.tasks} executions")
+            elif worker.version != self.version_provider():
+                worker = self._replace(worker, "dataset version changed")
+            if version is not None and worker.version != version:
+                # A reload landed while this request waited for the worker
+                return None
+
+            worker.memory_mb()  # takes the post-fork baseline when only RSS is available
+            worker.conn.send((python_code, options or {}))
+            sent = time.monotonic()
+            deadline = sent + self.timeout
+            failure = None
+
+            while not worker.conn.poll(0.02):
+                if not worker.process.is_alive():
+                    failure = "Sandbox worker crashed while executing the code."
+                elif time.monotonic() > deadline:
+                    failure = f"Execution timed out after {self.timeout:g}s. Simplify the computation."
+                elif cancel_event is not None and cancel_event.is_set():
+                    failure = "Execution cancelled."
+                else:
+                    used = worker.memory_mb()
+                    if used is not None and used > self.max_rss_mb:
+                        failure = f"Execution exceeded the {self.max_rss_mb:g} MB memory limit. Work on fewer rows or columns."
+                if failure:
+                    worker = self._replace(worker, failure)
+                    return {"error": failure, "failed_code": python_code,
+                            "timings": {"sandbox_wait": waited, "exec": time.monotonic() - sent}}
+
+            result = worker.conn.recv()
+            worker.tasks += 1
+            result.setdefault("timings", {})["sandbox_wait"] = waited
+            return result
+        except (EOFError, OSError) as e:
+            worker = self._replace(worker, f"pipe error: {e}")
+            return {"error": "Sandbox worker crashed while executing the code.", "failed_code": python_code}
+        finally:
+            if self._running:
+                self._idle.put(worker)
+            else:
+                worker.stop()
@@ -0,0 +1,177 @@
+import logging
+import math
+import re
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 🚀 Ignore common filler words so they don't bloat the search
+STOP_WORDS = {"how", "many", "what", "are", "the", "for", "and", "with", "from", "based", "column", "tell", "about", "were", "logged", "this", "that", "year", "date", "which", "who", "why"}
+# Generic request words that appear in questions but carry no retrieval signal
+STOP_WORDS |= {"issue", "issues", "problem", "problems", "related", "show", "list", "give", "all", "any", "cost", "costs", "price", "value", "total", "plot", "graph", "chart", "top", "most", "count", "number"}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_KEYWORD_CACHE_SIZE = 4096
+
+
+def normalize_text(value) -> str:
+    """Lowercases and treats hyphens / underscores as word breaks ("oil-leak" == "oil leak")."""
+    return str(value).lower().replace('-', ' ').replace('_', ' ')
+
+
+def tokenize(value) -> list:
+    return _TOKEN_RE.findall(normalize_text(value))
+
+
+def extract_keywords(user_query: str) -> list:
+    """Query keywords in order, without filler words or very short tokens."""
+    keywords = []
+    for token in tokenize(user_query):
+        if len(token) > 2 and token not in STOP_WORDS and token not in keywords:
+            keywords.append(token)
+    return keywords
+
+
+class TextIndex:
+    """
+    Inverted index over one text column.
+
+    Every cell contributes its tokens plus each adjacent pair joined together,
+    so "oil leakage" is also indexed as "oilleakage". A keyword matches every
+    indexed term that contains it (the same substring semantics as the old
+    row-wise scan), but the scan runs over the vocabulary instead of the rows,
+    and results per keyword are cached.
+    """
+
+    def __init__(self, values: pd.Series, start: int = 0):
+        self.size = 0
+        self._postings = {}
+        self._vocab = []
+        self._keyword_cache = {}
+        self.extend(values, start=start)
+
+    def extend(self, values: pd.Series, start: int = None):
+        """Indexes additional rows. Positions continue from the current size unless `start` is given."""
+        position = self.size if start is None else start
+        postings = {}
+        # Repeated cells (categoricals, stock phrases) are tokenized once
+        terms_by_value = {}
+        for offset, value in enumerate(values.tolist()):
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                continue
+            terms = terms_by_value.get(value)
+            if terms is None:
+                tokens = tokenize(value)
+                terms = set(tokens)
+                terms.update(a + b for a, b in zip(tokens, tokens[1:]))
+                terms_by_value[value] = terms
+            for term in terms:
+                postings.setdefault(term, []).append(position + offset)
+
+        for term, rows in postings.items():
+            rows = np.asarray(rows, dtype=np.int64)
+            if term in self._postings:
+                self._postings[term] = np.concatenate([self._postings[term], rows])
+            else:
+                self._postings[term] = rows
+                self._vocab.append(term)
+
+        self.size = max(self.size, position + len(values))
+        self._keyword_cache.clear()
+        return self
+
+    def copy(self) -> "TextIndex":
+        """Independent copy to extend while readers keep using this one (postings arrays are shared, never mutated)."""
+        clone = TextIndex.__new__(TextIndex)
+        clone.size = self.size
+        clone._postings = dict(self._postings)
+        clone._vocab = list(self._vocab)
+        clone._keyword_cache = {}
+        return clone
+
+    def lookup(self, keyword: str) -> np.ndarray:
+        """
+        Sorted row positions whose cell contains `keyword`. A plural keyword
+        also matches its singular ("seals" finds "seal" and "sealing").
+        """
+        cached = self._keyword_cache.get(keyword)
+        if cached is not None:
+            return cached
+
+        stem = keyword[:-1] if len(keyword) > 3 and keyword.endswith("s") and not keyword.endswith("ss") else keyword
+        matches = [self._postings[term] for term in self._vocab if stem in term]
+        if not matches:
+            rows = np.empty(0, dtype=np.int64)
+        elif len(matches) == 1:
+            rows = matches[0]
+        else:
+            rows = np.unique(np.concatenate(matches))
+
+        if len(self._keyword_cache) >= _KEYWORD_CACHE_SIZE:
+            self._keyword_cache.clear()
+        self._keyword_cache[keyword] = rows
+        return rows
+
+    def score(self, keywords: list, weight: float = 1.0):
+        """
+        Returns (rows, scores) for every row matching at least one keyword.
+        Each matched keyword adds `weight` plus up to half of it again for
+        rarity (IDF), so a row matching more keywords always outranks one
+        matching fewer, and rarer keywords break the ties.
+        """
+        parts, weights = [], []
+        max_idf = math.log(1 + max(self.size, 1))
+        for keyword in keywords:
+            rows = self.lookup(keyword)
+            if len(rows):
+                idf = math.log(1 + self.size / len(rows)) / max_idf
+                parts.append(rows)
+                weights.append(np.full(len(rows), weight * (1.0 + 0.5 * idf)))
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        rows, inverse = np.unique(np.concatenate(parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights))
+        return rows, scores
+
+
+def rank_rows(indexes: list, keywords: list, limit: int, prefer_recent: bool = False) -> np.ndarray:
+    """
+    Combines one or more (TextIndex, weight) pairs and returns the best `limit`
+    row positions. Ties are broken by position: newest rows first when
+    `prefer_recent`, otherwise original order.
+    """
+    all_rows, all_scores = [], []
+    for index, weight in indexes:
+        rows, scores = index.score(keywords, weight)
+        all_rows.append(rows)
+        all_scores.append(scores)
+    if not all_rows:
+        return np.empty(0, dtype=np.int64)
+
+    rows, inverse = np.unique(np.concatenate(all_rows), return_inverse=True)
+    if not len(rows):
+        return rows
+    scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+
+    tie_break = rows if prefer_recent else -rows
+    order = np.lexsort((-tie_break, -scores))
+    return rows[order[:limit]]
+
+
+def build_indexes(frames: dict, columns: dict) -> dict:
+    """
+    Builds {(frame_name, column): TextIndex} for every configured column that
+    exists, e.g. columns={"warranty": ["Nature of complaint", ...]}.
+    """
+    indexes = {}
+    for frame_name, cols in columns.items():
+        frame = frames.get(frame_name)
+        if frame is None:
+            continue
+        for col in cols:
+            if col in frame.columns:
+                indexes[(frame_name, col)] = TextIndex(frame[col])
+    logger.info(f"🗂️ Built search indexes for {len(indexes)} columns")
+    return indexes
@@ -0,0 +1,107 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Questions of the running conversation kept for the follow-up prompt
+MAX_HISTORY = 3
+
+
+class SessionState:
+    """
+    The working set of one conversation: recent questions, the code that
+    answered the last one, its retrieval results, and the row positions of
+    the filtered `df` it worked on (rebuilt as `df_prev` for a follow-up, so
+    no dataframe copy is kept per session). Tied to one dataset version.
+    """
+
+    def __init__(self, questions: list, code: str, answer: str, retrieval: dict, rows: Optional[np.ndarray], fingerprint: str):
+        self.questions = questions[-MAX_HISTORY:]
+        self.code = code
+        self.answer = answer
+        self.retrieval = retrieval
+        self.rows = rows
+        self.fingerprint = fingerprint
+        self.touched = time.time()
+        self.nbytes = (
+            sum(len(q) for q in self.questions) + len(code) + len(answer or "")
+            + len(json.dumps(retrieval, default=str))
+            + (rows.nbytes if rows is not None else 0)
+        )
+
+
+class SessionStore:
+    """
+    Per (user_id, session_id) working sets, so a session id only ever resolves
+    for the user that created it. Bounded three ways: entries idle for longer
+    than `idle_seconds` expire, and the least recently used are evicted
+    beyond `max_sessions` entries or `max_bytes` in total.
+    """
+
+    def __init__(self, max_sessions: int, max_bytes: int, idle_seconds: float):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.bytes = 0
+        self.evictions = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, session_id: str, fingerprint: str = None) -> Optional[SessionState]:
+        """The session's working set, or None if it never existed, went idle, or was built on other data."""
+        key = (user_id, session_id)
+        with self._lock:
+            state = self._sessions.get(key)
+            if state is None:
+                return None
+            now = time.time()
+            if now - state.touched > self.idle_seconds or (fingerprint is not None and state.fingerprint != fingerprint):
+                self._drop(key)
+                return None
+            state.touched = now
+            self._sessions.move_to_end(key)
+            return state
+
+    def put(self, user_id: str, session_id: str, state: SessionState):
+        if self.max_sessions <= 0 or state.nbytes > self.max_bytes:
+            return
+        key = (user_id, session_id)
+        with self._lock:
+            self._drop(key)
+            self._sessions[key] = state
+            self.bytes += state.nbytes
+            self._evict(time.time())
+
+    def clear(self, user_id: str, session_id: str) -> bool:
+        with self._lock:
+            return self._drop((user_id, session_id))
+
+    def _drop(self, key) -> bool:
+        state = self._sessions.pop(key, None)
+        if state is None:
+            return False
+        self.bytes -= state.nbytes
+        return True
+
+    def _evict(self, now: float):
+        # Oldest first: idle sessions, then whatever is over the count / memory caps
+        while self._sessions:
+            key, state = next(iter(self._sessions.items()))
+            idle = now - state.touched > self.idle_seconds
+            if not (idle or len(self._sessions) > self.max_sessions or self.bytes > self.max_bytes):
+                break
+            self._drop(key)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"sessions": len(self._sessions), "bytes": self.bytes, "evictions": self.evictions}
+
+
+session_store = SessionStore(settings.SESSION_MAX_ENTRIES, int(settings.SESSION_MAX_MB * 2**20), settings.SESSION_IDLE_SECONDS)
@@ -0,0 +1,157 @@
+import argparse
+import hashlib
+import logging
+import os
+import time
+import pandas as pd
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 🚀 Arrow is optional: without it we silently fall back to pd.read_excel
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+except ImportError:  # pragma: no cover - depends on the deployment image
+    pa = None
+    pa_ipc = None
+
+SNAPSHOT_SUFFIX = ".arrow"
+
+
+def snapshot_key(source_path: str, cleaning_version: int) -> str:
+    """
+    Builds the cache key for a source workbook. Any change to the file
+    (path, mtime, size) or to the cleaning code version produces a new key.
+    """
+    stat = os.stat(source_path)
+    raw = f"{os.path.abspath(source_path)}|{stat.st_mtime_ns}|{stat.st_size}|{cleaning_version}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def snapshot_path(name: str, key: str) -> str:
+    return os.path.join(settings.SNAPSHOT_DIR, f"{name}-{key}{SNAPSHOT_SUFFIX}")
+
+
+def snapshots_available() -> bool:
+    return settings.SNAPSHOT_ENABLED and pa is not None
+
+
+def read_snapshot(path: str):
+    """
+    Memory-maps an Arrow IPC snapshot. Numeric columns without nulls are
+    handed to pandas without copying; text columns are materialised once.
+    """
+    with pa.memory_map(path, "r") as source:
+        table = pa_ipc.open_file(source).read_all()
+    df = table.to_pandas(split_blocks=True)
+
+    # Arrow infers types for object columns (e.g. a date column with blanks) and
+    # uses None for nulls; restore what pd.read_excel would have produced.
+    pandas_meta = table.schema.pandas_metadata or {}
+    for col_meta in pandas_meta.get("columns", []):
+        col = col_meta.get("name")
+        if col in df.columns and col_meta.get("numpy_type") == "object":
+            series = df[col] if df[col].dtype == object else df[col].astype(object)
+            df[col] = series.where(series.notna(), float("nan"))
+    return df
+
+
+def write_snapshot(name: str, key: str, df: pd.DataFrame) -> str:
+    """
+    Writes the cleaned dataframe atomically (temp file + rename) and removes
+    any older snapshot of the same dataset.
+    """
+    os.makedirs(settings.SNAPSHOT_DIR, exist_ok=True)
+    path = snapshot_path(name, key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+
+    table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa_ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+    for entry in os.listdir(settings.SNAPSHOT_DIR):
+        if entry.startswith(f"{name}-") and entry.endswith(SNAPSHOT_SUFFIX) and entry != os.path.basename(path):
+            try:
+                os.remove(os.path.join(settings.SNAPSHOT_DIR, entry))
+            except OSError:
+                pass
+    return path
+
+
+def load_dataset(name: str, source_path: str, loader, cleaning_version: int, rebuild: bool = False) -> pd.DataFrame:
+    """
+    Returns the cleaned dataframe for `source_path`.
+    Uses the snapshot when it is fresh, otherwise runs `loader` (Excel parse +
+    cleaning) and refreshes the snapshot. Snapshot problems never break loading.
+    """
+    if not snapshots_available():
+        return loader(source_path)
+
+    key = None
+    try:
+        key = snapshot_key(source_path, cleaning_version)
+        path = snapshot_path(name, key)
+        if not rebuild and os.path.exists(path):
+            start = time.perf_counter()
+            df = read_snapshot(path)
+            logger.info(f"⚡ Loaded '{name}' snapshot in {(time.perf_counter() - start) * 1000:.1f} ms")
+            return df
+    except Exception as e:
+        # A corrupt or truncated file is rewritten below, so only this load pays for the parse
+        logger.warning(f"⚠️ Snapshot for '{name}' unreadable, re-parsing Excel: {e}")
+
+    df = loader(source_path)
+
+    if key is not None:
+        try:
+            write_snapshot(name, key, df)
+            logger.info(f"💾 Wrote '{name}' snapshot ({key})")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not write snapshot for '{name}': {e}")
+    return df
+
+
+def main(argv=None):
+    """
+    Deploy-time CLI: `python -m app.services.snapshot_cache [--force|--check]`
+    """
+    from app.services.data_parser import DATASETS, CLEANING_VERSION
+
+    parser = argparse.ArgumentParser(description="Prebuild columnar snapshots of the Excel datasets.")
+    parser.add_argument("--force", action="store_true", help="Rebuild snapshots even if they look fresh")
+    parser.add_argument("--check", action="store_true", help="Only report which snapshots are stale")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+
+    if pa is None:
+        print("pyarrow is not installed; snapshots are disabled.")
+        return 1
+
+    stale = 0
+    for name, (path_attr, loader) in DATASETS.items():
+        source_path = getattr(settings, path_attr)
+        key = snapshot_key(source_path, CLEANING_VERSION)
+        fresh = os.path.exists(snapshot_path(name, key))
+
+        if args.check:
+            print(f"{name:10s} {'fresh' if fresh else 'STALE'}  {snapshot_path(name, key)}")
+            stale += 0 if fresh else 1
+            continue
+
+        if fresh and not args.force:
+            print(f"{name:10s} already fresh, skipped")
+            continue
+        start = time.perf_counter()
+        df = loader(source_path)
+        write_snapshot(name, key, df)
+        print(f"{name:10s} {len(df):>7d} rows  {time.perf_counter() - start:6.2f}s  -> {snapshot_path(name, key)}")
+
+    return 1 if stale else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,8 +1,20 @@
+import asyncio
 import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.core.config import settings
+from app.core.compression import NonStreamingGZipMiddleware
+from app.core.metrics import registry, Gauge
+from app.core.audit import audit_log
 from app.api.routes import router as api_router
+from app.agents.llm_gate import llm_gate
+from app.agents import code_agent
+from app.agents.prompt_builder import prompt_stats
+from app.services.code_cache import code_cache
+from app.services.chart_gen import chart_cache, preload_plotting
+from app.services.session_store import session_store
+from app.services.data_parser import dataset_manager, get_snapshot, start_sandbox_pool, stop_sandbox_pool, get_sandbox_stats
 
 # 🔴 ADD THIS: Configure master console logging
 logging.basicConfig(
@@ -19,6 +31,9 @@ app = FastAPI(
     openapi_url=f"{settings.API_V1_STR}/openapi.json"
 )
 
+# 🗜️ gzip for JSON responses; SSE streams pass through so events are not held back
+app.add_middleware(NonStreamingGZipMiddleware, minimum_size=settings.GZIP_MIN_BYTES, compresslevel=settings.GZIP_LEVEL)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.BACKEND_CORS_ORIGINS,
@@ -29,6 +44,51 @@ app.add_middleware(
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+# 📈 Point-in-time gauges, read on every scrape
+registry.register(Gauge("kbot_llm_gate", "LLM calls in flight / waiting for a slot.",
+                        lambda: {(k,): v for k, v in llm_gate.stats.items() if k in ("active", "waiting")}, ["state"]))
+registry.register(Gauge("kbot_llm_circuit_open", "1 while a model provider's circuit breaker is open.",
+                        lambda: {(name,): int(state == "open") for name, state in getattr(code_agent.llm, "stats", dict)().items()}, ["provider"]))
+registry.register(Gauge("kbot_sandbox_workers", "Sandbox worker processes (total / idle).",
+                        lambda: {(k,): v for k, v in get_sandbox_stats().items() if k in ("workers", "idle")}, ["state"]))
+registry.register(Gauge("kbot_code_cache_entries", "Entries in the generated code cache.",
+                        lambda: {(): code_cache.stats()["entries"]}))
+registry.register(Gauge("kbot_chart_cache_bytes", "Bytes of rendered charts held in the chart cache.",
+                        lambda: {(): chart_cache.stats()["bytes"]}))
+registry.register(Gauge("kbot_sessions", "Conversation working sets held in memory (count / bytes).",
+                        lambda: {(k,): v for k, v in session_store.stats().items() if k in ("sessions", "bytes")}, ["state"]))
+registry.register(Gauge("kbot_audit_queue", "Audit records waiting for the background writer.",
+                        lambda: {(): audit_log.stats()["queued"]}))
+registry.register(Gauge("kbot_prompt_tokens_avg", "Average estimated prompt tokens per query type.",
+                        lambda: {(t,): e["avg_tokens"] for t, e in prompt_stats.snapshot().items()}, ["query_type"]))
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+async def warm_up_data():
+    # Load the datasets, search indexes and cubes before the first user request pays for it
+    await asyncio.to_thread(get_snapshot)
+    # Import plotly and its templates once; the forked workers inherit them
+    await asyncio.to_thread(preload_plotting)
+    # Fork the sandbox workers only after the data is in memory, so they share it
+    await asyncio.to_thread(start_sandbox_pool)
+    # Hot-reload the data files when they change
+    dataset_manager.start_watching()
+    if settings.AUDIT_ENABLED:
+        audit_log.start()
+
+@app.on_event("shutdown")
+async def stop_workers():
+    dataset_manager.stop_watching()
+    for provider in getattr(code_agent.llm, "providers", []):
+        await provider.aclose()
+    await asyncio.to_thread(stop_sandbox_pool)
+    # Write out the audit records still queued
+    await asyncio.to_thread(audit_log.stop)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
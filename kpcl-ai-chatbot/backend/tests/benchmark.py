@@ -0,0 +1,273 @@
+"""
+Offline benchmark / replay harness for the agent pipeline.
+
+Replays the golden questions (tests/golden_dataset.json) and the historical
+prompts from the agent decision log through `run_data_agent`, against a
+local stub model server that answers each question with its recorded code.
+Reports latency percentiles per pipeline stage, throughput per concurrency
+level, peak memory and answer correctness, optionally on a warranty dataset
+scaled up synthetically.
+
+    python tests/benchmark.py                               # golden set, concurrency 1 4 8
+    python tests/benchmark.py --source all --scale 1 10 100
+    python tests/benchmark.py --sandbox --delay 0.5 --json report.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+import conftest  # noqa: F401  (env + sys.path when run as a script)
+from app.agents import code_agent
+from app.agents.llm_gate import LLMGate
+from app.core.config import settings
+from app.services import data_parser
+from app.services.code_cache import normalize_question
+from app.services.sandbox_pool import _read_rss_mb
+from stub_model_server import StubChatModel, StubModelServer
+
+GOLDEN_PATH = os.path.join(conftest.TESTS_DIR, "golden_dataset.json")
+DECISION_LOG_PATH = os.path.join(conftest.BACKEND_DIR, "backend", "logs", "agent_decisions", "decision_log.json")
+UNKNOWN_CODE = "final_answer = \"I don't know, or I cannot find this data in the KPCL reports.\""
+PERCENTILES = (50, 95, 99)
+
+
+def load_golden(path: str = GOLDEN_PATH) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [{**case, "source": "golden"} for case in json.load(f)]
+
+
+def load_decision_log(path: str = DECISION_LOG_PATH) -> list:
+    """Historical (prompt, generated code) pairs; the log is one JSON object per line."""
+    cases = []
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if line.strip():
+                entry = json.loads(line)
+                cases.append({"id": f"log-{i}", "question": entry["prompt"], "code": entry["generated_code"], "source": "log"})
+    return cases
+
+
+class ReplayModelServer(StubModelServer):
+    """
+    Answers each prompt with the code recorded for its question. When a
+    question was recorded more than once the first recording wins, so golden
+    cases take precedence over the decision log.
+    """
+
+    def __init__(self, cases: list, delay: float):
+        super().__init__(delay=delay)
+        self.recordings = {}
+        for case in cases:
+            self.recordings.setdefault(normalize_question(case["question"]), case["code"])
+
+    def respond(self, prompt: str) -> str:
+        question = ""
+        for line in prompt.splitlines():
+            if line.startswith("User Question: "):
+                question = line[len("User Question: "):]
+        code = self.recordings.get(normalize_question(question), UNKNOWN_CODE)
+        return f"```python\n{code}\n```"
+
+
+class MemorySampler:
+    """Peak RSS (MB) of this process plus its sandbox workers, sampled every `interval` seconds."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self) -> float:
+        total = _read_rss_mb(os.getpid()) or 0.0
+        pool = data_parser.global_sandbox_pool
+        if pool is not None:
+            for worker in list(pool._workers):
+                total += _read_rss_mb(worker.process.pid) or 0.0
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, self._sample())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, self._sample())
+
+
+@contextmanager
+def scaled_dataset(factor: int):
+    """
+    Replaces the in-memory warranty frame with `factor` stacked copies and
+    rebuilds the derived indexes / cubes. The original data is restored on exit.
+    """
+    original = data_parser.get_snapshot()
+    if factor == 1:
+        yield {"rows": len(original.df), "prepare_s": 0.0}
+        return
+    start = time.perf_counter()
+    scaled = pd.concat([original.df] * factor, ignore_index=True)
+    # New fingerprint: caches are keyed on it and sandbox workers re-fork for it
+    snapshot = data_parser.dataset_manager.publish_frames({"warranty": scaled}, f"{original.fingerprint}-x{factor}")
+    try:
+        yield {"rows": len(snapshot.df), "prepare_s": time.perf_counter() - start}
+    finally:
+        data_parser.dataset_manager.restore(original)
+
+
+def check_answer(case: dict, response, check_expected: bool = True) -> bool:
+    """Golden cases must contain every expected string (a list means any of); log cases must not error."""
+    if response is None or response.error:
+        return False
+    if "expected" not in case or not check_expected:
+        return True
+    for expected in case["expected"]:
+        options = expected if isinstance(expected, list) else [expected]
+        if not any(option in response.answer for option in options):
+            return False
+    return bool(response.graph_json) or not case.get("graph")
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    return {f"p{p}": round(float(np.percentile(values, p)), 2) for p in PERCENTILES}
+
+
+async def _replay(cases: list, concurrency: int, repeat: int, llm: StubChatModel) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(case):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await code_agent.run_data_agent(case["question"], "benchmark", include_timings=True)
+            return case, response, (time.perf_counter() - start) * 1000
+
+    try:
+        return await asyncio.gather(*(one(case) for _ in range(repeat) for case in cases))
+    finally:
+        # Its pooled client belongs to this event loop
+        await llm.aclose()
+
+
+def run_benchmark(cases: list, concurrency: int = 4, repeat: int = 1, delay: float = 0.05, check_expected: bool = True) -> dict:
+    """
+    Replays `cases` once per `repeat` with at most `concurrency` requests in
+    flight. `check_expected=False` only counts errors (for scaled data, where
+    the recorded answers no longer hold).
+    """
+    original_llm, original_gate = code_agent.llm, code_agent.llm_gate
+    original_cache_enabled = settings.CODE_CACHE_ENABLED
+    # Measure the full pipeline every time, not the code cache
+    settings.CODE_CACHE_ENABLED = False
+    code_agent.llm_gate = LLMGate(max_concurrency=concurrency, max_queue=len(cases) * repeat, queue_timeout=300)
+    try:
+        with ReplayModelServer(cases, delay) as server, MemorySampler() as memory:
+            code_agent.llm = llm = StubChatModel(server.url)
+            start = time.perf_counter()
+            results = asyncio.run(_replay(cases, concurrency, repeat, llm))
+            elapsed = time.perf_counter() - start
+    finally:
+        code_agent.llm, code_agent.llm_gate = original_llm, original_gate
+        settings.CODE_CACHE_ENABLED = original_cache_enabled
+
+    stages = {}
+    paths = {}
+    failures = []
+    for case, response, _ in results:
+        per_request = {}
+        for span in (response.timings or {}).get("spans", []):
+            per_request[span["stage"]] = per_request.get(span["stage"], 0.0) + span["ms"]
+        for stage, ms in per_request.items():
+            stages.setdefault(stage, []).append(ms)
+        path = (response.timings or {}).get("path", "unknown")
+        paths[path] = paths.get(path, 0) + 1
+        if not check_answer(case, response, check_expected):
+            failures.append(case["id"])
+
+    return {
+        "requests": len(results),
+        "concurrency": concurrency,
+        "throughput_rps": round(len(results) / elapsed, 2),
+        "latency_ms": percentiles([ms for _, _, ms in results]),
+        "stages_ms": {stage: {**percentiles(values), "n": len(values)} for stage, values in sorted(stages.items())},
+        "paths": paths,
+        "correct": len(results) - len(failures),
+        "failures": sorted(set(failures)),
+        "peak_rss_mb": round(memory.peak_mb, 1),
+    }
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"scale x{report.get('scale', 1)} ({report.get('rows', '?')} rows), concurrency {report['concurrency']}: "
+        f"{report['requests']} requests, {report['throughput_rps']} req/s, "
+        f"correct {report['correct']}/{report['requests']}, peak RSS {report['peak_rss_mb']} MB",
+        f"  end-to-end  p50 {report['latency_ms']['p50']:>9} ms  p95 {report['latency_ms']['p95']:>9} ms  p99 {report['latency_ms']['p99']:>9} ms",
+    ]
+    for stage, stats in report["stages_ms"].items():
+        lines.append(f"  {stage:<20} p50 {stats['p50']:>9} ms  p95 {stats['p95']:>9} ms  p99 {stats['p99']:>9} ms  (n={stats['n']})")
+    lines.append(f"  paths: {report['paths']}")
+    if report["failures"]:
+        lines.append(f"  failures: {', '.join(report['failures'])}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", choices=["golden", "log", "all"], default="golden")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--scale", type=int, nargs="+", default=[1])
+    parser.add_argument("--repeat", type=int, default=2, help="times each question is replayed per run")
+    parser.add_argument("--delay", type=float, default=0.05, help="stub model latency in seconds")
+    parser.add_argument("--sandbox", action="store_true", help="execute in the pre-forked sandbox pool")
+    parser.add_argument("--json", help="also write the reports to this file")
+    args = parser.parse_args()
+
+    cases = []
+    if args.source in ("golden", "all"):
+        cases += load_golden()
+    if args.source in ("log", "all"):
+        cases += load_decision_log()
+
+    data_parser.get_search_indexes()
+    data_parser.get_aggregate_engine()
+    if args.sandbox:
+        data_parser.start_sandbox_pool()
+
+    reports = []
+    try:
+        for factor in args.scale:
+            with scaled_dataset(factor) as info:
+                if factor > 1:
+                    print(f"Scaled warranty data x{factor} to {info['rows']} rows in {info['prepare_s']:.2f}s")
+                for level in args.concurrency:
+                    # Expected answers were recorded against the real data; scaled runs only check for errors
+                    report = run_benchmark(cases, concurrency=level, repeat=args.repeat, delay=args.delay, check_expected=factor == 1)
+                    report.update(scale=factor, rows=info["rows"], prepare_s=round(info["prepare_s"], 3))
+                    reports.append(report)
+                    print(format_report(report))
+                    print()
+    finally:
+        data_parser.stop_sandbox_pool()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+
+# The app reads its settings at import time; give it a dummy key so nothing calls out
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+# Keep test runs from writing caches and audit logs into the real data directories
+_TEST_DIR = tempfile.mkdtemp(prefix="kbot-tests-")
+os.environ.setdefault("CODE_CACHE_PATH", os.path.join(_TEST_DIR, "code_cache.sqlite3"))
+os.environ.setdefault("AUDIT_DIR", os.path.join(_TEST_DIR, "audit"))
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+for path in (BACKEND_DIR, TESTS_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,112 @@
+"""
+A local stand-in for the upstream model, used by the load and benchmark tests.
+
+`StubModelServer` is a threaded HTTP server that waits `delay` seconds and
+answers every POST with a fixed code block (or with HTTP `status` when that
+is not 200, or a Gemini safety block with no candidates for `block_reason`),
+counting how many requests it serves at once. It speaks the Gemini
+generateContent and Ollama /api/generate formats, so the real providers can
+point at it. `StubChatModel` is a drop-in
+for the chat model (`ainvoke(prompt).content`) that talks to it over a
+pooled async HTTP client, so a test exercises real network I/O end to end.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import httpx
+
+DEFAULT_CODE = "```python\nfinal_answer = f\"There are **{len(df)}** warranty claims.\"\n```"
+
+
+class StubModelServer:
+    def __init__(self, delay: float = 0.2, code: str = DEFAULT_CODE, status: int = 200, block_reason: str = None):
+        self.delay = delay
+        self.code = code
+        self.status = status
+        self.block_reason = block_reason
+        self.requests = 0
+        # Requests being served right now, and the most at once: how much the callers really overlapped
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                with server._lock:
+                    server.requests += 1
+                    server.in_flight += 1
+                    server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+                time.sleep(server.delay)
+                with server._lock:
+                    server.in_flight -= 1
+                if server.status != 200:
+                    body = json.dumps({"error": "stub failure"}).encode("utf-8")
+                elif server.block_reason:
+                    body = json.dumps({"promptFeedback": {"blockReason": server.block_reason}}).encode("utf-8")
+                else:
+                    prompt = payload.get("prompt") or payload.get("contents", [{}])[0].get("parts", [{}])[0].get("text", "")
+                    text = server.respond(prompt)
+                    if self.path.endswith(":generateContent"):
+                        body = json.dumps({"candidates": [{"content": {"parts": [{"text": text}]}}]}).encode("utf-8")
+                    else:
+                        body = json.dumps({"content": text, "response": text}).encode("utf-8")
+                try:
+                    self.send_response(server.status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client cancelled (lost a hedge race)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def respond(self, prompt: str) -> str:
+        return self.code
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/generate"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class StubChatModel:
+    def __init__(self, url: str):
+        self.url = url
+        self._client = None
+
+    async def ainvoke(self, prompt: str):
+        # One pooled client per event loop (tests run several loops back to back)
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=100))
+        response = await self._client.post(self.url, json={"prompt": prompt})
+        response.raise_for_status()
+        return SimpleNamespace(content=response.json()["content"])
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,108 @@
+"""
+Audit log: records are written by the background thread in batches,
+rotated by size, sampled / dropped under pressure, kept running through
+disk errors, and one is queued for every agent request without waiting on
+the disk.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from unittest import mock
+
+import conftest  # noqa: F401
+from app.agents import code_agent
+from app.agents.llm_gate import LLMGate
+from app.core import audit as audit_module
+from app.core.audit import AuditLog
+from app.core.config import settings
+from stub_model_server import StubChatModel, StubModelServer
+
+
+def _log(directory, **overrides):
+    options = dict(max_queue=1000, batch_size=50, flush_seconds=0.05, rotate_bytes=10_000_000,
+                   rotate_seconds=3600, max_files=3, sample_above=0.5, sample_rate=0.0)
+    options.update(overrides)
+    return AuditLog(str(directory), **options)
+
+
+def _lines(directory) -> list:
+    lines = []
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            lines += [json.loads(line) for line in f]
+    return lines
+
+
+def test_records_are_batched_and_rotated_by_size(tmp_path):
+    log = _log(tmp_path, rotate_bytes=2000, max_files=2)
+    for i in range(100):
+        assert log.record({"prompt": f"question {i}", "generated_code": "final_answer = 1", "outcome": "llm"})
+        if i % 10 == 9:
+            time.sleep(0.1)
+    log.stop()
+    names = sorted(os.listdir(tmp_path))
+    assert "audit.jsonl" in names and len(names) == 3  # current file + the two newest rotated ones
+    assert all(os.path.getsize(tmp_path / name) < 4000 for name in names)
+    kept = [entry["prompt"] for entry in _lines(tmp_path)]
+    assert kept[-1] == "question 99" and log.written == 100
+
+
+def test_pressure_samples_successes_and_drops_overflow(tmp_path):
+    log = _log(tmp_path, max_queue=4, sample_above=0.5)
+    stalled = threading.Event()
+    log._thread = threading.Thread(target=stalled.wait)  # a writer that never drains: the queue only fills up
+    log._thread.start()
+    try:
+        results = [log.record({"outcome": "llm"}) for _ in range(4)]
+        assert results == [True, True, False, False] and log.sampled_out == 2
+        assert [log.record({"outcome": "failed"}) for _ in range(3)] == [True, True, False]
+        assert log.dropped == 1
+    finally:
+        stalled.set()
+
+
+def test_writer_survives_rotation_errors_and_restarts_when_dead(tmp_path):
+    log = _log(tmp_path, rotate_seconds=0.05)
+    log.record({"i": 0})
+    deadline = time.time() + 2
+    while log.written < 1 and time.time() < deadline:
+        time.sleep(0.01)
+
+    # The file ages out while the writer is idle, and renaming it fails
+    with mock.patch.object(audit_module.os, "replace", side_effect=PermissionError("locked")) as replace:
+        deadline = time.time() + 2
+        while not replace.called and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.1)
+    assert replace.called and log._thread.is_alive()
+
+    # A writer that died anyway is replaced by the next record
+    log.stop()
+    log._thread = threading.Thread(target=lambda: None)
+    log._thread.start()
+    log._thread.join()
+    assert log.record({"i": 1})
+    log.stop()
+    assert sorted(entry["i"] for entry in _lines(tmp_path)) == [0, 1]
+
+
+def test_every_agent_request_is_audited():
+    original_llm, original_gate = code_agent.llm, code_agent.llm_gate
+    code_agent.llm_gate = LLMGate(max_concurrency=1, max_queue=1, queue_timeout=30)
+    try:
+        with StubModelServer(delay=0.01) as server:
+            code_agent.llm = StubChatModel(server.url)
+            asyncio.run(code_agent.run_data_agent("How many claims mention a seized crankshaft?", "auditor"))
+    finally:
+        code_agent.llm, code_agent.llm_gate = original_llm, original_gate
+    code_agent.audit_log.stop()
+    entries = [e for e in _lines(settings.AUDIT_DIR) if e["user_id"] == "auditor"]
+    entry = entries[-1]
+    assert entry["prompt"] == "How many claims mention a seized crankshaft?"
+    assert entry["generated_code"].startswith("final_answer = ")
+    assert entry["outcome"] in ("llm", "cache") and entry["error"] is None
+    assert {span["stage"] for span in entry["spans"]} >= {"fast_path"}
+    if entry["outcome"] == "llm":
+        assert entry["attempts"] == 1 and len(entry["prompt_hashes"][0]) == 16
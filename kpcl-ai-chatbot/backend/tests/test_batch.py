@@ -0,0 +1,91 @@
+"""
+/chat/batch: duplicate questions run once, items come back in request
+order with batch timings, and model calls overlap up to the batch limit.
+Streamed batches (SSE) go out uncompressed; JSON is gzipped.
+"""
+import asyncio
+
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+import conftest  # noqa: F401
+from app.core.compression import NonStreamingGZipMiddleware
+from app.agents import batch_runner, code_agent
+from app.agents.llm_gate import LLMGate
+from app.core.config import settings
+from stub_model_server import StubChatModel, StubModelServer
+
+QUESTIONS = [
+    "How many claims mention oil leakage?",
+    "how many claims mention 'oil leakage'",
+    "hi",
+    "How many claims mention a broken valve?",
+    "How many claims mention low pressure?",
+    "How many claims mention oil leakage?",
+]
+
+
+def test_batch_dedupes_and_runs_in_parallel():
+    original_llm, original_gate, original_cache = code_agent.llm, code_agent.llm_gate, settings.CODE_CACHE_ENABLED
+    settings.CODE_CACHE_ENABLED = False
+    code_agent.llm_gate = LLMGate(max_concurrency=4, max_queue=8, queue_timeout=30)
+    try:
+        with StubModelServer(delay=0.3) as server:
+            code_agent.llm = StubChatModel(server.url)
+            batch = asyncio.run(batch_runner.run_batch(QUESTIONS, "analyst", include_timings=True))
+    finally:
+        code_agent.llm, code_agent.llm_gate, settings.CODE_CACHE_ENABLED = original_llm, original_gate, original_cache
+
+    assert [item.index for item in batch.results] == list(range(len(QUESTIONS)))
+    assert [item.duplicate_of for item in batch.results] == [None, 0, None, None, None, 0]
+    assert batch.results[1].response.answer == batch.results[0].response.answer
+    assert "warranty claims" in batch.results[0].response.answer
+    assert batch.results[0].response.timings["path"] == "llm"
+    # Three distinct questions reach the model, at the same time rather than one after another
+    assert server.requests == 3
+    timings = batch.timings
+    assert (timings["questions"], timings["unique"], timings["duplicates"]) == (6, 4, 2)
+    assert timings["paths"] == {"llm": 3, "greeting": 1}
+    # Only the items that reach the model retrieve context; the greeting never does
+    assert timings["retrievals"] == 3
+    assert timings["total_ms"] - timings["snapshot_ms"] < 0.3 * 3 * 1000
+
+
+def _compression_app():
+    async def events():
+        for i in range(3):
+            yield f"event: item\ndata: {'x' * 600}{i}\n\n"
+
+    async def chunks():
+        for i in range(3):
+            yield ("chunk %d " % i) * 200
+
+    app = Starlette(routes=[
+        Route("/big", lambda request: JSONResponse({"rows": ["claim"] * 500})),
+        Route("/small", lambda request: JSONResponse({"ok": True})),
+        Route("/stream", lambda request: StreamingResponse(events(), media_type="text/event-stream")),
+        Route("/chunks", lambda request: StreamingResponse(chunks(), media_type="text/plain")),
+    ])
+    app.add_middleware(NonStreamingGZipMiddleware, minimum_size=500, compresslevel=6)
+    return app
+
+
+def test_gzip_skips_event_streams_and_small_bodies():
+    async def fetch_all():
+        transport = httpx.ASGITransport(app=_compression_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", headers={"Accept-Encoding": "gzip"}) as client:
+            return {path: await client.get(path) for path in ("/big", "/small", "/stream", "/chunks")}
+
+    responses = asyncio.run(fetch_all())
+    big = responses["/big"]
+    assert big.headers["content-encoding"] == "gzip" and "Accept-Encoding" in big.headers["vary"]
+    assert int(big.headers["content-length"]) < len(big.content)  # httpx already decoded it
+    assert big.json() == {"rows": ["claim"] * 500}
+    assert "content-encoding" not in responses["/small"].headers
+    stream = responses["/stream"]
+    assert "content-encoding" not in stream.headers and stream.text.count("event: item") == 3
+    chunked = responses["/chunks"]
+    assert chunked.headers["content-encoding"] == "gzip" and "content-length" not in chunked.headers
+    assert chunked.text == "".join(("chunk %d " % i) * 200 for i in range(3))
@@ -0,0 +1,78 @@
+"""
+Chart payload post-processing: decimation / aggregation of oversized
+traces, typed-array encoding, and the rendered chart cache (which never
+holds answers that depend on the clock).
+"""
+import base64
+import json
+
+import numpy as np
+import plotly.express as px
+import pytest
+
+import conftest  # noqa: F401
+from app.services.chart_gen import ChartCache, compact_chart, encode_typed_array
+
+
+def _decode(array: dict) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(array["bdata"]), dtype=f"<{array['dtype']}")
+
+
+def test_typed_arrays_round_trip_in_the_smallest_exact_dtype():
+    assert encode_typed_array(np.array([1.0, 2.0, 300.0]))["dtype"] == "i2"
+    assert encode_typed_array(np.array([0.5, 1.25]))["dtype"] == "f4"
+    values = np.array([0.1, 2.5, 1e6 + 0.3])
+    encoded = encode_typed_array(values)
+    assert encoded["dtype"] == "f8"
+    np.testing.assert_array_equal(_decode(encoded), values)
+
+
+def test_long_line_traces_keep_their_extremes():
+    x = list(range(20000))
+    y = np.sin(np.arange(20000) / 500.0)
+    y[12345] = 50.0
+    raw = px.line(x=x, y=y, template="plotly_white").to_json()
+    graph_json, info = compact_chart(raw, max_points=1000)
+    trace = json.loads(graph_json)["data"][0]
+    kept_x, kept_y = _decode(trace["x"]), _decode(trace["y"])
+    assert len(kept_y) <= 1002 and info["downsampled"] == [{"trace": 0, "points": 20000, "kept": len(kept_y)}]
+    assert kept_y.max() == 50.0 and 12345 in kept_x
+    assert kept_x[0] == 0 and kept_x[-1] == 19999
+    assert info["bytes_after"] < info["bytes_before"] / 10
+
+
+def test_bars_from_raw_rows_are_summed_per_label():
+    labels = ["KES", "KCX", "KES", "PC"] * 2000
+    raw = px.bar(x=labels, y=[1] * len(labels), hover_name=labels).to_json()
+    trace = json.loads(compact_chart(raw, max_points=100)[0])["data"][0]
+    assert trace["x"] == ["KES", "KCX", "PC"] and trace["y"] == [4000, 2000, 2000]
+    assert "hovertext" not in trace
+    # Small charts keep their shape; text axes stay plain lists
+    small = px.bar(x=["a", "b"], y=[1, 2]).to_json()
+    assert json.loads(compact_chart(small)[0])["data"][0]["x"] == ["a", "b"]
+    assert compact_chart("not json")[0] == "not json"
+
+
+def test_chart_cache_is_keyed_on_code_and_data_and_bounded():
+    cache = ChartCache(max_bytes=100, ttl_seconds=60)
+    cache.put("code", "v1", {"answer": "a", "graph_json": "x" * 40, "error": None})
+    cache.put("plain", "v1", {"answer": "no chart", "graph_json": None, "error": None})
+    assert cache.get("code", "v1")["graph_json"] == "x" * 40
+    assert cache.get("code", "v2") is None and cache.get("plain", "v1") is None
+    cache.put("other", "v1", {"answer": "b", "graph_json": "y" * 40, "error": None})
+    cache.put("third", "v1", {"answer": "c", "graph_json": "z" * 40, "error": None})
+    assert cache.get("code", "v1") is None and cache.stats()["bytes"] <= 100
+    expired = ChartCache(max_bytes=100, ttl_seconds=0)
+    expired.put("code", "v1", {"answer": "a", "graph_json": "x", "error": None})
+    assert expired.get("code", "v1") is None
+
+
+@pytest.mark.parametrize("code", [
+    "recent = df[df['Complaint Date'] > pd.Timestamp.now() - pd.Timedelta(days=30)]",
+    "year = datetime.date.today().year",
+    "cutoff = pd.Timestamp('today')",
+])
+def test_answers_that_depend_on_the_clock_are_not_cached(code):
+    cache = ChartCache(max_bytes=1000, ttl_seconds=3600)
+    cache.put(code, "v1", {"answer": "12 claims", "graph_json": "x", "error": None})
+    assert cache.get(code, "v1") is None
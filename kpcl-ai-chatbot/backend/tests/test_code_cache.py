@@ -0,0 +1,60 @@
+"""
+Code cache: which questions share a key, persistence across restarts,
+dataset-version invalidation, TTL and the LRU bound.
+"""
+import time
+
+import pytest
+
+import conftest  # noqa: F401
+from app.services.code_cache import CodeCache, normalize_question
+
+
+@pytest.mark.parametrize("a, b", [
+    ("Which 'Dealer Name' has the highest total 'RunHrs.'", "Which Dealer Name has the highest total RunHrs?"),
+    ("How many claims mention oil-leak?", "how many claims mention  oil leak"),
+    ("claims with RunHrs>1000", "Claims with RunHrs > 1000?"),
+])
+def test_wording_noise_shares_a_key(a, b):
+    assert normalize_question(a) == normalize_question(b)
+
+
+@pytest.mark.parametrize("a, b", [
+    ("claims with RunHrs > 1000", "claims with RunHrs < 1000"),
+    ("claims with RunHrs >= 1000", "claims with RunHrs > 1000"),
+    ("claims with RunHrs != 0", "claims with RunHrs == 0"),
+    ("complaints with a period below -5 months", "complaints with a period below 5 months"),
+    ("claims with RunHrs above 1.5", "claims with RunHrs above 15"),
+    ("dealers with over 5% of claims", "dealers with over 5 claims"),
+])
+def test_operators_signs_and_decimals_stay_in_the_key(a, b):
+    # Also the /chat/batch dedup key: these must never be answered as duplicates of each other
+    assert normalize_question(a) != normalize_question(b)
+
+
+def test_entries_persist_and_follow_the_dataset_version(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = CodeCache(path, max_entries=10, ttl_seconds=60)
+    cache.put("How many claims?", "v1", "final_answer = len(df)")
+    assert cache.get("how many claims", "v1") == "final_answer = len(df)"
+    assert cache.get("How many claims > 5?", "v1") is None
+
+    restarted = CodeCache(path, max_entries=10, ttl_seconds=60)
+    assert restarted.get("How many claims?", "v1") == "final_answer = len(df)"
+    # A new dataset version drops everything built against the old one, on disk too
+    assert restarted.get("How many claims?", "v2") is None
+    assert CodeCache(path, max_entries=10, ttl_seconds=60).stats()["entries"] == 0
+
+
+def test_ttl_and_lru_bound():
+    cache = CodeCache("", max_entries=2, ttl_seconds=60)
+    for question in ("a", "b"):
+        cache.put(question, "v1", f"final_answer = '{question}'")
+    cache.get("a", "v1")
+    cache.put("c", "v1", "final_answer = 'c'")
+    assert cache.get("b", "v1") is None and cache.get("a", "v1") and cache.stats()["evictions"] == 1
+
+    cache = CodeCache("", max_entries=2, ttl_seconds=0.01)
+    cache.put("a", "v1", "final_answer = 'a'")
+    time.sleep(0.02)
+    assert cache.get("a", "v1") is None
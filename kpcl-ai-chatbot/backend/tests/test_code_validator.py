@@ -0,0 +1,83 @@
+"""
+Pre-execution checks of generated code: local column repairs, up-front
+rejections, and the model round trips they save in the agent pipeline.
+"""
+import asyncio
+
+import conftest  # noqa: F401
+from app.agents import code_agent
+from app.agents.llm_gate import LLMGate
+from app.core.config import settings
+from app.services.code_validator import repair_missing_column, validate_code
+from stub_model_server import StubChatModel, StubModelServer
+
+SCHEMAS = {
+    "df": ["Dealer Name", "Model", "Exp/Domestic", "RunHrs.", "Period DD to DC in months", "Complaint Date", "FRR Date"],
+    "df_kb": ["Problem category", "Probable Causes"],
+    "df_cost": ["ITEM DESCRIPTION", "GROSS VALUE"],
+}
+
+
+def test_near_miss_columns_are_repaired_in_place():
+    code = (
+        "# total hours per dealer\n"
+        "top = df[df['model'] == 'KES-50']\n"
+        "totals = top.groupby('dealer name')['RunHrs'].sum()\n"
+        "final_answer = f\"{df['Exp/Domastic'].nunique()} types, {df_cost['Gross Value'].sum()}\"\n"
+    )
+    check = validate_code(code, SCHEMAS)
+    assert check["error"] is None
+    assert {(r["from"], r["to"]) for r in check["repairs"]} == {
+        ("model", "Model"), ("dealer name", "Dealer Name"), ("RunHrs", "RunHrs."),
+        ("Exp/Domastic", "Exp/Domestic"), ("Gross Value", "GROSS VALUE"),
+    }
+    assert check["code"].startswith("# total hours per dealer\n")
+    assert "top.groupby('Dealer Name')['RunHrs.']" in check["code"]
+    # Compared values are data, not column names
+    assert "== 'KES-50'" in check["code"]
+
+
+def test_created_columns_and_series_keys_are_left_alone():
+    code = (
+        "df['Year'] = pd.to_datetime(df['Complaint Date']).dt.year\n"
+        "counts = df['Model'].value_counts()\n"
+        "final_answer = str(df['Year'].max()) + str(counts['KES'])\n"
+    )
+    check = validate_code(code, SCHEMAS)
+    assert check == {"code": code, "repairs": [], "error": None}
+
+
+def test_unsafe_or_unfixable_code_is_rejected_before_exec():
+    assert "'os'" in validate_code("import os\nfinal_answer = os.getcwd()", SCHEMAS)["error"]
+    assert "'open'" in validate_code("final_answer = open('/etc/passwd').read()", SCHEMAS)["error"]
+    assert "__class__" in validate_code("x = df.__class__.__mro__", SCHEMAS)["error"]
+    assert "to_csv" in validate_code("df.to_csv('/tmp/out.csv')", SCHEMAS)["error"]
+    assert validate_code("text = df.to_csv(index=False)", SCHEMAS)["error"] is None
+    ambiguous = validate_code("final_answer = str(df['Date'].max())", SCHEMAS)["error"]
+    assert "'Date'" in ambiguous and "'Complaint Date'" in ambiguous and "'FRR Date'" in ambiguous
+    assert "SyntaxError" in validate_code("final_answer = (", SCHEMAS)["error"]
+
+
+def test_key_error_repair_covers_untracked_rows():
+    code = "for row in records:\n    total += row['Runhrs']\n"
+    repair = repair_missing_column(code, "'Runhrs'", SCHEMAS)
+    assert repair["code"] == "for row in records:\n    total += row['RunHrs.']\n"
+    assert repair_missing_column(code, "'Date'", SCHEMAS) is None
+    assert repair_missing_column(code, "division by zero", SCHEMAS) is None
+
+
+def test_repaired_code_answers_without_a_retry():
+    code = "```python\nfinal_answer = f\"Total **{df['runhrs'].sum():,.0f}** hours\"\n```"
+    original_llm, original_gate, original_cache = code_agent.llm, code_agent.llm_gate, settings.CODE_CACHE_ENABLED
+    settings.CODE_CACHE_ENABLED = False
+    code_agent.llm_gate = LLMGate(max_concurrency=1, max_queue=1, queue_timeout=30)
+    try:
+        with StubModelServer(delay=0.01, code=code) as server:
+            code_agent.llm = StubChatModel(server.url)
+            response = asyncio.run(code_agent.run_data_agent("What is the total run hours across all dealers?", "test", include_timings=True))
+    finally:
+        code_agent.llm, code_agent.llm_gate, settings.CODE_CACHE_ENABLED = original_llm, original_gate, original_cache
+    assert response.error is None
+    assert response.answer.startswith("Total **")
+    assert server.requests == 1
+    assert response.timings["repairs"] == [{"frame": "df", "from": "runhrs", "to": "RunHrs."}]
@@ -0,0 +1,80 @@
+"""
+Dataset compaction: which columns change dtype, that every value survives
+the round trip, and that generated code gets the text columns back as
+object columns, so code written against the uncompacted data still runs.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import conftest  # noqa: F401
+from app.services import data_parser
+from app.services.compaction import compact_frame, expand_categoricals
+
+
+def _frame():
+    return pd.DataFrame({
+        "Dealer": ["Trade Links", "Kalp Marketing", "Trade Links", None] * 25,
+        "Remark": [f"note {i}" for i in range(100)],
+        "Mixed": ["a", 1, "a", 2] * 25,
+        "RPM": [1450.0, 960.0, np.nan, 1450.0] * 25,
+        "RunHrs.": [1234.7, 10.0, 0.1, np.nan] * 25,
+        "Count": [1.0, 2.0, 3.0, 4.0] * 25,
+        "Other": [0.1, 0.2, 0.3, 0.4] * 25,
+    })
+
+
+def test_compaction_round_trips_every_value():
+    df = _frame()
+    compacted, report = compact_frame(df, numeric_columns=["RPM", "RunHrs.", "Count"])
+    dtypes = {col: str(compacted[col].dtype) for col in compacted.columns}
+    assert dtypes == {
+        "Dealer": "category",      # repetitive text
+        "Remark": "object",        # every value distinct
+        "Mixed": "object",         # not all strings
+        "RPM": "float32",          # exact in float32, NaNs kept
+        "RunHrs.": "float64",      # 1234.7 would round in float32
+        "Count": "int8",           # whole numbers, no NaNs
+        "Other": "float64",        # not listed
+    }
+    for col in df.columns:
+        restored = compacted[col].astype(object) if dtypes[col] == "category" else compacted[col].astype(df[col].dtype)
+        present = df[col].notna()
+        assert restored.notna().equals(present)
+        pd.testing.assert_series_equal(restored[present], df[col][present], check_dtype=False)
+    assert report["mb_after"] < report["mb_before"]
+    assert report["columns"]["Dealer"]["dtype_before"] == "object"
+
+
+def test_expanded_frames_share_the_category_strings():
+    compacted, _ = compact_frame(_frame(), numeric_columns=["RPM"])
+    expanded = expand_categoricals(compacted)
+    assert expanded["Dealer"].dtype == object and expanded["RPM"].dtype == "float32"
+    assert expanded["Dealer"][0] is compacted["Dealer"].cat.categories[compacted["Dealer"].cat.codes[0]]
+    assert isinstance(compacted["Dealer"].dtype, pd.CategoricalDtype)  # the original is left alone
+
+
+@pytest.mark.parametrize("code", [
+    "filled = df.fillna('N/A')\nfinal_answer = str((filled['Dealer Name'] == 'N/A').sum())",
+    "df.loc[df['Model'] == 'KCX4', 'Dealer Name'] = 'Unknown'\nfinal_answer = str((df['Dealer Name'] == 'Unknown').sum())",
+    "labels = df['Dealer Name'] + ' - ' + df['Model']\nfinal_answer = labels.iloc[0]",
+    "final_answer = str(len(df[df['Model'] == 'KCX4'].groupby('Dealer Name').size()))",
+])
+def test_generated_code_runs_as_on_object_columns(code):
+    snapshot = data_parser.get_snapshot()
+    assert isinstance(snapshot.df["Dealer Name"].dtype, pd.CategoricalDtype)
+    baseline = {"df": snapshot.df.astype({col: object for col in snapshot.df.select_dtypes("category").columns}), "pd": pd}
+    exec(code, {}, baseline)
+    result = data_parser._sandbox_run(code, *data_parser.sandbox_inputs(snapshot))
+    assert result["error"] is None and result["answer"] == baseline["final_answer"]
+    # The shared snapshot keeps its categoricals and the server its pandas settings
+    assert isinstance(snapshot.df["Dealer Name"].dtype, pd.CategoricalDtype)
+    assert pd.get_option("mode.copy_on_write") is False
+
+
+def test_generated_code_cannot_write_through_to_the_snapshot():
+    snapshot = data_parser.get_snapshot()
+    before = snapshot.df["RunHrs."].copy()
+    result = data_parser._sandbox_run("df.loc[:, 'RunHrs.'] = 0\nfinal_answer = str(df['RunHrs.'].sum())", *data_parser.sandbox_inputs(snapshot))
+    assert result["answer"] == "0.0"
+    pd.testing.assert_series_equal(snapshot.df["RunHrs."], before)
@@ -0,0 +1,78 @@
+"""Hot reload / incremental append of the warranty data."""
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+import conftest  # noqa: F401
+from app.core.config import settings
+from app.services.aggregates import AggregateEngine
+from app.services.data_parser import CLEANING_VERSION, DATASETS, INDEXED_COLUMNS, load_warranty_df
+from app.services.dataset_manager import DatasetManager
+from app.services.search_index import TextIndex
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    for name, (path_attr, _) in DATASETS.items():
+        copy = tmp_path / os.path.basename(getattr(settings, path_attr))
+        shutil.copy(getattr(settings, path_attr), copy)
+        monkeypatch.setattr(settings, path_attr, str(copy))
+    monkeypatch.setattr(settings, "SNAPSHOT_ENABLED", False)
+    return DatasetManager(DATASETS, CLEANING_VERSION, INDEXED_COLUMNS, watch_interval=0)
+
+
+def _rewrite(path: str, df: pd.DataFrame):
+    df.to_excel(path, index=False)
+    # Make sure the stat differs even on filesystems with coarse mtimes
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_unchanged_files_do_not_reload(manager):
+    first = manager.current
+    assert manager.reload() is None
+    assert manager.current is first
+
+
+def test_appended_rows_update_indexes_and_cubes(manager):
+    first = manager.current
+    raw = pd.read_excel(settings.ACTIVE_DATA_PATH)
+    extra = raw.head(3).copy()
+    extra["Nature of complaint"] = "zeolite dryer failure"
+    _rewrite(settings.ACTIVE_DATA_PATH, pd.concat([raw, extra], ignore_index=True))
+
+    snapshot = manager.reload()
+    assert snapshot.kind == "incremental"
+    assert snapshot.version == first.version + 1
+    assert snapshot.fingerprint != first.fingerprint
+    assert len(snapshot.df) == len(first.df) + 3
+    # The previous snapshot is untouched for requests still using it
+    assert len(first.df) == len(raw)
+    assert len(first.indexes[("warranty", "Nature of complaint")].lookup("zeolite")) == 0
+
+    expected = load_warranty_df(settings.ACTIVE_DATA_PATH)
+    fresh_index = TextIndex(expected["Nature of complaint"])
+    index = snapshot.indexes[("warranty", "Nature of complaint")]
+    for keyword in ("zeolite", "oil", "leak"):
+        assert index.lookup(keyword).tolist() == fresh_index.lookup(keyword).tolist()
+
+    fresh = AggregateEngine(expected)
+    for dim in fresh.cubes:
+        pd.testing.assert_frame_equal(snapshot.aggregates.cubes[dim], fresh.cubes[dim], check_dtype=False)
+        assert snapshot.aggregates.unique_counts[dim] == fresh.unique_counts[dim]
+    for period in fresh.periods:
+        pd.testing.assert_frame_equal(snapshot.aggregates.periods[period], fresh.periods[period], check_dtype=False)
+
+
+def test_edited_rows_trigger_a_rebuild(manager):
+    first = manager.current
+    raw = pd.read_excel(settings.ACTIVE_DATA_PATH)
+    raw.loc[0, "Nature of complaint"] = "edited complaint"
+    _rewrite(settings.ACTIVE_DATA_PATH, pd.concat([raw, raw.head(1)], ignore_index=True))
+
+    snapshot = manager.reload()
+    assert snapshot.kind == "partial"
+    assert snapshot.df_kb is first.df_kb
+    assert snapshot.df.loc[0, "Nature of complaint"] == "edited complaint"
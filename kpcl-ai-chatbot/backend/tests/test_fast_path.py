@@ -0,0 +1,66 @@
+"""
+LLM-free fast path: which questions the router claims, and that the cube
+answers match the same aggregation done directly on the warranty data.
+"""
+import pandas as pd
+import pytest
+
+import conftest  # noqa: F401
+from app.agents.intent_router import parse_intent, try_fast_path
+from app.services import data_parser
+from app.services.aggregates import AggregateEngine
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("Which dealer has the most complaints?", {"kind": "top", "dimension": "Dealer Name", "measure": "claims", "n": 1}),
+    ("top 5 customers by claims", {"kind": "top", "dimension": "Customer Name", "n": 5}),
+    ("Which model has the highest total run hours", {"kind": "top", "dimension": "Model", "measure": "runhrs_total"}),
+    ("average runhrs per year", {"kind": "period", "period": "year", "measure": "runhrs_avg"}),
+    ("plot complaints by year", {"kind": "period", "measure": "claims", "chart": True}),
+    ("How many unique dealers are there?", {"kind": "unique", "dimension": "Dealer Name"}),
+])
+def test_router_claims_simple_aggregations(question, expected):
+    intent = parse_intent(question)
+    assert intent is not None and {k: intent[k] for k in expected} == expected
+
+
+@pytest.mark.parametrize("question", [
+    # Run-hour words without a clear run-hours measure must not turn into a complaint count
+    "Which dealer has the most hours logged",
+    "Which model has the maximum run",
+    # Filters and measures the cubes don't have go to the LLM
+    "Which dealer has the most claims in 2024?",
+    "Which dealer has the most oil leakage complaints?",
+    "average complaints per dealer",
+    # Two rankings at once, or a ranking word the router doesn't know
+    "Which dealers have the most and least complaints?",
+    "top 5 and bottom 5 models by claims",
+    "first 3 dealers by claims",
+    "hi",
+])
+def test_router_defers_anything_it_is_not_sure_about(question):
+    assert parse_intent(question) is None
+
+
+def test_cube_answers_match_the_data():
+    df = data_parser.get_snapshot().df
+    engine = data_parser.get_aggregate_engine()
+    counts = df["Dealer Name"].astype(object).value_counts()
+    top = try_fast_path("Which dealer has the most complaints?", engine)
+    assert f"**{str(counts.index[0]).strip()}** ({counts.iloc[0]:,})" in top.answer and top.graph_json is None
+
+    runhrs = pd.to_numeric(df["RunHrs."], errors="coerce").groupby(df["Model"].astype(object)).sum()
+    assert engine.top("Model", "runhrs_total", 1).iloc[0] == pytest.approx(runhrs.max())
+    assert engine.unique_counts["Dealer Name"] == df["Dealer Name"].nunique()
+    chart = try_fast_path("plot complaints by year", engine)
+    assert chart.graph_json and chart.answer.startswith("Here is the chart")
+
+
+def test_extended_cubes_equal_a_full_rebuild():
+    df = data_parser.get_snapshot().df
+    head, tail = df.iloc[:3000], df.iloc[3000:]
+    extended, full = AggregateEngine(head).extend(tail), AggregateEngine(df)
+    assert extended.total_claims == full.total_claims
+    for dim, cube in full.cubes.items():
+        pd.testing.assert_frame_equal(extended.cubes[dim], cube, check_dtype=False)
+    pd.testing.assert_series_equal(extended.by_period("year", "runhrs_avg"), full.by_period("year", "runhrs_avg"))
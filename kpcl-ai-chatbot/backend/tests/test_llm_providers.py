@@ -0,0 +1,101 @@
+"""
+Model provider layer against local stub servers: hedging a slow primary,
+failover on errors, the circuit breaker (which only outages trip),
+starting without an API key, and LLM_DEBUG prompt logging.
+"""
+import asyncio
+import time
+
+import pytest
+
+import conftest  # noqa: F401
+from app.core.config import settings
+from app.agents.llm_providers import CircuitBreaker, GeminiProvider, HedgedLLM, LLMProviderError, OllamaProvider
+from stub_model_server import StubModelServer
+
+
+def _gemini(server, api_key="test-key", timeout=5.0, failures=3):
+    return GeminiProvider(api_key=api_key, base_url=server.base_url, model="gemini-test", timeout=timeout,
+                          breaker=CircuitBreaker(failures, reset_seconds=60))
+
+
+def _ollama(server):
+    return OllamaProvider(base_url=server.base_url, model="local", timeout=5.0, breaker=CircuitBreaker(3, reset_seconds=60))
+
+
+def test_slow_primary_is_hedged_and_the_first_answer_wins():
+    with StubModelServer(delay=1.0, code="from gemini") as slow, StubModelServer(delay=0.05, code="from ollama") as fast:
+        llm = HedgedLLM(_gemini(slow), _ollama(fast), hedge_after=0.1)
+        started = time.perf_counter()
+        response = asyncio.run(llm.ainvoke("prompt"))
+        assert (response.content, response.provider) == ("from ollama", "ollama")
+        assert time.perf_counter() - started < 0.8
+        # A fast primary never touches the fallback
+        slow.delay = 0.01
+        assert asyncio.run(llm.ainvoke("prompt")).provider == "gemini"
+        assert fast.requests == 1
+
+
+def test_failures_fail_over_and_open_the_circuit():
+    with StubModelServer(delay=0.01, status=503) as broken, StubModelServer(delay=0.01, code="local answer") as local:
+        llm = HedgedLLM(_gemini(broken, failures=2), _ollama(local), hedge_after=0)
+
+        async def ask_three_times():
+            return [await llm.ainvoke("prompt") for _ in range(3)]
+
+        responses = asyncio.run(ask_three_times())
+        assert {r.content for r in responses} == {"local answer"}
+        # Two failures open the circuit; the third call goes straight to the fallback
+        assert broken.requests == 2 and local.requests == 3
+        assert llm.stats() == {"gemini": "open", "ollama": "closed"}
+
+        alone = HedgedLLM(_gemini(broken, failures=1))
+        with pytest.raises(LLMProviderError, match="503"):
+            asyncio.run(alone.ainvoke("prompt"))
+        with pytest.raises(LLMProviderError, match="circuit open"):
+            asyncio.run(alone.ainvoke("prompt"))
+
+
+@pytest.mark.parametrize("stub", [dict(status=400), dict(status=404), dict(block_reason="SAFETY")])
+def test_rejected_prompts_do_not_open_the_circuit(stub):
+    with StubModelServer(delay=0.01, **stub) as server:
+        llm = HedgedLLM(_gemini(server, failures=1))
+        for _ in range(3):
+            with pytest.raises(LLMProviderError, match="rejected the request|no candidates"):
+                asyncio.run(llm.ainvoke("prompt"))
+        assert server.requests == 3 and llm.stats() == {"gemini": "closed"}
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_throttling_and_server_errors_open_the_circuit(status):
+    with StubModelServer(delay=0.01, status=status) as server:
+        llm = HedgedLLM(_gemini(server, failures=1))
+        with pytest.raises(LLMProviderError, match=str(status)):
+            asyncio.run(llm.ainvoke("prompt"))
+        assert llm.stats() == {"gemini": "open"}
+
+
+def test_circuit_half_opens_after_the_reset_period():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow() and not breaker.allow()  # one trial call at a time
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_missing_api_key_fails_per_call_not_at_import():
+    with StubModelServer(delay=0.01) as server:
+        llm = HedgedLLM(_gemini(server, api_key=None))
+        with pytest.raises(LLMProviderError, match="GEMINI_API_KEY"):
+            asyncio.run(llm.ainvoke("prompt"))
+        assert server.requests == 0
+        assert asyncio.run(HedgedLLM(_gemini(server, api_key=None), _ollama(server)).ainvoke("prompt")).provider == "ollama"
+
+
+def test_llm_debug_logs_prompts_and_responses(monkeypatch, caplog):
+    monkeypatch.setattr(settings, "LLM_DEBUG", True)
+    with StubModelServer(delay=0.01, code="debug answer") as server, caplog.at_level("INFO"):
+        asyncio.run(HedgedLLM(_gemini(server)).ainvoke("secret prompt"))
+    assert "secret prompt" in caplog.text and "Response from gemini:\ndebug answer" in caplog.text
@@ -0,0 +1,102 @@
+"""
+Load test for the async agent pipeline against a local stub model server.
+
+    python -m pytest tests/test_load.py -q     # assertions only
+    python tests/test_load.py                  # prints a throughput table
+"""
+import asyncio
+import time
+
+import pytest
+
+import conftest  # noqa: F401  (env + sys.path when run as a script)
+from app.agents import code_agent
+from app.agents.llm_gate import LLMGate, LLMQueueFullError
+from app.core.config import settings
+from app.services.data_parser import get_search_indexes
+from stub_model_server import StubChatModel, StubModelServer
+
+STUB_DELAY = 0.2
+
+
+async def _run_batch(concurrency: int, total: int, llm: StubChatModel) -> float:
+    """
+    Fires `total` questions with at most `concurrency` in flight; returns
+    requests/second. `llm`'s pooled client is closed before the loop ends.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            response = await code_agent.run_data_agent(f"How many claims mention oil leak? #{i}", "load_test")
+            assert response.error is None, response.error
+
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        return total / (time.perf_counter() - start)
+    finally:
+        await llm.aclose()
+
+
+def measure_throughput(levels=(1, 4, 8), total: int = 16) -> dict:
+    """Per concurrency level: requests/second and the most model calls the stub server saw at once."""
+    get_search_indexes()
+    results = {}
+    with StubModelServer(delay=STUB_DELAY) as server:
+        original_llm, original_gate = code_agent.llm, code_agent.llm_gate
+        original_cache_enabled = settings.CODE_CACHE_ENABLED
+        code_agent.llm_gate = LLMGate(max_concurrency=max(levels), max_queue=total, queue_timeout=30)
+        # Every level replays the same questions; measure the model path, not the code cache
+        settings.CODE_CACHE_ENABLED = False
+        try:
+            for level in levels:
+                code_agent.llm = llm = StubChatModel(server.url)
+                server.peak_in_flight = 0
+                rps = asyncio.run(_run_batch(level, total, llm))
+                results[level] = {"rps": rps, "peak_in_flight": server.peak_in_flight}
+        finally:
+            code_agent.llm, code_agent.llm_gate = original_llm, original_gate
+            settings.CODE_CACHE_ENABLED = original_cache_enabled
+    return results
+
+
+def test_throughput_scales_with_concurrent_users():
+    results = measure_throughput()
+    # A blocking pipeline would never have more than one model call open, whatever the level.
+    # Counted by the stub server, so a slow or busy machine doesn't change the outcome.
+    assert {level: r["peak_in_flight"] for level, r in results.items()} == {1: 1, 4: 4, 8: 8}
+
+
+def test_gate_rejects_when_queue_is_full():
+    async def scenario():
+        gate = LLMGate(max_concurrency=1, max_queue=1, queue_timeout=5)
+
+        async def call():
+            async with gate:
+                await asyncio.sleep(0.1)
+
+        return await asyncio.gather(*(call() for _ in range(3)), return_exceptions=True)
+
+    outcomes = asyncio.run(scenario())
+    assert sum(isinstance(o, LLMQueueFullError) for o in outcomes) == 1
+
+
+def test_gate_times_out_waiting_callers():
+    async def scenario():
+        gate = LLMGate(max_concurrency=1, max_queue=5, queue_timeout=0.05)
+
+        async def call():
+            async with gate:
+                await asyncio.sleep(0.2)
+
+        return await asyncio.gather(call(), call(), return_exceptions=True)
+
+    outcomes = asyncio.run(scenario())
+    assert isinstance(outcomes[1], LLMQueueFullError)
+
+
+if __name__ == "__main__":
+    print(f"stub model latency: {STUB_DELAY * 1000:.0f} ms")
+    for level, r in measure_throughput(levels=(1, 2, 4, 8, 16), total=32).items():
+        print(f"concurrency {level:>3d}: {r['rps']:6.2f} req/s, {r['peak_in_flight']:>3d} model calls at once")
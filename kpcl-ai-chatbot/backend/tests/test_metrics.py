@@ -0,0 +1,94 @@
+"""
+Prometheus exposition: /metrics after a real request (HELP / TYPE for every
+family, cumulative histogram buckets ending in +Inf, counters that only go
+up between scrapes) and label value escaping.
+"""
+import asyncio
+import math
+import re
+
+import httpx
+
+import conftest  # noqa: F401
+from app.core.metrics import Counter, Histogram, Registry
+from main import app
+
+_SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})? (\S+)$')
+
+
+def _parse(text: str):
+    """({family: (help, type)}, {(sample name, labels): value}); asserts every line is well formed."""
+    families, samples, current = {}, {}, None
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            name, help_text = line[7:].split(" ", 1)
+            families[name] = [help_text, None]
+            current = name
+        elif line.startswith("# TYPE "):
+            name, kind = line[7:].split(" ")
+            assert name == current and families[name][1] is None, f"TYPE without its HELP: {line}"
+            families[name][1] = kind
+        else:
+            match = _SAMPLE_RE.match(line)
+            assert match, f"malformed sample line: {line!r}"
+            name, labels, value = match.groups()
+            assert current is not None and name.startswith(current), f"{name} outside its family {current}"
+            samples[(name, labels or "")] = math.inf if value == "+Inf" else float(value)
+    return {name: tuple(entry) for name, entry in families.items()}, samples
+
+
+def _scrape_around_a_request():
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            before = await client.get("/metrics")
+            answered = await client.post("/api/v1/chat", json={"message": "Which dealer has the most complaints?", "user_id": "scraper"})
+            after = await client.get("/metrics")
+            return before, answered, after
+
+    return asyncio.run(scenario())
+
+
+def test_metrics_endpoint_after_a_request():
+    before, answered, after = _scrape_around_a_request()
+    assert answered.status_code == 200 and after.status_code == 200
+    assert after.headers["content-type"].startswith("text/plain; version=0.0.4")
+    families, samples = _parse(after.text)
+    _, earlier = _parse(before.text)
+
+    assert families["kbot_requests_total"][1] == "counter"
+    assert families["kbot_request_seconds"][1] == "histogram"
+    assert all(kind in ("counter", "histogram", "gauge") for _, kind in families.values())
+    assert samples[("kbot_requests_total", '{path="fast_path"}')] == earlier.get(("kbot_requests_total", '{path="fast_path"}'), 0) + 1
+
+    # Counters never go down between scrapes
+    for (name, labels), value in earlier.items():
+        family = next(f for f in families if name.startswith(f))
+        if families[family][1] == "counter":
+            assert samples[(name, labels)] >= value
+
+    # Histogram buckets are cumulative, end in +Inf, and +Inf equals _count
+    buckets = [(labels, value) for (name, labels), value in samples.items()
+               if name == "kbot_request_seconds_bucket" and 'path="fast_path"' in labels]
+    counts = [value for _, value in buckets]
+    assert counts == sorted(counts) and buckets[-1][0].endswith('le="+Inf"}')
+    assert counts[-1] == samples[("kbot_request_seconds_count", '{path="fast_path"}')]
+    assert samples[("kbot_request_seconds_sum", '{path="fast_path"}')] > 0
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    counter = registry.register(Counter("t_total", "Test counter.", ["who"]))
+    histogram = registry.register(Histogram("t_seconds", "Test histogram.", ["who"], buckets=(0.1, 1.0)))
+    tricky = 'a "quoted" back\\slash\nnewline'
+    counter.inc(who=tricky)
+    counter.inc(2, who=tricky)
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, who="x")
+
+    text = registry.render()
+    assert 't_total{who="a \\"quoted\\" back\\\\slash\\nnewline"} 3' in text.splitlines()
+    families, samples = _parse(text)
+    assert families == {"t_total": ("Test counter.", "counter"), "t_seconds": ("Test histogram.", "histogram")}
+    assert [samples[("t_seconds_bucket", '{who="x",le="%s"}' % le)] for le in ("0.1", "1.0", "+Inf")] == [1, 2, 3]
+    assert samples[("t_seconds_sum", '{who="x"}')] == 5.55 and samples[("t_seconds_count", '{who="x"}')] == 3
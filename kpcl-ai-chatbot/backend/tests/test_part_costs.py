@@ -0,0 +1,65 @@
+"""
+Part -> cost item resolution: matching rules on a small cost list, and
+the `df_part_cost` table generated code joins against.
+"""
+import pandas as pd
+
+import conftest  # noqa: F401
+from app.services import data_parser
+from app.services.part_costs import PartCostResolver
+
+COST = pd.DataFrame({
+    "ITEM DESCRIPTION": ["SHAFT SEAL ASSEMBLY KC/KCX", "KIT DELIVERY VALVE KC/KCX", "OIL PUMP ASSEMBLY KCX",
+                         "OIL PUMP ASSEMBLY KC", "CRANKSHAFT ASSEMBLY KCX4", "CRANKSHAFT ASSEMBLY KCX6", "CYLINDER LINER KC/KCX"],
+    "UNIT PRICE": [6137.0, 2298.0, 29614.0, 22295.0, 48396.0, 57368.0, 6408.0],
+    "GROSS VALUE": [7241.66, 2711.64, 34944.52, 26308.10, 57107.28, 67694.24, 7561.44],
+})
+
+
+def test_lookup_handles_shorthand_and_quantities():
+    resolver = PartCostResolver(COST)
+    matches = resolver.lookup("Replaced shaft seal assly & 2 Nos DV, liner1nos and gudgeon pin due to wear")
+    assert [(m["part"], m["item"], m["qty"]) for m in matches] == [
+        ("Replaced shaft seal assly", "SHAFT SEAL ASSEMBLY KC/KCX", 1),
+        ("2 Nos DV", "KIT DELIVERY VALVE KC/KCX", 2),
+        ("liner1nos", "CYLINDER LINER KC/KCX", 1),
+        ("gudgeon pin", None, 1),
+    ]
+    assert matches[0]["gross_value"] == 7241.66 and matches[0]["score"] == 1.0
+
+
+def test_model_breaks_ties_and_ambiguity_is_not_guessed():
+    resolver = PartCostResolver(COST)
+    assert resolver.lookup("Replaced crank shaft", "KCX6")[0]["item"] == "CRANKSHAFT ASSEMBLY KCX6"
+    assert resolver.lookup("KCX oil pump assly")[0]["item"] == "OIL PUMP ASSEMBLY KCX"
+    assert resolver.lookup("Oil pump assly", "KC4")[0]["item"] == "OIL PUMP ASSEMBLY KC"
+    unresolved = resolver.lookup("Replaced crankshaft", "PC2")[0]
+    assert unresolved["item"] is None
+    assert unresolved["candidates"] == ["CRANKSHAFT ASSEMBLY KCX4", "CRANKSHAFT ASSEMBLY KCX6"]
+
+
+def test_extend_only_adds_new_part_texts():
+    claims = pd.DataFrame({"Spares / Part Replaced": ["Replaced DV", "Shaft seal assly", "Replaced DV"], "Model": ["KCX4", "KC6", "KCX4"]})
+    resolver = PartCostResolver(COST, claims.iloc[:2])
+    extended = resolver.extend(claims.iloc[2:])
+    assert extended.table is resolver.table
+    extended = resolver.extend(pd.DataFrame({"Spares / Part Replaced": ["Replaced DV"], "Model": ["KCX6"]}))
+    assert len(extended.table) == len(resolver.table) + 1
+    pd.testing.assert_frame_equal(extended.table, PartCostResolver(COST, pd.concat([claims.iloc[:2], pd.DataFrame(
+        {"Spares / Part Replaced": ["Replaced DV"], "Model": ["KCX6"]})])).table)
+
+
+def test_generated_code_joins_claims_to_costs():
+    snapshot = data_parser.get_snapshot()
+    table = snapshot.part_costs.table
+    assert table["ITEM DESCRIPTION"].notna().mean() > 0.5
+    code = (
+        "seal = df[df['Spares / Part Replaced'].astype(str).str.contains('shaft seal', case=False)]\n"
+        "costs = seal.merge(df_part_cost, on=['Spares / Part Replaced', 'Model'])\n"
+        "final_answer = f\"{costs['TOTAL VALUE'].sum():.2f}|{part_cost('Replaced DV')[0]['item']}\"\n"
+    )
+    result = data_parser.execute_agent_code(code, snapshot=snapshot)
+    assert result["error"] is None
+    total, item = result["answer"].split("|")
+    assert float(total) > 0
+    assert item == "KIT DELIVERY VALVE KC/KCX"
@@ -0,0 +1,91 @@
+"""
+Prompt builder: query classification, which context sections each query
+type gets, trimming to the token budget, retry truncation and the per
+query type token accounting.
+"""
+import pytest
+
+import conftest  # noqa: F401
+from app.agents.prompt_builder import (MAX_RETRY_ERROR_CHARS, SECTION_TITLES, PromptStats, build_prompt, classify_query,
+                                       estimate_tokens)
+
+COLUMNS = ["Dealer Name", "Model", "Nature of complaint", "RunHrs."]
+
+
+def _results(rows: int = 10) -> dict:
+    return {
+        "df_columns": COLUMNS,
+        "filtered_kb": [{"Problem category": f"Oil leakage type {i}", "Probable Causes": "Worn shaft seal"} for i in range(rows)],
+        "filtered_warranty": [{"Nature of complaint": f"Oil leak at DV {i}", "Spares / Part Replaced": "Shaft seal"} for i in range(rows)],
+        "filtered_cost": [{"ITEM DESCRIPTION": f"SHAFT SEAL {i}", "UNIT PRICE": 1200, "GROSS VALUE": 1416} for i in range(rows)],
+        "resolved_costs": [],
+    }
+
+
+@pytest.mark.parametrize("question, query_type", [
+    ("Plot the cost of replaced seals per year", "cost"),     # cost wins over graph
+    ("What is the price of a shaft seal?", "cost"),
+    ("Plot complaints per year", "graph"),
+    ("Why do KCX4 compressors leak oil?", "diagnostic"),
+    ("How many claims are there for KCX4?", "analytics"),
+])
+def test_classify_query(question, query_type):
+    assert classify_query(question) == query_type
+
+
+def test_cost_sections_only_for_cost_queries():
+    cost_prompt, _, cost_type = build_prompt("What is the cost of a shaft seal?", _results(), budget=10_000)
+    graph_prompt, _, graph_type = build_prompt("Plot oil leak complaints per year", _results(), budget=10_000)
+    diagnostic_prompt, _, _ = build_prompt("Why do seals fail?", _results(), budget=10_000)
+    assert (cost_type, graph_type) == ("cost", "graph")
+    assert SECTION_TITLES["costs"] in cost_prompt and "SHAFT SEAL 3" in cost_prompt
+    assert SECTION_TITLES["costs"] not in graph_prompt and SECTION_TITLES["kb"] not in graph_prompt
+    assert SECTION_TITLES["costs"] not in diagnostic_prompt and SECTION_TITLES["kb"] in diagnostic_prompt
+
+
+def test_budget_trims_the_least_important_sections_first():
+    question = "What is the cost of a shaft seal?"
+    costs_only = {**_results(), "filtered_kb": [], "filtered_warranty": []}
+    _, costs_tokens, _ = build_prompt(question, costs_only, budget=10_000)
+    _, full_tokens, _ = build_prompt(question, _results(), budget=10_000)
+    assert full_tokens > costs_tokens
+
+    # Cost queries rank resolved > costs > claims > kb: kb goes first, then claims
+    prompt, tokens, _ = build_prompt(question, _results(), budget=costs_tokens)
+    assert tokens == costs_tokens == estimate_tokens(prompt)
+    assert SECTION_TITLES["kb"] not in prompt and SECTION_TITLES["claims"] not in prompt
+    assert all(f"SHAFT SEAL {i}" in prompt for i in range(10))
+
+    prompt, _, _ = build_prompt(question, _results(), budget=costs_tokens + 30)
+    assert SECTION_TITLES["kb"] not in prompt and "Oil leak at DV 0" in prompt and "Oil leak at DV 9" not in prompt
+
+    # Even an impossible budget keeps the question and the schema
+    prompt, tokens, _ = build_prompt(question, _results(), budget=1)
+    assert tokens > 1 and f"User Question: {question}" in prompt and ", ".join(COLUMNS) in prompt
+    assert SECTION_TITLES["costs"] not in prompt and "SHAFT SEAL 0" not in prompt
+
+
+def test_duplicate_rows_collapse_into_a_count():
+    results = {**_results(0), "filtered_warranty": [{"Nature of complaint": "Oil leak", "Spares / Part Replaced": "Seal"}] * 3}
+    prompt, _, _ = build_prompt("How many oil leaks?", results, budget=10_000)
+    assert "- Oil leak | Seal (x3)" in prompt
+
+
+def test_retry_error_and_code_are_truncated():
+    error = "KeyError: " + "x" * 5000
+    code = "final_answer = 1\n" * 500
+    prompt, _, _ = build_prompt("How many claims?", _results(0), budget=10_000, retry=(code, error))
+    error_line = next(line for line in prompt.splitlines() if line.startswith("Error: "))
+    assert len(error_line) == len("Error: ") + MAX_RETRY_ERROR_CHARS and error_line.endswith("...")
+    assert "Your previous code failed." in prompt and len(prompt) < len(code)
+
+
+def test_prompt_stats_accounting():
+    stats = PromptStats()
+    stats.record("cost", 100, attempt=0)
+    stats.record("cost", 300, attempt=1)
+    stats.record("graph", 50, attempt=0)
+    assert stats.snapshot() == {
+        "cost": {"prompts": 2, "retries": 1, "tokens": 400, "max_tokens": 300, "avg_tokens": 200.0},
+        "graph": {"prompts": 1, "retries": 0, "tokens": 50, "max_tokens": 50, "avg_tokens": 50.0},
+    }
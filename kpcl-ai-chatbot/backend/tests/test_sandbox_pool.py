@@ -0,0 +1,109 @@
+"""
+Sandbox pool: the time and memory limits, recycling, cancellation and
+crashes each replace the worker (counted by a monotonic metric), memory
+inherited from the parent doesn't count against the limit, figure
+serialization is timed without patching plotly, and code runs against the
+dataset version its request pinned, even when a reload lands in between.
+"""
+import threading
+
+import numpy as np
+
+import conftest  # noqa: F401
+from app.core.metrics import SANDBOX_RECYCLED
+from app.services import data_parser
+from app.services.sandbox_pool import SandboxPool
+from benchmark import scaled_dataset
+
+
+def _data_pool(**overrides) -> SandboxPool:
+    options = dict(runner=data_parser._sandbox_run, frames_provider=data_parser.sandbox_inputs,
+                   version_provider=data_parser.get_dataset_fingerprint, size=1, timeout=10, max_rss_mb=4096, max_tasks=100)
+    options.update(overrides)
+    return SandboxPool(**options)
+
+
+def _run(pool, code, **kwargs):
+    pids = {w.process.pid for w in pool._workers}
+    result = pool.execute(code, **kwargs)
+    return result, {w.process.pid for w in pool._workers} != pids
+
+
+def test_timeout_crash_and_cancel_replace_the_worker():
+    recycled_before = SANDBOX_RECYCLED._values.get((), 0)
+    pool = _data_pool(timeout=0.5)
+    pool.start()
+    try:
+        result, replaced = _run(pool, "import time\ntime.sleep(5)")
+        assert result["error"].startswith("Execution timed out after 0.5s") and replaced
+        result, replaced = _run(pool, "import os\nos._exit(3)")
+        assert result["error"] == "Sandbox worker crashed while executing the code." and replaced
+
+        cancel = threading.Event()
+        threading.Timer(0.1, cancel.set).start()
+        result, replaced = _run(pool, "import time\ntime.sleep(0.4)", cancel_event=cancel)
+        assert result["error"] == "Execution cancelled." and replaced
+        # The replacement serves the next request normally
+        assert pool.execute("final_answer = 'ok'")["answer"] == "ok"
+        assert pool.stats() == {"workers": 1, "idle": 1, "recycled": 3}
+        assert SANDBOX_RECYCLED.kind == "counter" and SANDBOX_RECYCLED._values[()] == recycled_before + 3
+    finally:
+        pool.shutdown()
+
+
+def test_workers_are_recycled_after_max_tasks():
+    pool = _data_pool(max_tasks=2)
+    pool.start()
+    try:
+        replaced = [_run(pool, "final_answer = 'ok'")[1] for _ in range(5)]
+        assert replaced == [False, False, True, False, True]
+    finally:
+        pool.shutdown()
+
+
+def test_memory_limit_counts_only_what_the_worker_allocates():
+    # The parent holds 300 MB before forking: every worker inherits it, shared copy-on-write
+    inherited = np.ones(300 * 2**20 // 8)
+    pool = _data_pool(max_rss_mb=150)
+    pool.start()
+    try:
+        # Long enough for the limit to be checked while it runs
+        result, replaced = _run(pool, "import time\ntime.sleep(0.3)\nfinal_answer = str(len(df))")
+        assert result["error"] is None and not replaced
+        result, replaced = _run(pool, "import numpy as np\nimport time\nx = np.ones(300 * 2**20 // 8)\ntime.sleep(3)")
+        assert "150 MB memory limit" in result["error"] and replaced
+    finally:
+        pool.shutdown()
+        del inherited
+
+
+def test_figure_serialization_is_timed_per_run():
+    from plotly.basedatatypes import BaseFigure
+    to_json = BaseFigure.to_json
+    code = "fig = px.bar(x=list(range(2000)), y=list(range(2000)))\ngraph_json = fig.to_json()\nfinal_answer = 'chart'"
+    result = data_parser._sandbox_run(code, *data_parser.sandbox_inputs())
+    assert result["error"] is None and result["graph_json"].startswith("{")
+    assert result["timings"]["to_json"] > 0
+    assert data_parser._sandbox_run("final_answer = 'x'", *data_parser.sandbox_inputs())["timings"]["to_json"] == 0
+    assert BaseFigure.to_json is to_json
+
+
+def test_requests_keep_their_pinned_dataset_version():
+    pool = _data_pool()
+    pool.start()
+    original_pool, data_parser.global_sandbox_pool = data_parser.global_sandbox_pool, pool
+    code = "final_answer = str(len(df))"
+    try:
+        pinned = data_parser.get_snapshot()
+        with scaled_dataset(2) as scaled:
+            live = data_parser.get_snapshot()
+            # The workers re-fork for the live version; the pinned request runs on its own frames
+            assert data_parser.execute_agent_code(code, snapshot=live)["answer"] == str(scaled["rows"])
+            stale = data_parser.execute_agent_code(code, snapshot=pinned)
+            assert stale["answer"] == str(len(pinned.df)) and "ipc" not in stale["timings"]
+            assert pool.execute(code, version=pinned.fingerprint) is None
+        assert pool.stats()["recycled"] == 1
+        assert "ipc" in data_parser.execute_agent_code(code, snapshot=pinned)["timings"]
+    finally:
+        data_parser.global_sandbox_pool = original_pool
+        pool.shutdown()
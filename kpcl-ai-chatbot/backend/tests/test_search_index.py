@@ -0,0 +1,67 @@
+"""
+Search index: which cells a keyword matches (joined words, plurals),
+keyword extraction, IDF ranking with its tie-break, and extending an index
+matching a full rebuild.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import conftest  # noqa: F401
+from app.services.search_index import TextIndex, extract_keywords, rank_rows
+
+CELLS = pd.Series([
+    "Oil leakage from shaft seal",      # 0
+    "oilleakage observed",              # 1
+    "Oil-Leak at DV",                   # 2
+    "Seals worn out",                   # 3
+    "High vibration",                   # 4
+    None,                               # 5
+    "vibration and oil leak",           # 6
+    "Crankshaft seized",                # 7
+])
+
+
+@pytest.mark.parametrize("keyword, rows", [
+    ("oilleakage", [0, 1]),         # "oil leakage" is also indexed as the joined word
+    ("leak", [0, 1, 2, 6]),         # substring: leak, leakage, oilleakage
+    ("oil", [0, 1, 2, 6]),
+    ("seal", [0, 3]),
+    ("seals", [0, 3]),              # plural keyword, singular cell
+    ("crankshafts", [7]),
+    ("gearbox", []),
+])
+def test_keyword_matches(keyword, rows):
+    assert TextIndex(CELLS).lookup(keyword).tolist() == rows
+
+
+def test_keywords_drop_stop_words_short_tokens_and_repeats():
+    assert extract_keywords("How many issues are related to the Oil-Leak in 2024, oil leak?") == ["oil", "leak", "2024"]
+    assert extract_keywords("Show the total cost of all problems") == []
+
+
+def test_rarer_keywords_rank_higher_and_ties_keep_a_stable_order():
+    index = TextIndex(CELLS)
+    # Rows 4 and 6 match "vibration", rows 0/1/2/6 "oil": 6 matches both, then the rarer keyword wins
+    assert rank_rows([(index, 1.0)], ["oil", "vibration"], limit=8).tolist() == [6, 4, 0, 1, 2]
+    # Equal scores: original order, or newest first when asked
+    assert rank_rows([(index, 1.0)], ["oil"], limit=3).tolist() == [0, 1, 2]
+    assert rank_rows([(index, 1.0)], ["oil"], limit=3, prefer_recent=True).tolist() == [6, 2, 1]
+    # A second index only adds its weight to the rows it matches
+    parts = TextIndex(pd.Series(["", "", "oil seal", "", "", "", "", ""]))
+    assert rank_rows([(index, 1.0), (parts, 0.25)], ["oil"], limit=1).tolist() == [2]
+    assert rank_rows([(index, 1.0)], ["gearbox"], limit=3).tolist() == []
+
+
+def test_extend_matches_a_full_rebuild():
+    grown = TextIndex(CELLS[:5])
+    snapshot = grown.copy()
+    grown.extend(CELLS[5:])
+    full = TextIndex(CELLS)
+    assert grown.size == full.size == len(CELLS)
+    for keyword in ("oil", "leak", "vibration", "seals", "oilleak", "seized"):
+        assert grown.lookup(keyword).tolist() == full.lookup(keyword).tolist()
+        for a, b in zip(grown.score([keyword, "oil"]), full.score([keyword, "oil"])):
+            np.testing.assert_allclose(a, b)
+    # The copy taken before extending still answers for the first rows only
+    assert snapshot.lookup("oil").tolist() == [0, 1, 2] and snapshot.size == 5
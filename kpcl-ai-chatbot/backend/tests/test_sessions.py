@@ -0,0 +1,161 @@
+"""
+Session working sets: store bounds and isolation, follow-up detection, a
+follow-up that refines the previous answer's rows through `df_prev`, and
+requests without a session id never sharing one.
+"""
+import asyncio
+import time
+
+import httpx
+import numpy as np
+
+import conftest  # noqa: F401
+from app.agents import code_agent
+from app.agents.intent_router import is_follow_up, new_entities
+from app.agents.llm_gate import LLMGate
+from app.agents.prompt_builder import build_prompt
+from app.services import data_parser
+from app.services.session_store import SessionState, SessionStore
+from main import app
+from stub_model_server import StubChatModel, StubModelServer
+
+
+def _state(question="q", rows=None, fingerprint="v1"):
+    return SessionState([question], "final_answer = 1", "1", {"filtered_kb": []}, rows, fingerprint)
+
+
+def test_store_is_bounded_and_isolated_per_user():
+    store = SessionStore(max_sessions=2, max_bytes=10_000, idle_seconds=60)
+    store.put("alice", "s1", _state("a"))
+    store.put("bob", "s1", _state("b"))
+    assert store.get("bob", "s1").questions == ["b"] and store.get("alice", "s1").questions == ["a"]
+    assert store.get("carol", "s1") is None
+    # alice was used last, so bob is the least recently used session
+    store.put("alice", "s2", _state("c"))
+    assert store.get("bob", "s1") is None and store.stats()["evictions"] == 1
+    assert store.get("alice", "s1", fingerprint="v2") is None
+
+    store = SessionStore(max_sessions=10, max_bytes=5000, idle_seconds=60)
+    store.put("alice", "big", _state(rows=np.arange(1240, dtype=np.int32)))
+    store.put("alice", "small", _state())
+    assert store.get("alice", "big") is None and store.stats()["bytes"] <= 5000
+
+    store = SessionStore(max_sessions=10, max_bytes=10_000, idle_seconds=0.01)
+    store.put("alice", "s1", _state())
+    time.sleep(0.02)
+    assert store.get("alice", "s1") is None
+
+
+def test_follow_up_detection():
+    for question in ["now only for 2024", "plot that by dealer", "What about KCX6?", "and for Trade Links", "show those as a pie chart",
+                     "and top 5 dealers", "How many of those are still open?", "break it down by year"]:
+        assert is_follow_up(question), question
+    # Questions with a subject of their own are new, whatever word they start with
+    for question in ["How many warranty claims are there?", "Which dealer has the most complaints?", "",
+                     "In 2024 which dealer had the most claims?", "For KCX4 what is the most common complaint?",
+                     "Which dealer handles it?", "How many claims mention oil leakage that were closed?"]:
+        assert not is_follow_up(question), question
+
+
+def test_follow_ups_naming_something_new_get_fresh_context():
+    earlier = ["Which dealer has the most oil leakage claims?"]
+    assert new_entities("What about KCX6?", earlier) == ["kcx6"]
+    assert new_entities("and for Trade Links in 2024", earlier) == ["trade", "links"]
+    assert new_entities("plot that by dealer as a pie chart", earlier) == []
+    assert new_entities("now only the oil leakage ones with run hours logged", earlier) == []
+
+    search_results = {"filtered_warranty": [{"Nature of complaint": "Oil leakage from valve"}], "df_columns": ["Model"]}
+    follow_up = {"questions": earlier, "code": "final_answer = 1", "rows": 10}
+    stale, _, _ = build_prompt("What about KCX6?", search_results, 4000, follow_up=follow_up)
+    fresh, _, _ = build_prompt("What about KCX6?", search_results, 4000, follow_up={**follow_up, "fresh_context": True})
+    assert "Oil leakage from valve" not in stale and "Oil leakage from valve" in fresh
+
+
+def test_working_rows_only_follow_frames_that_still_point_at_df():
+    snapshot = data_parser.get_snapshot()
+    seals = np.flatnonzero(snapshot.df['Spares / Part Replaced'].astype(str).str.contains('shaft seal', case=False))
+    filtered = "seal = df[df['Spares / Part Replaced'].astype(str).str.contains('shaft seal', case=False)]\n"
+    run = lambda code: data_parser._sandbox_run(filtered + code + "\nfinal_answer = 'ok'", *data_parser.sandbox_inputs(snapshot))
+    # A merge (or reset_index) renumbers the rows 0..n-1: those labels are not rows of df
+    costed = run("costed = seal.merge(df_part_cost, on=['Spares / Part Replaced', 'Model'], how='left')")
+    assert np.array_equal(costed["working_rows"], seals)
+    assert run("seal = seal.reset_index(drop=True)")["working_rows"] is None
+    # Relabelled rows whose values no longer match df are rejected as well
+    assert run("seal = seal.set_axis(seal.index[::-1])")["working_rows"] is None
+    # Cleaning one column in place still leaves a traceable working set
+    cleaned = run("seal = seal.assign(**{'RunHrs.': seal['RunHrs.'].fillna(0)})")
+    assert np.array_equal(cleaned["working_rows"], seals)
+
+
+class RecordingServer(StubModelServer):
+    def respond(self, prompt: str) -> str:
+        self.prompts.append(prompt)
+        return self.code
+
+
+def test_follow_up_refines_the_previous_rows():
+    first = "```python\nkcx4 = df[df['Model'] == 'KCX4']\nfinal_answer = f\"{len(kcx4)} claims\"\n```"
+    follow = "```python\nfinal_answer = f\"{len(df_prev[df_prev['RunHrs.'] > 0])} of {len(df_prev)}\"\n```"
+    original_llm, original_gate = code_agent.llm, code_agent.llm_gate
+    code_agent.llm_gate = LLMGate(max_concurrency=1, max_queue=1, queue_timeout=30)
+    ask = lambda question, user: asyncio.run(code_agent.run_data_agent(question, user, session_id="tab-1"))
+    try:
+        with RecordingServer(delay=0.01, code=first) as server:
+            server.prompts = []
+            code_agent.llm = StubChatModel(server.url)
+            assert ask("How many claims are there for model KCX4 compressors?", "alice").answer == "634 claims"
+            server.code = follow
+            refined = ask("now only the ones with run hours logged", "alice")
+            # Same session id, different user: no working set to build on
+            stranger = ask("now only the ones with run hours logged", "bob")
+    finally:
+        code_agent.llm, code_agent.llm_gate = original_llm, original_gate
+        code_agent.session_store.clear("alice", "tab-1")
+    assert refined.error is None and refined.answer.endswith(" of 634")
+    assert "THIS IS A FOLLOW-UP" in server.prompts[1] and "kcx4 = df[df['Model'] == 'KCX4']" in server.prompts[1]
+    assert "Related Warranty Claims" not in server.prompts[1]
+    assert len(server.prompts[1]) < len(server.prompts[0])
+    assert "THIS IS A FOLLOW-UP" not in server.prompts[2] and stranger.error is not None
+
+
+def test_follow_ups_skip_the_fast_path_and_the_code_cache():
+    first = "```python\nkcx4 = df[df['Model'] == 'KCX4']\nfinal_answer = f\"{len(kcx4)} claims\"\n```"
+    follow = "```python\nfinal_answer = ', '.join(df_prev['Dealer Name'].value_counts().head(5).index.astype(str)) + f' ({len(df_prev)} rows)'\n```"
+    original_llm, original_gate = code_agent.llm, code_agent.llm_gate
+    code_agent.llm_gate = LLMGate(max_concurrency=1, max_queue=1, queue_timeout=30)
+    ask = lambda question: asyncio.run(code_agent.run_data_agent(question, "carol", include_timings=True, session_id="tab-2"))
+    try:
+        with RecordingServer(delay=0.01, code=first) as server:
+            server.prompts = []
+            code_agent.llm = StubChatModel(server.url)
+            ask("How many claims are there for model KCX4 compressors?")
+            server.code = follow
+            # "top 5 dealers" alone is a cube question; after KCX4 it must rank the KCX4 claims only
+            top = ask("and top 5 dealers")
+            renamed = ask("what about the Trade Links ones?")
+    finally:
+        code_agent.llm, code_agent.llm_gate = original_llm, original_gate
+        code_agent.session_store.clear("carol", "tab-2")
+    assert top.timings["path"] == "llm" and top.timings["session"] == "follow_up"
+    assert "fast_path" not in {span["stage"] for span in top.timings["spans"]} and "cache" not in top.timings
+    assert top.answer.endswith("(634 rows)")
+    # Naming something the earlier questions didn't brings back retrieved claims
+    assert renamed.timings["follow_up_terms"] == ["trade", "links"]
+    assert "retrieval" in {span["stage"] for span in renamed.timings["spans"]}
+
+
+def test_requests_without_a_session_id_stand_alone():
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            answered = await client.post("/api/v1/chat", json={"message": "Which dealer has the most complaints?", "user_id": "dave"})
+            kept = await client.post("/api/v1/chat", json={"message": "Which dealer has the most complaints?", "user_id": "dave", "session_id": "tab-9"})
+            missing_id = await client.delete("/api/v1/chat/session", params={"user_id": "dave"})
+            cleared = await client.delete("/api/v1/chat/session", params={"user_id": "dave", "session_id": "tab-9"})
+            return answered, kept, missing_id, cleared
+
+    answered, kept, missing_id, cleared = asyncio.run(scenario())
+    assert answered.status_code == kept.status_code == 200 and answered.json()["answer"] == kept.json()["answer"]
+    # Only the request that named its conversation left a working set behind
+    assert [key for key in code_agent.session_store._sessions if key[0] == "dave"] == []
+    assert missing_id.status_code == 422 and cleared.json() == {"cleared": True}
@@ -0,0 +1,104 @@
+"""
+Columnar snapshots of the cleaned datasets: when the key changes, that a
+snapshot reads back as the frame that was written, that an unreadable one
+falls back to parsing the source, and the deploy-time `--check` CLI.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import conftest  # noqa: F401
+from app.core.config import settings
+from app.services import snapshot_cache
+from app.services.snapshot_cache import load_dataset, read_snapshot, snapshot_key, snapshot_path, write_snapshot
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "snapshots"
+    monkeypatch.setattr(settings, "SNAPSHOT_DIR", str(directory))
+    return directory
+
+
+def _source(tmp_path, text="Dealer,RunHrs.\nTrade Links,10.5\nKalp Marketing,\n"):
+    path = tmp_path / "claims.csv"
+    path.write_text(text)
+    return str(path)
+
+
+class _CountingLoader:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, path):
+        self.calls += 1
+        return pd.read_csv(path)
+
+
+def test_key_follows_mtime_size_and_cleaning_version(tmp_path):
+    path = _source(tmp_path)
+    key = snapshot_key(path, cleaning_version=1)
+    assert snapshot_key(path, cleaning_version=1) == key
+    assert snapshot_key(path, cleaning_version=2) != key
+
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    touched = snapshot_key(path, cleaning_version=1)
+    assert touched != key
+
+    with open(path, "a") as f:
+        f.write("Apex,3\n")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))  # same mtime, bigger file
+    assert snapshot_key(path, cleaning_version=1) not in (key, touched)
+
+
+def test_round_trip_keeps_dtypes_and_nan_in_object_columns(snapshot_dir):
+    df = pd.DataFrame({
+        "Dealer Name": ["Trade Links", np.nan, "Kalp Marketing"],
+        "Remarks": [np.nan, "seized", "oil leak"],       # blanks in a text column are NaN, as read_excel leaves them
+        "Complaint Date": pd.to_datetime(["2024-01-05", None, "2023-11-30"]),
+        "RunHrs.": [1234.7, np.nan, 0.5],
+        "FSR No": [1, 2, 3],
+    })
+    path = write_snapshot("warranty", "k1", df)
+    restored = read_snapshot(path)
+    pd.testing.assert_frame_equal(restored, df)
+    # Arrow hands back None for nulls; the cleaning code expects NaN like read_excel gives it
+    assert all(isinstance(restored[col].iloc[i], float) for col, i in (("Dealer Name", 1), ("Remarks", 0)))
+
+    # A newer snapshot of the same dataset replaces the older file
+    write_snapshot("warranty", "k2", df)
+    assert sorted(os.listdir(snapshot_dir)) == ["warranty-k2.arrow"]
+
+
+@pytest.mark.parametrize("damage", ["corrupt", "truncated"])
+def test_unreadable_snapshots_fall_back_to_the_source(tmp_path, snapshot_dir, damage):
+    path = _source(tmp_path)
+    loader = _CountingLoader()
+    expected = load_dataset("claims", path, loader, cleaning_version=1)
+    assert loader.calls == 1
+    pd.testing.assert_frame_equal(load_dataset("claims", path, loader, cleaning_version=1), expected)
+    assert loader.calls == 1  # served from the snapshot
+
+    snapshot = snapshot_path("claims", snapshot_key(path, 1))
+    if damage == "corrupt":
+        with open(snapshot, "wb") as f:
+            f.write(b"not an arrow file")
+    else:
+        with open(snapshot, "r+b") as f:
+            f.truncate(os.path.getsize(snapshot) // 2)
+
+    pd.testing.assert_frame_equal(load_dataset("claims", path, loader, cleaning_version=1), expected)
+    assert loader.calls == 2
+    # ...and the snapshot was rewritten, so the next load is fast again
+    pd.testing.assert_frame_equal(read_snapshot(snapshot), expected)
+
+
+def test_check_cli_exit_code(snapshot_dir, capsys):
+    assert snapshot_cache.main(["--check"]) == 1
+    assert "STALE" in capsys.readouterr().out
+    assert snapshot_cache.main([]) == 0
+    assert snapshot_cache.main(["--check"]) == 0
+    assert "STALE" not in capsys.readouterr().out
@@ -0,0 +1,62 @@
+"""
+Streamed agent pipeline: every answered question goes through the same
+retrieval -> code -> execution -> result events (code cache hits too), a
+cancelled request never starts an in-process execution, and a pipeline
+error is recorded as a failure, not as a client that went away.
+"""
+import asyncio
+import threading
+
+import pytest
+
+import conftest  # noqa: F401
+from app.agents import code_agent
+from app.agents.llm_gate import LLMGate
+from app.core.metrics import REQUESTS
+from app.services import data_parser
+from app.services.code_cache import CodeCache
+from stub_model_server import StubChatModel, StubModelServer
+
+
+def test_cache_hits_stream_the_same_stages():
+    async def events(question):
+        return [event async for event, _ in code_agent.stream_data_agent(question, "streamer")]
+
+    question = "How many claims mention a cracked cylinder head?"
+    original = code_agent.llm, code_agent.llm_gate, code_agent.code_cache
+    code_agent.llm_gate = LLMGate(max_concurrency=1, max_queue=1, queue_timeout=30)
+    code_agent.code_cache = CodeCache("", max_entries=10, ttl_seconds=60)
+    try:
+        with StubModelServer(delay=0.01) as server:
+            code_agent.llm = StubChatModel(server.url)
+            fresh = asyncio.run(events(question))
+            cached = asyncio.run(events(question))
+    finally:
+        code_agent.llm, code_agent.llm_gate, code_agent.code_cache = original
+    assert server.requests == 1
+    assert fresh == cached == ["retrieval", "code", "execution", "result"]
+
+
+def test_cancelled_requests_do_not_start_in_process_executions():
+    cancel = threading.Event()
+    cancel.set()
+    original_pool, data_parser.global_sandbox_pool = data_parser.global_sandbox_pool, None
+    try:
+        result = data_parser.execute_agent_code("import time\ntime.sleep(5)\nfinal_answer = 'late'", cancel_event=cancel)
+    finally:
+        data_parser.global_sandbox_pool = original_pool
+    assert result["error"] == "Execution cancelled." and "answer" not in result
+
+
+def test_pipeline_errors_are_failures_not_disconnects(monkeypatch):
+    def broken_snapshot():
+        raise RuntimeError("dataset unreadable")
+
+    audited = []
+    monkeypatch.setattr(code_agent, "get_snapshot", broken_snapshot)
+    monkeypatch.setattr(code_agent.audit_log, "record", audited.append)
+    failed, cancelled = REQUESTS._values.get(("failed",), 0), REQUESTS._values.get(("cancelled",), 0)
+    with pytest.raises(RuntimeError):
+        asyncio.run(code_agent.run_data_agent("How many claims mention a cracked cylinder head?", "streamer"))
+    assert REQUESTS._values[("failed",)] == failed + 1 and REQUESTS._values.get(("cancelled",), 0) == cancelled
+    assert audited[-1]["outcome"] == "failed" and audited[-1]["error"] == "RuntimeError: dataset unreadable"
@@ -1,8 +1,11 @@
-import React, { useState } from 'react';
-import { ChevronLeft, Send, Power } from 'lucide-react';
+import React, { useState, useRef } from 'react';
+import { ChevronLeft, Send, Power, Square } from 'lucide-react';
 import Plot from 'react-plotly.js';
 import ReactMarkdown from 'react-markdown'; 
 import remarkGfm from 'remark-gfm'; 
+import { newSessionId, resetChatSession, streamChatMessage } from './services/api';
+
+const USER_ID = 'admin';
 
 function App() {
   // Helper to get current time in 10:39 AM format
@@ -28,12 +31,19 @@ function App() {
   const [messages, setMessages] = useState([initialBotMessage]);
   const [input, setInput] = useState('');
   const [isLoading, setIsLoading] = useState(false);
+  const [status, setStatus] = useState('');
+  const abortRef = useRef(null);
+  // 💬 This conversation's id: follow-ups refine its own previous answer, never another tab's
+  const sessionIdRef = useRef(newSessionId());
 
   // 🧹 Function to clear the chat history (Power Button)
   const handleClearChat = () => {
     if (window.confirm("Are you sure you want to clear the chat history?")) {
       setMessages([{ ...initialBotMessage, time: getCurrentTime() }]);
       setInput(''); // Clear input box too
+      // Start a new conversation, and drop the old one's working set on the server
+      resetChatSession(sessionIdRef.current, USER_ID).catch(() => {});
+      sessionIdRef.current = newSessionId();
     }
   };
 
@@ -53,32 +63,43 @@ function App() {
     }
     
     setIsLoading(true);
+    setStatus('Searching the warranty data...');
+    const controller = new AbortController();
+    abortRef.current = controller;
+
+    // 🚀 Streamed pipeline: show each stage while it runs, render the answer and chart as they arrive
+    const botId = `bot-${Date.now()}`;
+    const upsertBot = (patch) => setMessages(prev => (
+      prev.some(m => m.id === botId)
+        ? prev.map(m => (m.id === botId ? { ...m, ...patch } : m))
+        : [...prev, { id: botId, role: 'bot', text: '', time: getCurrentTime(), ...patch }]
+    ));
 
     try {
-      // 🚀 DYNAMIC API URL: Uses Railway URL if deployed, or local server if testing on your PC
-      const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://127.0.0.1:8000';
-      
-      const response = await fetch(`${API_BASE_URL}/api/v1/chat`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ message: textToSend, user_id: "admin" })
-      });
-      
-      const data = await response.json();
-      
-      setMessages(prev => [...prev, {
-        role: 'bot',
-        text: data.answer,
-        graph_json: data.graph_json, 
-        time: getCurrentTime()
-      }]);
+      await streamChatMessage(textToSend, USER_ID, sessionIdRef.current, {
+        retrieval: () => setStatus('Writing the analysis...'),
+        code: (data) => setStatus(data.source === 'cache' ? 'Re-running a saved analysis...' : `Running the analysis (attempt ${data.attempt})...`),
+        execution: (data) => data.status === 'error' && setStatus('Fixing the analysis and retrying...'),
+        answer: (data) => { upsertBot({ text: data.answer }); setStatus('Finishing up...'); },
+        graph: (data) => upsertBot({ graph_json: data.graph_json }),
+        error: (data) => upsertBot({ text: data.detail || 'Something went wrong. Please try again.' }),
+      }, controller.signal);
     } catch (error) {
-      setMessages(prev => [...prev, { role: 'bot', text: 'Connection to backend failed. Please ensure your Python server is running.', time: getCurrentTime() }]);
+      if (error.name === 'AbortError') {
+        upsertBot({ text: 'Request cancelled.' });
+      } else {
+        setMessages(prev => [...prev, { role: 'bot', text: 'Connection to backend failed. Please ensure your Python server is running.', time: getCurrentTime() }]);
+      }
     } finally {
+      abortRef.current = null;
+      setStatus('');
       setIsLoading(false);
     }
   };
 
+  // 🛑 Cancels the in-flight request (the server aborts the model call and the sandbox run)
+  const cancelMessage = () => abortRef.current?.abort();
+
   // Helper to ensure hidden newlines from Python are handled
   const cleanText = (text) => text ? text.replace(/\\n/g, '\n') : '';
 
@@ -204,6 +225,7 @@ function App() {
                    <div className="w-2 h-2 bg-gray-400 rounded-full animate-bounce" style={{ animationDelay: '0ms' }}></div>
                    <div className="w-2 h-2 bg-gray-400 rounded-full animate-bounce" style={{ animationDelay: '150ms' }}></div>
                    <div className="w-2 h-2 bg-gray-400 rounded-full animate-bounce" style={{ animationDelay: '300ms' }}></div>
+                   {status && <span className="ml-2 text-[13px]">{status}</span>}
                  </div>
                </div>
             </div>
@@ -233,13 +255,23 @@ function App() {
               placeholder="Choose an option or type your question..."
               disabled={isLoading}
             />
-            <button 
-              onClick={() => sendMessage()}
-              disabled={isLoading || !input.trim()}
-              className="p-3 text-[#149486] hover:bg-teal-50 rounded-full transition-colors disabled:opacity-50"
-            >
-              <Send size={22} />
-            </button>
+            {isLoading ? (
+              <button 
+                onClick={cancelMessage}
+                title="Stop"
+                className="p-3 text-orange-400 hover:bg-orange-50 rounded-full transition-colors"
+              >
+                <Square size={22} />
+              </button>
+            ) : (
+              <button 
+                onClick={() => sendMessage()}
+                disabled={!input.trim()}
+                className="p-3 text-[#149486] hover:bg-teal-50 rounded-full transition-colors disabled:opacity-50"
+              >
+                <Send size={22} />
+              </button>
+            )}
           </div>
         </div>
 
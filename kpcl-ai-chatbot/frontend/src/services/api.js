@@ -16,4 +16,59 @@ export const sendChatMessage = async (message, userId = 'local_user') => {
         console.error("API Error:", error);
         throw new Error(error.response?.data?.detail || "Failed to connect to the server.");
     }
-};
\ No newline at end of file
+};
+
+// 🚀 DYNAMIC API URL: Uses Railway URL if deployed, or local server if testing on your PC
+const STREAM_BASE_URL = import.meta.env.VITE_API_URL || 'http://127.0.0.1:8000';
+
+// 💬 One id per conversation: follow-up questions ("now only for 2024") build on that conversation's answers only
+export const newSessionId = () => (
+    globalThis.crypto?.randomUUID?.() || `session-${Date.now()}-${Math.random().toString(36).slice(2)}`
+);
+
+// 🧹 Forgets a conversation's working set on the server
+export const resetChatSession = async (sessionId, userId = 'local_user') => {
+    const params = new URLSearchParams({ session_id: sessionId, user_id: userId });
+    await fetch(`${STREAM_BASE_URL}/api/v1/chat/session?${params}`, { method: 'DELETE' });
+};
+
+// 🚀 Streams /chat/stream (Server-Sent Events over a POST body).
+// `handlers` maps event names (retrieval, code, execution, answer, graph, error, done)
+// to callbacks. Pass an AbortSignal to cancel; the server then aborts the model call too.
+export const streamChatMessage = async (message, userId = 'local_user', sessionId = null, handlers = {}, signal) => {
+    const response = await fetch(`${STREAM_BASE_URL}/api/v1/chat/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+        body: JSON.stringify({ message: message, user_id: userId, session_id: sessionId }),
+        signal,
+    });
+    if (!response.ok || !response.body) {
+        throw new Error(`Failed to connect to the server (${response.status}).`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    const dispatch = (block) => {
+        let event = 'message';
+        const dataLines = [];
+        for (const line of block.split('\n')) {
+            if (line.startsWith('event:')) event = line.slice(6).trim();
+            else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+        }
+        if (!dataLines.length) return;
+        handlers[event]?.(JSON.parse(dataLines.join('\n')));
+    };
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            dispatch(buffer.slice(0, boundary));
+            buffer = buffer.slice(boundary + 2);
+        }
+    }
+};